@@ -0,0 +1,543 @@
+#!/usr/bin/env python3
+"""
+Verificación de LISTAS DE PRECIOS sincronizadas
+Odoo 16 (VPS) vs Odoo 18 (Local)
+
+Evalúa localmente las reglas de precios (product.pricelist.item) de ambas
+instancias para todo el catálogo y reporta los productos cuyo precio
+calculado difiere entre Odoo 16 y Odoo 18, sin llamar al cálculo de
+precios de Odoo producto por producto.
+
+Soporta applied_on (global/categoría/plantilla/variante), base (precio de
+venta, costo u otra lista), compute_price (fijo/porcentaje/fórmula),
+descuentos, recargos, redondeo, márgenes mínimo/máximo, rango de fechas y
+cantidad mínima. No convierte monedas: asume que lista y producto usan la
+misma moneda.
+
+Requiere NumPy (pip install numpy).
+
+Uso:
+    python3 check_pricelists.py
+"""
+
+import xmlrpc.client
+import logging
+import csv
+from datetime import datetime
+from typing import Dict, List, Tuple
+import sys
+import os
+
+# Agregar directorio actual al path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# Importar configuración
+try:
+    from config import ODOO_16, ODOO_18, SYNC_OPTIONS
+except ImportError as e:
+    print("❌ Error: No se encontró el archivo config.py")
+    print(f"Directorio actual: {os.getcwd()}")
+    print(f"Script ubicado en: {os.path.dirname(os.path.abspath(__file__))}")
+    print(f"Error técnico: {e}")
+    print("\nVerifica que config.py existe en el mismo directorio que este script")
+    sys.exit(1)
+
+try:
+    import numpy as np
+except ImportError:
+    print("❌ Error: Este script requiere NumPy")
+    print("\nInstálalo con: pip install numpy")
+    sys.exit(1)
+
+# Configuración de logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.FileHandler('check_pricelists.log'),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger(__name__)
+
+
+class OdooConnection:
+    """Maneja la conexión a una instancia de Odoo"""
+
+    def __init__(self, config: Dict, name: str):
+        self.config = config
+        self.name = name
+        self.uid = None
+        self.models = None
+        self.connect()
+
+    def connect(self):
+        """Establece la conexión con Odoo"""
+        try:
+            logger.info(f"Conectando a {self.name} ({self.config['url']})...")
+
+            common = xmlrpc.client.ServerProxy(
+                f"{self.config['url']}/xmlrpc/2/common"
+            )
+
+            self.uid = common.authenticate(
+                self.config['db'],
+                self.config['username'],
+                self.config['password'],
+                {}
+            )
+
+            if not self.uid:
+                raise Exception(f"Autenticación fallida en {self.name}")
+
+            self.models = xmlrpc.client.ServerProxy(
+                f"{self.config['url']}/xmlrpc/2/object"
+            )
+
+            # Verificar versión
+            version = common.version()
+            logger.info(f"✓ Conectado a {self.name} - Versión: {version['server_version']}")
+
+        except Exception as e:
+            logger.error(f"❌ Error conectando a {self.name}: {e}")
+            raise
+
+    def execute(self, model: str, method: str, *args, **kwargs):
+        """Ejecuta un método en Odoo"""
+        return self.models.execute_kw(
+            self.config['db'],
+            self.uid,
+            self.config['password'],
+            model,
+            method,
+            args,
+            kwargs
+        )
+
+    def search_read(self, model: str, domain: List, fields: List, offset: int = 0, limit: int = 0) -> List[Dict]:
+        """Busca y lee registros"""
+        kwargs = {'fields': fields, 'order': 'id'}
+        if offset > 0:
+            kwargs['offset'] = offset
+        if limit > 0:
+            kwargs['limit'] = limit
+
+        try:
+            return self.models.execute_kw(
+                self.config['db'],
+                self.uid,
+                self.config['password'],
+                model,
+                'search_read',
+                [domain],
+                kwargs
+            )
+        except Exception as e:
+            logger.error(f"Error en search_read - Model: {model}, Fields: {fields}")
+            logger.error(f"Domain: {domain}")
+            raise
+
+    def search_read_all(self, model: str, domain: List, fields: List, batch_size: int = 5000) -> List[Dict]:
+        """Lee todos los registros de un dominio en páginas"""
+        records = []
+        offset = 0
+
+        while True:
+            page = self.search_read(model, domain, fields, offset=offset, limit=batch_size)
+            records.extend(page)
+            if len(page) < batch_size:
+                return records
+            offset += batch_size
+
+
+# Códigos numéricos para evaluar reglas en forma vectorizada
+APPLIED_ON_TIER = {'0_product_variant': 0, '1_product': 1, '2_product_category': 2, '3_global': 3}
+COMPUTE_CODE = {'fixed': 0, 'percentage': 1, 'formula': 2}
+BASE_CODE = {'list_price': 0, 'standard_price': 1, 'pricelist': 2}
+
+
+def m2o_id(value) -> int:
+    """Devuelve el ID de un many2one leído por XML-RPC (0 si está vacío)"""
+    return value[0] if value else 0
+
+
+class PricelistEngine:
+    """
+    Motor local de evaluación de listas de precios de una instancia
+
+    Carga productos, categorías y reglas una sola vez e indexa las reglas
+    por variante, plantilla y categoría para calcular el precio de todo el
+    catálogo con operaciones vectorizadas de NumPy.
+    """
+
+    rule_fields = [
+        'id', 'pricelist_id', 'applied_on', 'product_id', 'product_tmpl_id',
+        'categ_id', 'min_quantity', 'date_start', 'date_end', 'base',
+        'base_pricelist_id', 'compute_price', 'fixed_price', 'percent_price',
+        'price_discount', 'price_surcharge', 'price_round',
+        'price_min_margin', 'price_max_margin',
+    ]
+
+    def __init__(self, connection: OdooConnection, product_ids: List[int],
+                 pricelist_ids: List[int], quantity: float = 1.0):
+        self.connection = connection
+        self.name = connection.name
+        self.quantity = quantity
+        self.now = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+
+        self.load_products(product_ids)
+        self.load_categories()
+        self.load_rules(pricelist_ids)
+
+        # Precios ya calculados por lista: {pricelist_id: (precios, regla usada)}
+        self.prices: Dict[int, Tuple] = {}
+
+    def load_products(self, product_ids: List[int]):
+        """Carga el catálogo como columnas NumPy ordenadas por ID"""
+        logger.info(f"⏳ [{self.name}] Leyendo {len(product_ids)} productos...")
+
+        products = []
+        batch_size = SYNC_OPTIONS.get('pricelist_check_batch_size', 5000)
+        for i in range(0, len(product_ids), batch_size):
+            products.extend(self.connection.search_read(
+                'product.product',
+                [('id', 'in', product_ids[i:i + batch_size])],
+                ['product_tmpl_id', 'categ_id', 'lst_price', 'standard_price']
+            ))
+
+        products.sort(key=lambda p: p['id'])
+        count = len(products)
+
+        self.product_ids = np.fromiter((p['id'] for p in products), dtype=np.int64, count=count)
+        self.product_tmpl = np.fromiter((m2o_id(p['product_tmpl_id']) for p in products), dtype=np.int64, count=count)
+        self.product_categ = np.fromiter((m2o_id(p['categ_id']) for p in products), dtype=np.int64, count=count)
+        self.lst_price = np.fromiter((p.get('lst_price') or 0.0 for p in products), dtype=float, count=count)
+        self.standard_price = np.fromiter((p.get('standard_price') or 0.0 for p in products), dtype=float, count=count)
+
+        logger.info(f"✓ [{self.name}] {count} productos cargados")
+
+    def load_categories(self):
+        """Carga la jerarquía de categorías (cada categoría con sus ancestros)"""
+        categories = self.connection.search_read_all('product.category', [], ['parent_id'])
+        parents = {c['id']: m2o_id(c['parent_id']) for c in categories}
+
+        self.categ_ancestors: Dict[int, List[int]] = {}
+        for categ_id in parents:
+            chain = []
+            current = categ_id
+            while current and current not in chain:
+                chain.append(current)
+                current = parents.get(current, 0)
+            self.categ_ancestors[categ_id] = chain
+
+    def load_rules(self, pricelist_ids: List[int]):
+        """
+        Carga las reglas aplicables y las ordena como Odoo
+        (applied_on, min_quantity desc, categ_id desc, id desc)
+        """
+        rules = self.connection.search_read_all(
+            'product.pricelist.item',
+            [('pricelist_id', 'in', pricelist_ids)],
+            self.rule_fields
+        )
+        logger.info(f"✓ [{self.name}] {len(rules)} reglas cargadas")
+
+        self.rules_by_pricelist: Dict[int, List[Dict]] = {pl: [] for pl in pricelist_ids}
+
+        for rule in rules:
+            # Filtros de cantidad mínima y vigencia
+            if (rule.get('min_quantity') or 0.0) > self.quantity:
+                continue
+            if rule.get('date_start') and rule['date_start'] > self.now:
+                continue
+            if rule.get('date_end') and rule['date_end'] < self.now:
+                continue
+            self.rules_by_pricelist.setdefault(rule['pricelist_id'][0], []).append(rule)
+
+        for pricelist_rules in self.rules_by_pricelist.values():
+            pricelist_rules.sort(key=lambda r: (
+                APPLIED_ON_TIER.get(r['applied_on'], 3),
+                -(r.get('min_quantity') or 0.0),
+                -m2o_id(r.get('categ_id')),
+                -r['id'],
+            ))
+
+    def first_rule_by_key(self, rule_keys, rule_positions, product_keys):
+        """
+        Para cada producto, devuelve la primera regla (en orden) cuya clave
+        coincide con la del producto, o -1
+        """
+        choice = np.full(len(product_keys), -1, dtype=np.int64)
+        if len(rule_keys) == 0:
+            return choice
+
+        # np.unique devuelve la primera aparición de cada clave (reglas ya ordenadas)
+        keys, first = np.unique(rule_keys, return_index=True)
+        positions = rule_positions[first]
+
+        index = np.clip(np.searchsorted(keys, product_keys), 0, len(keys) - 1)
+        matched = keys[index] == product_keys
+        choice[matched] = positions[index[matched]]
+        return choice
+
+    def choose_rules(self, rules: List[Dict]):
+        """Devuelve, para cada producto, la posición de la regla aplicada (-1 si ninguna)"""
+        count = len(self.product_ids)
+        if not rules:
+            return np.full(count, -1, dtype=np.int64)
+
+        tiers = np.array([APPLIED_ON_TIER.get(r['applied_on'], 3) for r in rules])
+        positions = np.arange(len(rules))
+
+        # Variantes y plantillas: índice por clave
+        variant = tiers == 0
+        by_variant = self.first_rule_by_key(
+            np.array([m2o_id(r['product_id']) for r in rules], dtype=np.int64)[variant],
+            positions[variant], self.product_ids
+        )
+        template = tiers == 1
+        by_template = self.first_rule_by_key(
+            np.array([m2o_id(r['product_tmpl_id']) for r in rules], dtype=np.int64)[template],
+            positions[template], self.product_tmpl
+        )
+
+        # Categorías: la primera regla cuya categoría sea la del producto o un ancestro
+        first_by_categ: Dict[int, int] = {}
+        for position in positions[tiers == 2]:
+            first_by_categ.setdefault(m2o_id(rules[position]['categ_id']), int(position))
+
+        catalog_categs = np.unique(self.product_categ)
+        categ_choice = np.full(len(catalog_categs), -1, dtype=np.int64)
+        for i, categ_id in enumerate(catalog_categs):
+            candidates = [
+                first_by_categ[c] for c in self.categ_ancestors.get(int(categ_id), [int(categ_id)])
+                if c in first_by_categ
+            ]
+            if candidates:
+                categ_choice[i] = min(candidates)
+        by_categ = categ_choice[np.searchsorted(catalog_categs, self.product_categ)]
+
+        global_positions = positions[tiers == 3]
+        by_global = global_positions[0] if len(global_positions) else -1
+
+        choice = np.where(by_variant >= 0, by_variant, by_template)
+        choice = np.where(choice >= 0, choice, by_categ)
+        return np.where(choice >= 0, choice, by_global)
+
+    def compute(self, pricelist_id: int, stack: Tuple = ()):
+        """
+        Calcula el precio de todo el catálogo para una lista de precios
+
+        Returns:
+            tuple: (precios np.ndarray, ID de regla aplicada np.ndarray (0 = ninguna))
+        """
+        if pricelist_id in self.prices:
+            return self.prices[pricelist_id]
+
+        if pricelist_id in stack:
+            logger.warning(f"⚠ [{self.name}] Ciclo de listas base en {stack + (pricelist_id,)}")
+            return self.lst_price.copy(), np.zeros(len(self.product_ids), dtype=np.int64)
+
+        rules = self.rules_by_pricelist.get(pricelist_id, [])
+        chosen = self.choose_rules(rules)
+        has_rule = chosen >= 0
+
+        # Parámetros de las reglas; la posición extra (-1) es una regla vacía
+        def column(getter, dtype=float):
+            values = np.array([getter(r) for r in rules] + [0], dtype=dtype)
+            return values[np.where(has_rule, chosen, len(rules))]
+
+        rule_id = column(lambda r: r['id'], np.int64)
+        compute_code = column(lambda r: COMPUTE_CODE.get(r['compute_price'], 2), np.int64)
+        base_code = column(lambda r: BASE_CODE.get(r['base'], 0), np.int64)
+        base_pricelist = column(lambda r: m2o_id(r.get('base_pricelist_id')), np.int64)
+        fixed_price = column(lambda r: r.get('fixed_price') or 0.0)
+        percent_price = column(lambda r: r.get('percent_price') or 0.0)
+        discount = column(lambda r: r.get('price_discount') or 0.0)
+        surcharge = column(lambda r: r.get('price_surcharge') or 0.0)
+        rounding = column(lambda r: r.get('price_round') or 0.0)
+        min_margin = column(lambda r: r.get('price_min_margin') or 0.0)
+        max_margin = column(lambda r: r.get('price_max_margin') or 0.0)
+
+        # Precio base según 'base'
+        base = np.where(base_code == 1, self.standard_price, self.lst_price)
+        for other_pricelist in np.unique(base_pricelist[has_rule & (base_code == 2)]):
+            other_prices, _ = self.compute(int(other_pricelist), stack + (pricelist_id,))
+            use_other = has_rule & (base_code == 2) & (base_pricelist == other_pricelist)
+            base = np.where(use_other, other_prices, base)
+
+        # compute_price = 'formula'
+        price = base - base * discount / 100
+        rounded = np.sign(price) * np.floor(np.abs(price) / np.where(rounding > 0, rounding, 1) + 0.5 + 1e-9)
+        price = np.where(rounding > 0, rounded * rounding, price)
+        price = price + surcharge
+        price = np.where(min_margin != 0, np.maximum(price, base + min_margin), price)
+        price = np.where(max_margin != 0, np.minimum(price, base + max_margin), price)
+
+        # compute_price = 'fixed' / 'percentage'
+        price = np.where(compute_code == 0, fixed_price, price)
+        price = np.where(compute_code == 1, base - base * percent_price / 100, price)
+
+        # Sin regla: precio de venta del producto
+        price = np.where(has_rule, price, self.lst_price)
+
+        self.prices[pricelist_id] = (price, np.where(has_rule, rule_id, 0))
+        return self.prices[pricelist_id]
+
+
+class PriceListCheck:
+    """Compara los precios calculados por las listas de Odoo 16 y Odoo 18"""
+
+    def __init__(self):
+        self.source = OdooConnection(ODOO_16, "Odoo 16 (VPS)")
+        self.target = OdooConnection(ODOO_18, "Odoo 18 (Local)")
+
+        self.quantity = SYNC_OPTIONS.get('pricelist_check_quantity', 1.0)
+        self.tolerance = SYNC_OPTIONS.get('pricelist_check_tolerance', 0.01)
+
+        self.stats = {'pricelists': 0, 'products': 0, 'checked': 0, 'mismatches': 0}
+
+    def load_external_id_map(self, model: str) -> Dict[int, int]:
+        """Carga el mapeo source_id -> target_id desde ir.model.data (sync_script)"""
+        prefix = f"sync_{model.replace('.', '_')}_"
+        data = self.target.search_read_all(
+            'ir.model.data',
+            [('model', '=', model), ('module', '=', 'sync_script'), ('name', 'like', f"{prefix}%")],
+            ['name', 'res_id']
+        )
+
+        id_map = {}
+        for rec in data:
+            try:
+                id_map[int(rec['name'][len(prefix):])] = rec['res_id']
+            except ValueError:
+                logger.warning(f"No se pudo parsear el external ID: {rec['name']}")
+
+        logger.info(f"✓ Mapeo cargado para {model}: {len(id_map)} IDs")
+        return id_map
+
+    def run(self):
+        """Evalúa todas las listas sincronizadas en ambos lados y reporta diferencias"""
+        start_time = datetime.now()
+
+        logger.info("")
+        logger.info("╔" + "=" * 58 + "╗")
+        logger.info("║" + " " * 10 + "VERIFICACIÓN DE LISTAS DE PRECIOS" + " " * 15 + "║")
+        logger.info("║" + " " * 15 + "Odoo 16 vs Odoo 18" + " " * 25 + "║")
+        logger.info("╚" + "=" * 58 + "╝")
+        logger.info("")
+
+        product_map = self.load_external_id_map('product.product')
+        pricelist_map = self.load_external_id_map('product.pricelist')
+
+        if not product_map or not pricelist_map:
+            logger.warning("⚠ No hay productos o listas de precios sincronizados para comparar")
+            return
+
+        source_engine = PricelistEngine(self.source, sorted(product_map.keys()), sorted(pricelist_map.keys()), self.quantity)
+        target_engine = PricelistEngine(self.target, sorted(set(product_map.values())), sorted(pricelist_map.values()), self.quantity)
+
+        # Alinear productos: posición en origen -> posición en destino
+        mapped_target = np.array([product_map[int(pid)] for pid in source_engine.product_ids], dtype=np.int64)
+        target_index = np.clip(np.searchsorted(target_engine.product_ids, mapped_target), 0, max(len(target_engine.product_ids) - 1, 0))
+        aligned = target_engine.product_ids[target_index] == mapped_target if len(target_engine.product_ids) else np.zeros(len(mapped_target), dtype=bool)
+        source_index = np.flatnonzero(aligned)
+        target_index = target_index[aligned]
+
+        self.stats['products'] = len(source_index)
+
+        pricelist_names = {
+            p['id']: p['name'] for p in self.source.search_read(
+                'product.pricelist', [('id', 'in', list(pricelist_map.keys()))], ['name']
+            )
+        }
+
+        mismatches = []  # (diferencia abs, lista, posición origen, posición destino, ...)
+
+        for source_pricelist, target_pricelist in sorted(pricelist_map.items()):
+            source_prices, source_rules = source_engine.compute(source_pricelist)
+            target_prices, target_rules = target_engine.compute(target_pricelist)
+
+            source_prices, source_rules = source_prices[source_index], source_rules[source_index]
+            target_prices, target_rules = target_prices[target_index], target_rules[target_index]
+
+            difference = target_prices - source_prices
+            wrong = np.flatnonzero(np.abs(difference) > self.tolerance)
+
+            self.stats['pricelists'] += 1
+            self.stats['checked'] += len(source_index)
+            self.stats['mismatches'] += len(wrong)
+
+            logger.info(
+                f"{'✓' if len(wrong) == 0 else '❌'} {pricelist_names.get(source_pricelist, source_pricelist)}: "
+                f"{len(wrong)} diferencias en {len(source_index)} productos"
+            )
+
+            for i in wrong:
+                mismatches.append((
+                    abs(float(difference[i])), source_pricelist, target_pricelist,
+                    int(source_engine.product_ids[source_index[i]]), int(target_engine.product_ids[target_index[i]]),
+                    float(source_prices[i]), float(target_prices[i]), float(difference[i]),
+                    int(source_rules[i]), int(target_rules[i]),
+                ))
+
+        mismatches.sort(key=lambda m: -m[0])
+        self.write_report(mismatches, pricelist_names)
+
+        elapsed = datetime.now() - start_time
+
+        logger.info("")
+        logger.info("=" * 60)
+        logger.info("RESUMEN DE VERIFICACIÓN")
+        logger.info("=" * 60)
+        logger.info(f"Listas comparadas:   {self.stats['pricelists']}")
+        logger.info(f"Productos:           {self.stats['products']}")
+        logger.info(f"Precios comparados:  {self.stats['checked']}")
+        logger.info(f"❌ Diferencias:       {self.stats['mismatches']}")
+        logger.info(f"⏱ Tiempo:             {elapsed}")
+        logger.info("=" * 60)
+
+    def write_report(self, mismatches: List[Tuple], pricelist_names: Dict[int, str]):
+        """Escribe el CSV de diferencias (mayor diferencia primero)"""
+        report_file = SYNC_OPTIONS.get('pricelist_check_file', 'pricelist_mismatches.csv')
+        limit = SYNC_OPTIONS.get('pricelist_check_top', 5000)
+        rows = mismatches[:limit]
+
+        names = {}
+        product_ids = list({m[3] for m in rows})
+        for i in range(0, len(product_ids), 5000):
+            for product in self.source.search_read(
+                'product.product', [('id', 'in', product_ids[i:i + 5000])], ['name', 'default_code']
+            ):
+                names[product['id']] = (product.get('default_code') or '', product['name'])
+
+        with open(report_file, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow([
+                'pricelist', 'source_pricelist_id', 'target_pricelist_id',
+                'source_product_id', 'target_product_id', 'default_code', 'name',
+                'price_odoo16', 'price_odoo18', 'difference',
+                'source_rule_id', 'target_rule_id'
+            ])
+            for _, source_pl, target_pl, source_pid, target_pid, price16, price18, diff, rule16, rule18 in rows:
+                code, name = names.get(source_pid, ('', ''))
+                writer.writerow([
+                    pricelist_names.get(source_pl, ''), source_pl, target_pl,
+                    source_pid, target_pid, code, name,
+                    f"{price16:.2f}", f"{price18:.2f}", f"{diff:.2f}",
+                    rule16 or '', rule18 or ''
+                ])
+
+        logger.info(f"✓ Reporte escrito en {report_file} ({len(rows)} filas)")
+
+
+if __name__ == "__main__":
+    try:
+        check = PriceListCheck()
+        check.run()
+    except KeyboardInterrupt:
+        logger.info("\n⚠ Verificación interrumpida por el usuario")
+        sys.exit(0)
+    except Exception as e:
+        logger.error(f"❌ Error fatal: {e}")
+        sys.exit(1)
@@ -50,6 +50,154 @@ SYNC_OPTIONS = {
     # False = sincronizar todos los productos
     'incremental_sync': True,
     
+    # Sincronización incremental de stock (solo productos con movimientos
+    # o quants modificados en Odoo 16 desde la última vez)
+    'incremental_stock_sync': True,
+    
+    # Modo demonio de stock (python3 sync_stock.py --daemon)
+    # Intervalo de consulta en segundos, refresco del mapeo de productos
+    # y archivo de métricas (formato texto de Prometheus)
+    'stock_daemon_interval': 30,
+    'stock_daemon_mapping_refresh': 300,
+    'stock_daemon_metrics_file': 'stock_daemon.prom',
+    
+    # Reporte de diferencias de stock (python3 sync_stock.py --report)
+    # Requiere NumPy. Ubicaciones por nombre completo (ej: ['WH/Stock']);
+    # vacío = comparar qty_available total por producto
+    'stock_report_locations': [],
+    'stock_report_top': 500,
+    'stock_report_file': 'stock_drift_report.csv',
+    'stock_report_batch_size': 2000,
+    
+    # Cantidad de productos por lote en la sincronización de stock
+    # (lecturas de quants/lotes y escrituras agrupadas)
+    'stock_batch_size': 200,
+    
+    # Archivados (sync_archived_products_only.py): productos por lote y si
+    # también se reactivan en Odoo 18 los productos reactivados en Odoo 16
+    'archive_batch_size': 1000,
+    'archive_reactivate': False,
+    
+    # Limpieza de external_id huérfanos (python3 gc_external_ids.py)
+    # IDs por búsqueda/eliminación en lote
+    'gc_batch_size': 2000,
+    
+    # Sincronización incremental de reglas de precios (solo reglas con
+    # write_date posterior a la última ejecución en Odoo 16)
+    'incremental_pricelist_sync': True,
+    
+    # Conciliar eliminados: reglas borradas en Odoo 16 se eliminan en Odoo 18
+    # y listas borradas/archivadas se archivan ('archive') o eliminan ('unlink')
+    'pricelist_reconcile': True,
+    'pricelist_orphan_action': 'archive',
+    
+    # Cantidad de reglas de precios por create/read agrupado
+    'pricelist_batch_size': 500,
+    
+    # Verificación de precios (python3 check_pricelists.py, requiere NumPy)
+    # Cantidad a evaluar, tolerancia de diferencia y archivo CSV de salida
+    'pricelist_check_quantity': 1.0,
+    'pricelist_check_tolerance': 0.01,
+    'pricelist_check_file': 'pricelist_mismatches.csv',
+    
+    # Contactos (sync_partners.py): cantidad por página de lectura
+    'partner_batch_size': 500,
+    
+    # Sincronización incremental de contactos (solo modificados en Odoo 16
+    # desde la última vez) y cada cuántos días releer el padrón completo
+    'incremental_partner_sync': True,
+    'partner_full_sync_days': 7,
+    
+    # Adoptar contactos que ya existen en Odoo 18 sin external_id (cargados a
+    # mano, por AFIP o POS): se vinculan por CUIT, referencia o email en vez
+    # de crear duplicados
+    'partner_adopt_existing': True,
+    
+    # Sincronizar contactos hijos (direcciones de entrega/facturación y
+    # personas de contacto) de clientes y proveedores
+    'sync_partner_children': True,
+    
+    # Detector de contactos duplicados (python3 find_duplicate_partners.py)
+    # Puntaje mínimo (0..1), tamaño máximo de bloque a comparar, tamaño de
+    # página de lectura y archivo CSV de salida
+    'duplicate_min_score': 0.85,
+    'duplicate_max_block': 200,
+    'duplicate_read_batch_size': 5000,
+    'duplicate_report_file': 'duplicate_partners.csv',
+    
+    # Orquestador (python3 sync_all.py): etapas independientes en paralelo
+    'sync_max_parallel': 3,
+    
+    # Ejecutar las etapas en un solo proceso compartiendo sesiones y mapeos
+    # (False = un proceso por script, como sync_all.sh)
+    'sync_in_process': True,
+    
+    # Modo demonio (python3 sync_all.py --daemon): intervalo de cada etapa en
+    # segundos o 'HH:MM' para una vez por día a esa hora. Las etapas que no
+    # figuran no se ejecutan en modo demonio.
+    'sync_daemon_intervals': {
+        'stock': 120,
+        'pricelists': 900,
+        'categories': 3600,
+        'products': 3600,
+        'archived': 3600,
+        'partners': '02:00',
+        'gc': '03:30',
+    },
+    
+    # Variación aleatoria del próximo tick (fracción del intervalo, hasta 1 hora)
+    # para que las etapas no coincidan siempre en el mismo segundo
+    'sync_daemon_jitter': 0.1,
+    
+    # Back-off: si una etapa falla o tarda más que su intervalo, el siguiente
+    # intervalo se duplica hasta este factor; vuelve a 1 tras un tick normal
+    'sync_daemon_max_backoff': 8,
+    
+    # Segundos entre relecturas completas de los mapeos en caché
+    'sync_daemon_cache_refresh': 3600,
+    
+    # Bloqueo por etapa (sync_lock.py): qué hacer si la etapa ya está en curso
+    # 'wait' = esperar, 'skip' = no ejecutarla, 'cancel' = pedirle que se
+    # detenga en el próximo lote y esperar (se puede cambiar con --on-lock)
+    'sync_lock_policy': 'wait',
+    'sync_lock_wait_timeout': 3600,   # Segundos máximos de espera
+    'sync_lock_stale_seconds': 1800,  # Bloqueo sin renovar = obsoleto
+    'sync_lock_history_file': 'sync_locks.log',
+    
+    # Cola de fallidos (sync_dead_letter.py): productos, contactos y reglas
+    # con error se reintentan con back-off y no frenan la marca de agua
+    'dead_letter_file': 'sync_dead_letters.db',
+    'dead_letter_retry_base': 300,     # Segundos hasta el primer reintento (se duplica)
+    'dead_letter_retry_max': 86400,    # Espera máxima entre reintentos
+    'dead_letter_max_attempts': 10,    # Después quedan en la cola sin reintentarse
+    'dead_letter_retry_limit': 500,    # Registros por pasada de reintentos
+    
+    # Almacén local de mapeos (sync_mapping_store.py): los external_id
+    # sync_script en SQLite para resolver IDs sin consultar Odoo 18
+    'mapping_store': True,
+    'mapping_store_file': 'sync_mappings.db',
+    'mapping_store_check_seconds': 60,  # Cada cuánto comparar con ir.model.data (read_group)
+    'mapping_store_page_size': 20000,   # Filas por lectura al releer un modelo
+    
+    # Huellas de lo último enviado (sync_hash_store.py): productos, contactos,
+    # categorías y reglas de precios sin cambios no se leen ni escriben en Odoo 18
+    'pushed_hash_store': True,
+    'pushed_hash_file': 'sync_pushed_hashes.db',
+    'pushed_hash_max_age': 7 * 86400,   # Segundos hasta volver a comparar contra Odoo 18
+    
+    # Instantánea local de Odoo 16 (sync_snapshot.py): productos, stock, listas
+    # de precios y archivados comparten los datos de product.product
+    'source_snapshot': True,
+    'source_snapshot_dir': 'snapshots',
+    'source_snapshot_max_age': 600,     # Segundos en que las etapas reutilizan sin consultar
+    'source_snapshot_page_size': 2000,  # Filas por lectura al refrescar
+    
+    # Carga masiva con load() (sync_bulk_load.py): productos, categorías,
+    # contactos nuevos y reglas de precios se crean o actualizan junto con su
+    # external_id en una llamada por lote (también con --bulk-load)
+    'bulk_load': False,
+    'bulk_load_batch_size': 200,        # Filas por llamada a load()
+    
     # Campos personalizados de productos a sincronizar
     'custom_product_fields': [
         'internal_code',
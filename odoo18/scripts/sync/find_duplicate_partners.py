@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""
+Detector de CONTACTOS DUPLICADOS en Odoo 16 (VPS)
+
+Lee todos los contactos principales en lote y agrupa candidatos por claves
+de bloqueo (CUIT normalizado, clave fonética del nombre, trigramas poco
+frecuentes del nombre y dominio de email corporativo). Solo se comparan
+pares dentro de un mismo bloque, así 30k contactos se procesan en segundos
+en lugar de comparar todos contra todos.
+
+Genera un CSV ordenado por puntaje con los pares a fusionar antes de
+copiar los datos a Odoo 18.
+
+Uso:
+    python3 find_duplicate_partners.py
+"""
+
+import csv
+import logging
+import re
+import sys
+import os
+import unicodedata
+from collections import Counter
+from datetime import datetime
+from difflib import SequenceMatcher
+from typing import Dict, List, Set, Tuple
+
+# Agregar directorio actual al path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# Configuración de logging (antes de importar sync_partners para
+# conservar el archivo de log propio)
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.FileHandler('find_duplicate_partners.log'),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger(__name__)
+
+from config import ODOO_16, SYNC_OPTIONS
+from sync_partners import OdooConnection, normalize_vat, normalize_email
+
+# Formas societarias y palabras que no distinguen a un contacto
+STOPWORDS = {
+    'sa', 'srl', 'sas', 'sca', 'sh', 'saic', 'saci', 'sacif', 'coop', 'ltda',
+    'de', 'del', 'la', 'las', 'el', 'los', 'y', 'e', 'cia', 'hnos', 'hermanos',
+}
+
+# Dominios de email compartidos por miles de personas: no sirven como bloque
+PUBLIC_EMAIL_DOMAINS = {
+    'gmail.com', 'hotmail.com', 'hotmail.com.ar', 'yahoo.com', 'yahoo.com.ar',
+    'outlook.com', 'live.com', 'live.com.ar', 'icloud.com', 'fibertel.com.ar',
+    'speedy.com.ar', 'arnet.com.ar',
+}
+
+# Sustituciones fonéticas para español rioplatense (en orden)
+PHONETIC_RULES = [
+    (r'qu', 'k'), (r'c([ei])', r's\1'), (r'c', 'k'), (r'z', 's'),
+    (r'v', 'b'), (r'w', 'b'), (r'll', 'y'), (r'h', ''), (r'x', 'ks'),
+    (r'g([ei])', r'j\1'), (r'(.)\1+', r'\1'),
+]
+
+# Cantidad de trigramas (los menos frecuentes) que bloquean cada nombre
+TRIGRAMS_PER_NAME = 3
+
+
+def normalize_name(value) -> str:
+    """Nombre en minúsculas, sin acentos, signos ni formas societarias"""
+    if not value:
+        return ''
+    text = unicodedata.normalize('NFKD', str(value)).encode('ascii', 'ignore').decode()
+    text = re.sub(r'[^a-z0-9 ]', ' ', text.lower().replace('.', ''))
+    return ' '.join(t for t in text.split() if t not in STOPWORDS)
+
+
+def phonetic_key(name: str) -> str:
+    """Clave fonética: palabras transformadas y ordenadas (ignora el orden y la grafía)"""
+    words = []
+    for word in name.split():
+        for pattern, repl in PHONETIC_RULES:
+            word = re.sub(pattern, repl, word)
+        if word:
+            words.append(word)
+    return ' '.join(sorted(words))
+
+
+def trigrams(name: str) -> Set[str]:
+    """Trigramas del nombre sin espacios"""
+    compact = name.replace(' ', '')
+    return {compact[i:i + 3] for i in range(len(compact) - 2)}
+
+
+def email_domain(value) -> str:
+    """Dominio de email corporativo (vacío si es un dominio público)"""
+    email = normalize_email(value)
+    domain = email.rsplit('@', 1)[-1] if email else ''
+    return '' if domain in PUBLIC_EMAIL_DOMAINS else domain
+
+
+class DuplicatePartnerFinder:
+    """Detecta contactos duplicados con índices de bloqueo"""
+
+    def __init__(self):
+        self.source = OdooConnection(ODOO_16, "Odoo 16 (VPS)")
+        self.batch_size = SYNC_OPTIONS.get('duplicate_read_batch_size', 5000)
+        self.min_score = SYNC_OPTIONS.get('duplicate_min_score', 0.85)
+        self.max_block = SYNC_OPTIONS.get('duplicate_max_block', 200)
+        self.output_file = SYNC_OPTIONS.get('duplicate_report_file', 'duplicate_partners.csv')
+
+        # ID -> contacto con sus claves ya calculadas
+        self.partners: Dict[int, Dict] = {}
+
+    def load_partners(self):
+        """Lee todos los contactos principales de Odoo 16 en páginas"""
+        domain = [('parent_id', '=', False)]
+        if SYNC_OPTIONS.get('only_active', True):
+            domain.append(('active', '=', True))
+
+        fields = ['name', 'vat', 'email', 'ref', 'customer_rank', 'supplier_rank']
+        offset = 0
+        while True:
+            page = self.source.search_read(
+                'res.partner', domain, fields,
+                offset=offset, limit=self.batch_size, order='id'
+            )
+            for partner in page:
+                name = normalize_name(partner['name'])
+                partner['norm_name'] = name
+                partner['norm_vat'] = normalize_vat(partner.get('vat'))
+                partner['norm_email'] = normalize_email(partner.get('email'))
+                partner['trigrams'] = trigrams(name)
+                self.partners[partner['id']] = partner
+            if len(page) < self.batch_size:
+                break
+            offset += self.batch_size
+
+        logger.info(f"✓ Leídos {len(self.partners)} contactos")
+
+    def build_blocks(self) -> Dict[str, List[int]]:
+        """Agrupa los contactos por cada una de sus claves de bloqueo"""
+        trigram_freq = Counter()
+        for partner in self.partners.values():
+            trigram_freq.update(partner['trigrams'])
+
+        blocks: Dict[str, List[int]] = {}
+        for partner_id, partner in self.partners.items():
+            keys = set()
+            if partner['norm_vat']:
+                keys.add(f"vat:{partner['norm_vat']}")
+            if partner['norm_name']:
+                keys.add(f"fon:{phonetic_key(partner['norm_name'])}")
+            domain = email_domain(partner.get('email'))
+            if domain:
+                keys.add(f"dom:{domain}")
+            rare = sorted(partner['trigrams'], key=lambda t: (trigram_freq[t], t))
+            keys.update(f"tri:{t}" for t in rare[:TRIGRAMS_PER_NAME])
+
+            for key in keys:
+                blocks.setdefault(key, []).append(partner_id)
+
+        return {key: ids for key, ids in blocks.items() if len(ids) > 1}
+
+    def score_pair(self, a: Dict, b: Dict) -> Tuple[float, List[str]]:
+        """Puntaje 0..1 de que dos contactos sean el mismo, con los motivos"""
+        reasons = []
+        score = 0.0
+
+        if a['norm_vat'] and a['norm_vat'] == b['norm_vat']:
+            reasons.append('cuit')
+            score = 0.95
+
+        if a['norm_name'] and b['norm_name']:
+            union = a['trigrams'] | b['trigrams']
+            jaccard = len(a['trigrams'] & b['trigrams']) / len(union) if union else 0.0
+            # SequenceMatcher es caro: solo para pares con trigramas en común
+            if jaccard >= 0.3 or reasons:
+                similarity = SequenceMatcher(None, a['norm_name'], b['norm_name']).ratio()
+                if similarity >= 0.8:
+                    reasons.append(f"nombre {similarity:.2f}")
+                score = max(score, similarity)
+
+        if a['norm_email'] and a['norm_email'] == b['norm_email']:
+            reasons.append('email')
+            score = min(1.0, score + 0.1)
+
+        if a['norm_vat'] and b['norm_vat'] and a['norm_vat'] != b['norm_vat']:
+            # CUIT distintos: casi seguro que son contactos distintos
+            score *= 0.5
+
+        return score, reasons
+
+    def find_duplicates(self) -> List[Tuple[float, int, int, List[str]]]:
+        """Compara los pares de cada bloque y devuelve los que superan el umbral"""
+        blocks = self.build_blocks()
+        oversized = 0
+        seen: Set[Tuple[int, int]] = set()
+        matches = []
+
+        for key, ids in blocks.items():
+            # Bloques enormes (ej: trigramas o dominios muy comunes) no discriminan
+            if len(ids) > self.max_block and not key.startswith('vat:'):
+                oversized += 1
+                continue
+            for i, id_a in enumerate(ids):
+                for id_b in ids[i + 1:]:
+                    pair = (id_a, id_b) if id_a < id_b else (id_b, id_a)
+                    if pair in seen:
+                        continue
+                    seen.add(pair)
+                    score, reasons = self.score_pair(self.partners[pair[0]], self.partners[pair[1]])
+                    if score >= self.min_score:
+                        matches.append((score, pair[0], pair[1], reasons))
+
+        logger.info(f"✓ {len(blocks)} bloques, {len(seen)} pares comparados "
+                    f"({oversized} bloques omitidos por tamaño)")
+        matches.sort(key=lambda m: (-m[0], m[1], m[2]))
+        return matches
+
+    def write_report(self, matches: List[Tuple[float, int, int, List[str]]]):
+        """Escribe el CSV de pares a fusionar (el de menor ID se conserva)"""
+        with open(self.output_file, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(['score', 'keep_id', 'keep_name', 'keep_vat',
+                             'merge_id', 'merge_name', 'merge_vat', 'reasons'])
+            for score, id_a, id_b, reasons in matches:
+                a, b = self.partners[id_a], self.partners[id_b]
+                writer.writerow([f"{score:.3f}", id_a, a['name'], a.get('vat') or '',
+                                 id_b, b['name'], b.get('vat') or '', ', '.join(reasons)])
+
+    def run(self):
+        """Ejecuta la detección completa"""
+        start_time = datetime.now()
+
+        logger.info("")
+        logger.info("╔" + "=" * 58 + "╗")
+        logger.info("║" + "DETECCIÓN DE CONTACTOS DUPLICADOS".center(58) + "║")
+        logger.info("║" + "Odoo 16".center(58) + "║")
+        logger.info("╚" + "=" * 58 + "╝")
+        logger.info("")
+
+        self.load_partners()
+        matches = self.find_duplicates()
+        self.write_report(matches)
+
+        elapsed = datetime.now() - start_time
+        logger.info("")
+        logger.info("=" * 60)
+        logger.info(f"Contactos analizados: {len(self.partners)}")
+        logger.info(f"⚠ Posibles duplicados: {len(matches)}")
+        logger.info(f"📄 Reporte:            {self.output_file}")
+        logger.info(f"⏱ Tiempo:              {elapsed}")
+        logger.info("=" * 60)
+
+
+if __name__ == "__main__":
+    try:
+        DuplicatePartnerFinder().run()
+    except KeyboardInterrupt:
+        logger.info("\n⚠ Detección interrumpida por el usuario")
+        sys.exit(0)
+    except Exception as e:
+        logger.error(f"❌ Error fatal: {e}")
+        sys.exit(1)
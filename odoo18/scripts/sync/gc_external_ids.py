@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+Limpieza de EXTERNAL IDs huérfanos del módulo sync_script en Odoo 18
+
+Los scripts de sincronización mapean Odoo 16 -> Odoo 18 con registros
+ir.model.data (módulo sync_script). Si el registro de Odoo 18 se eliminó,
+el mapeo queda apuntando a un ID inexistente y cada sincronización paga
+un write fallido por él.
+
+Este script revisa todos los mapeos de todos los modelos contra los IDs
+reales (una búsqueda por lote y modelo, incluyendo archivados) y elimina
+en lotes los ir.model.data colgantes.
+
+Uso:
+    python3 gc_external_ids.py
+    python3 gc_external_ids.py --dry-run    (solo informa)
+"""
+
+import xmlrpc.client
+import logging
+from datetime import datetime
+from typing import Dict, List
+import sys
+import os
+
+# Agregar directorio actual al path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# Importar configuración
+try:
+    from config import ODOO_18, SYNC_OPTIONS
+except ImportError as e:
+    print("❌ Error: No se encontró el archivo config.py")
+    print(f"Error técnico: {e}")
+    print("\nVerifica que config.py existe en el mismo directorio que este script")
+    sys.exit(1)
+
+# Configuración de logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.FileHandler('gc_external_ids.log'),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger(__name__)
+
+from sync_lock import StageLock, StopRequested, EXIT_STOPPED, policy_from_argv
+
+
+class OdooConnection:
+    """Maneja la conexión a una instancia de Odoo"""
+
+    def __init__(self, config: Dict, name: str, session=None):
+        self.config = config
+        self.name = name
+        self.uid = None
+        self.models = None
+
+        if session:
+            # Sesión compartida (sync_all.py en proceso): sin autenticar de nuevo
+            self.uid = session.uid
+            self.models = session.models
+        else:
+            self.connect()
+
+    def connect(self):
+        """Establece la conexión con Odoo"""
+        try:
+            logger.info(f"Conectando a {self.name} ({self.config['url']})...")
+
+            common = xmlrpc.client.ServerProxy(
+                f"{self.config['url']}/xmlrpc/2/common"
+            )
+
+            self.uid = common.authenticate(
+                self.config['db'],
+                self.config['username'],
+                self.config['password'],
+                {}
+            )
+
+            if not self.uid:
+                raise Exception(f"Autenticación fallida en {self.name}")
+
+            self.models = xmlrpc.client.ServerProxy(
+                f"{self.config['url']}/xmlrpc/2/object"
+            )
+
+            # Verificar versión
+            version = common.version()
+            logger.info(f"✓ Conectado a {self.name} - Versión: {version['server_version']}")
+
+        except Exception as e:
+            logger.error(f"❌ Error conectando a {self.name}: {e}")
+            raise
+
+    def execute(self, model: str, method: str, *args, **kwargs):
+        """Ejecuta un método en Odoo"""
+        return self.models.execute_kw(
+            self.config['db'],
+            self.uid,
+            self.config['password'],
+            model,
+            method,
+            args,
+            kwargs
+        )
+
+    def search_read(self, model: str, domain: List, fields: List,
+                    offset: int = 0, limit: int = 0) -> List[Dict]:
+        """Busca y lee registros (ordenados por ID)"""
+        kwargs = {'fields': fields, 'order': 'id'}
+        if offset > 0:
+            kwargs['offset'] = offset
+        if limit > 0:
+            kwargs['limit'] = limit
+        return self.execute(model, 'search_read', domain, **kwargs)
+
+    def existing_ids(self, model: str, record_ids: List[int]) -> List[int]:
+        """IDs que existen en el modelo, incluidos los archivados"""
+        return self.execute(
+            model, 'search', [('id', 'in', record_ids)],
+            context={'active_test': False}
+        )
+
+    def unlink(self, model: str, record_ids: List[int]) -> bool:
+        """Elimina registros"""
+        return self.execute(model, 'unlink', record_ids)
+
+
+class ExternalIdGC:
+    """Elimina mapeos sync_script que apuntan a registros inexistentes"""
+
+    def __init__(self, dry_run: bool = False, target_session=None, lock=None):
+        self.target = OdooConnection(ODOO_18, "Odoo 18 (Local)", session=target_session)
+        self.dry_run = dry_run
+        # Bloqueo de la etapa: entre modelos se revisa si se pidió detenerla
+        self.lock = lock
+        self.batch_size = SYNC_OPTIONS.get('gc_batch_size', 2000)
+        self.stats = {
+            'total': 0,
+            'dangling': 0,
+            'deleted': 0,
+            'errors': 0
+        }
+        # Modelo -> cantidad de mapeos colgantes (para el resumen)
+        self.dangling_by_model: Dict[str, int] = {}
+
+    def load_mappings(self) -> Dict[str, Dict[int, List[int]]]:
+        """Lee todos los ir.model.data de sync_script: modelo -> res_id -> [IDs de ir.model.data]"""
+        mappings: Dict[str, Dict[int, List[int]]] = {}
+        offset = 0
+        page_size = self.batch_size * 5
+
+        while True:
+            page = self.target.search_read(
+                'ir.model.data', [('module', '=', 'sync_script')],
+                ['model', 'res_id'], offset=offset, limit=page_size
+            )
+            for row in page:
+                mappings.setdefault(row['model'], {}).setdefault(row['res_id'], []).append(row['id'])
+            self.stats['total'] += len(page)
+            if len(page) < page_size:
+                break
+            offset += page_size
+
+        logger.info(f"✓ {self.stats['total']} mapeos en {len(mappings)} modelos")
+        return mappings
+
+    def find_dangling(self, model: str, by_res_id: Dict[int, List[int]]) -> List[int]:
+        """Compara los res_id de un modelo con los IDs reales, por lotes"""
+        res_ids = sorted(by_res_id)
+        dangling = []
+
+        for start in range(0, len(res_ids), self.batch_size):
+            chunk = res_ids[start:start + self.batch_size]
+            existing = set(self.target.existing_ids(model, chunk))
+            for res_id in chunk:
+                if res_id not in existing:
+                    dangling.extend(by_res_id[res_id])
+
+        return dangling
+
+    def delete(self, xmlid_ids: List[int]):
+        """Elimina ir.model.data en lotes (uno por uno si falla el lote)"""
+        for start in range(0, len(xmlid_ids), self.batch_size):
+            chunk = xmlid_ids[start:start + self.batch_size]
+            try:
+                self.target.unlink('ir.model.data', chunk)
+                self.stats['deleted'] += len(chunk)
+            except Exception as e:
+                logger.warning(f"⚠ Falló la eliminación en lote ({e}). Reintentando uno por uno...")
+                for xmlid_id in chunk:
+                    try:
+                        self.target.unlink('ir.model.data', [xmlid_id])
+                        self.stats['deleted'] += 1
+                    except Exception as e2:
+                        logger.error(f"❌ Error eliminando ir.model.data {xmlid_id}: {e2}")
+                        self.stats['errors'] += 1
+
+    def run(self):
+        """Ejecuta la limpieza completa"""
+        start_time = datetime.now()
+
+        logger.info("")
+        logger.info("╔" + "=" * 58 + "╗")
+        logger.info("║" + "LIMPIEZA DE EXTERNAL IDs HUÉRFANOS".center(58) + "║")
+        logger.info("║" + "sync_script - Odoo 18".center(58) + "║")
+        logger.info("╚" + "=" * 58 + "╝")
+        logger.info("")
+
+        mappings = self.load_mappings()
+        dangling = []
+
+        for model, by_res_id in sorted(mappings.items()):
+            if self.lock:
+                self.lock.check_stop()
+            try:
+                model_dangling = self.find_dangling(model, by_res_id)
+            except Exception as e:
+                # Modelo inexistente o sin permisos: no se toca nada
+                logger.error(f"❌ No se pudo verificar {model}: {e}")
+                self.stats['errors'] += 1
+                continue
+
+            if model_dangling:
+                logger.info(f"🗑 {model}: {len(model_dangling)} mapeos colgantes")
+            self.dangling_by_model[model] = len(model_dangling)
+            dangling.extend(model_dangling)
+
+        self.stats['dangling'] = len(dangling)
+
+        if self.dry_run:
+            logger.info("ℹ Modo --dry-run: no se elimina nada")
+        elif dangling:
+            self.delete(dangling)
+
+        elapsed = datetime.now() - start_time
+        logger.info("")
+        logger.info("=" * 60)
+        logger.info("RESUMEN DE LIMPIEZA")
+        logger.info("=" * 60)
+        logger.info(f"Mapeos revisados: {self.stats['total']}")
+        logger.info(f"⚠ Colgantes:      {self.stats['dangling']}")
+        logger.info(f"🗑 Eliminados:     {self.stats['deleted']}")
+        logger.info(f"❌ Errores:        {self.stats['errors']}")
+        logger.info(f"⏱ Tiempo:          {elapsed}")
+        logger.info("=" * 60)
+
+
+if __name__ == "__main__":
+    try:
+        lock = StageLock('gc', policy=policy_from_argv(sys.argv))
+        if not lock.acquire():
+            sys.exit(0)
+        try:
+            gc = ExternalIdGC(dry_run='--dry-run' in sys.argv, lock=lock)
+            gc.run()
+        finally:
+            lock.release()
+    except StopRequested as e:
+        logger.warning(f"🛑 {e}")
+        sys.exit(EXIT_STOPPED)
+    except KeyboardInterrupt:
+        logger.info("\n⚠ Limpieza interrumpida por el usuario")
+        sys.exit(0)
+    except Exception as e:
+        logger.error(f"❌ Error fatal: {e}")
+        sys.exit(1)
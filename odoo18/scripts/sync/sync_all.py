@@ -0,0 +1,517 @@
+#!/usr/bin/env python3
+"""
+Orquestador de la SINCRONIZACIÓN COMPLETA
+Odoo 16 (VPS) -> Odoo 18 (Local)
+
+Reemplaza la ejecución secuencial de sync_all.sh: cada etapa declara de
+qué etapas depende y las independientes corren en paralelo (hasta
+'sync_max_parallel' a la vez). El tiempo total es el del camino crítico
+(categorías → productos → stock/archivados/listas de precios) y no la
+suma de todas las etapas.
+
+Si una etapa falla, solo se omiten las etapas que dependen de ella; el
+resto de las ramas sigue normalmente.
+
+Por defecto ('sync_in_process') las etapas corren en este mismo proceso
+como clases de biblioteca: cada servidor se autentica una sola vez y los
+mapeos de ir.model.data se leen una vez y se comparten (sync_session.py,
+o el almacén local SQLite de sync_mapping_store.py con 'mapping_store').
+Con --subprocess cada etapa corre su script en un proceso aparte.
+
+Con --daemon queda corriendo y ejecuta cada etapa con su propio intervalo
+('sync_daemon_intervals': stock cada 2 minutos, precios cada 15, productos
+cada hora, contactos de noche), manteniendo sesiones y mapeos en memoria
+entre ticks. Si una etapa sigue en curso cuando le toca el próximo tick,
+ese tick se omite (no se encola).
+
+Uso:
+    python3 sync_all.py
+    python3 sync_all.py --max-parallel 2
+    python3 sync_all.py --subprocess
+    python3 sync_all.py --only products,stock    (las dependencias deben estar al día)
+    python3 sync_all.py --daemon
+    python3 sync_all.py --daemon --only stock,pricelists
+    python3 sync_all.py --on-lock cancel    (detiene las etapas en curso de otra ejecución)
+
+Cada etapa toma su bloqueo (sync_lock.py); si ya está en curso en otra
+ejecución se aplica 'sync_lock_policy' o --on-lock (wait, skip o cancel).
+"""
+
+import importlib
+import inspect
+import logging
+import random
+import subprocess
+import sys
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+# Agregar directorio actual al path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# Importar configuración
+try:
+    from config import ODOO_16, ODOO_18, SYNC_OPTIONS
+except ImportError as e:
+    print("❌ Error: No se encontró el archivo config.py")
+    print(f"Error técnico: {e}")
+    print("\nVerifica que config.py existe en el mismo directorio que este script")
+    sys.exit(1)
+
+# Configuración de logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.FileHandler('sync_all.log'),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger(__name__)
+
+from sync_session import SharedSession, MappingCache
+from sync_mapping_store import default_mapping_cache
+from sync_lock import StageLock, StopRequested, EXIT_STOPPED, HELD_ENV, policy_from_argv
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Etapas y sus dependencias reales
+# entry: clase (o función) a ejecutar en proceso; log: archivo propio de la etapa;
+# writes: modelos cuyos mapeos crea la etapa (None = puede tocar todos)
+STAGES = {
+    'gc': {
+        'script': 'gc_external_ids.py', 'deps': [],
+        'entry': 'ExternalIdGC', 'log': 'gc_external_ids.log', 'writes': None,
+    },
+    'partners': {
+        'script': 'sync_partners.py', 'deps': [],
+        'entry': 'PartnerSync', 'log': 'sync_partners.log', 'writes': ['res.partner'],
+    },
+    'categories': {
+        'script': 'sync_categories.py', 'deps': [],
+        'entry': 'CategorySync', 'log': 'sync_categories.log',
+        'writes': ['product.category', 'pos.category', 'product.public.category'],
+    },
+    'products': {
+        'script': 'sync_products.py', 'deps': ['categories'],
+        'entry': 'ProductSync', 'log': 'sync_products.log', 'writes': ['product.product'],
+    },
+    'archived': {
+        'script': 'sync_archived_products_only.py', 'deps': ['products'],
+        'entry': 'run', 'log': 'sync_archived_products.log', 'writes': [],
+    },
+    'stock': {
+        'script': 'sync_stock.py', 'deps': ['products'],
+        'entry': 'StockSync', 'log': 'sync_stock.log', 'writes': [],
+    },
+    'pricelists': {
+        'script': 'sync_pricelists.py', 'deps': ['products', 'categories'],
+        'entry': 'PriceListSync', 'log': 'sync_pricelists.log',
+        'writes': ['product.pricelist', 'product.pricelist.item'],
+    },
+}
+
+# Estados de una etapa
+PENDING, RUNNING, OK, FAILED, SKIPPED = 'pendiente', 'en curso', 'ok', 'error', 'omitida'
+STOPPED = 'detenida'
+
+
+class SyncOrchestrator:
+    """Ejecuta las etapas de sincronización respetando sus dependencias"""
+
+    def __init__(self, max_parallel: int = None, only: List[str] = None, in_process: bool = None,
+                 lock_policy: str = None):
+        self.max_parallel = max_parallel or SYNC_OPTIONS.get('sync_max_parallel', 3)
+        self.stages = {name: STAGES[name] for name in (only or STAGES)}
+        self.status: Dict[str, str] = {name: PENDING for name in self.stages}
+        self.elapsed: Dict[str, float] = {}
+        
+        # Ejecución en proceso: sesiones (autenticación perezosa) y mapeos compartidos
+        self.in_process = SYNC_OPTIONS.get('sync_in_process', True) if in_process is None else in_process
+        self.source_session = SharedSession(ODOO_16, "Odoo 16 (VPS)")
+        self.target_session = SharedSession(ODOO_18, "Odoo 18 (Local)")
+        # Almacén local SQLite si está activado ('mapping_store'), si no caché en memoria
+        self.mapping_cache = default_mapping_cache() or MappingCache()
+        self.modules = {}
+        
+        # Política ante una etapa ya en curso en otra ejecución (None = config)
+        self.lock_policy = lock_policy
+
+    def deps_of(self, name: str) -> List[str]:
+        """Dependencias de una etapa dentro de las etapas seleccionadas"""
+        return [dep for dep in self.stages[name]['deps'] if dep in self.stages]
+
+    def load_module(self, name: str):
+        """Importa el módulo de una etapa y le agrega su archivo de log propio"""
+        if name not in self.modules:
+            stage = self.stages[name]
+            module = importlib.import_module(stage['script'][:-len('.py')])
+            handler = logging.FileHandler(stage['log'])
+            handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+            module.logger.addHandler(handler)
+            self.modules[name] = module
+        return self.modules[name]
+
+    def run_stage(self, name: str) -> str:
+        """Toma el bloqueo de la etapa y la ejecuta; devuelve su estado final"""
+        lock = StageLock(name, policy=self.lock_policy)
+        if not lock.acquire():
+            return SKIPPED
+        try:
+            if self.in_process:
+                return self.run_stage_in_process(name, lock)
+            return self.run_stage_subprocess(name)
+        finally:
+            lock.release()
+
+    def run_stage_in_process(self, name: str, lock: StageLock) -> str:
+        """Ejecuta la clase de una etapa con las sesiones y mapeos compartidos"""
+        stage = self.stages[name]
+        start = datetime.now()
+        logger.info(f"▶ Iniciando etapa {name} ({stage['entry']})")
+
+        shared = {
+            'source_session': self.source_session,
+            'target_session': self.target_session,
+            'mapping_cache': self.mapping_cache,
+            'lock': lock,
+        }
+
+        try:
+            entry = getattr(self.modules[name], stage['entry'])
+            accepted = inspect.signature(entry).parameters
+            result = entry(**{key: value for key, value in shared.items() if key in accepted})
+            if inspect.isclass(entry):
+                result.run()
+            return OK
+        except StopRequested as e:
+            logger.warning(f"🛑 {e}")
+            return STOPPED
+        except Exception as e:
+            logger.error(f"❌ Etapa {name}: {e}")
+            return FAILED
+        finally:
+            self.elapsed[name] = (datetime.now() - start).total_seconds()
+            # Los mapeos que creó la etapa se releen la próxima vez que se pidan
+            self.mapping_cache.invalidate(stage['writes'])
+
+    def run_stage_subprocess(self, name: str) -> str:
+        """Ejecuta el script de una etapa en un proceso aparte"""
+        script = os.path.join(SCRIPT_DIR, self.stages[name]['script'])
+        start = datetime.now()
+        logger.info(f"▶ Iniciando etapa {name} ({self.stages[name]['script']})")
+
+        # El bloqueo ya lo tiene este proceso: el script solo atiende pedidos de detención
+        env = dict(os.environ)
+        env[HELD_ENV] = ','.join(filter(None, [env.get(HELD_ENV), name]))
+
+        result = subprocess.run(
+            [sys.executable, script],
+            cwd=os.getcwd(),
+            env=env,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True
+        )
+
+        self.elapsed[name] = (datetime.now() - start).total_seconds()
+
+        # La salida completa de cada etapa queda en su propio .log; acá solo el final
+        tail = result.stdout.strip().splitlines()[-3:]
+        for line in tail:
+            logger.info(f"  [{name}] {line}")
+
+        if result.returncode == EXIT_STOPPED:
+            return STOPPED
+        return OK if result.returncode == 0 else FAILED
+
+    def skip_downstream(self, failed: str):
+        """Marca como omitidas todas las etapas que dependen (directa o indirectamente) de failed"""
+        unusable = (FAILED, SKIPPED, STOPPED)
+        changed = True
+        while changed:
+            changed = False
+            for name in self.stages:
+                if self.status[name] != PENDING:
+                    continue
+                if any(self.status[dep] in unusable for dep in self.deps_of(name)):
+                    self.status[name] = SKIPPED
+                    logger.warning(f"⏭ Etapa {name} omitida (depende de {failed})")
+                    changed = True
+
+    def ready_stages(self) -> List[str]:
+        """Etapas pendientes cuyas dependencias terminaron bien"""
+        return [
+            name for name in self.stages
+            if self.status[name] == PENDING
+            and all(self.status[dep] == OK for dep in self.deps_of(name))
+        ]
+
+    def run(self) -> bool:
+        """Ejecuta el grafo completo; devuelve False si alguna etapa falló"""
+        start_time = datetime.now()
+
+        logger.info("")
+        logger.info("╔" + "=" * 58 + "╗")
+        logger.info("║" + "SINCRONIZACIÓN COMPLETA".center(58) + "║")
+        logger.info("║" + "Odoo 16 → Odoo 18".center(58) + "║")
+        logger.info("╚" + "=" * 58 + "╝")
+        logger.info(f"Etapas: {', '.join(self.stages)} - Paralelismo: {self.max_parallel}"
+                    f" - {'en proceso' if self.in_process else 'procesos separados'}")
+
+        # Importar antes de abrir hilos (los módulos configuran logging al importarse)
+        if self.in_process:
+            for name in self.stages:
+                self.load_module(name)
+
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.max_parallel) as executor:
+            while True:
+                for name in self.ready_stages():
+                    if len(running) >= self.max_parallel:
+                        break
+                    self.status[name] = RUNNING
+                    running[executor.submit(self.run_stage, name)] = name
+
+                if not running:
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        status = future.result()
+                    except Exception as e:
+                        logger.error(f"❌ Etapa {name}: {e}")
+                        status = FAILED
+
+                    self.status[name] = status
+                    if status == OK:
+                        logger.info(f"✓ Etapa {name} completada ({self.elapsed.get(name, 0):.0f}s)")
+                    else:
+                        if status == FAILED:
+                            logger.error(f"❌ Etapa {name} falló")
+                        self.skip_downstream(name)
+
+        elapsed = datetime.now() - start_time
+        logger.info("")
+        logger.info("=" * 60)
+        logger.info("RESUMEN DE SINCRONIZACIÓN")
+        logger.info("=" * 60)
+        for name in self.stages:
+            seconds = f" ({self.elapsed[name]:.0f}s)" if name in self.elapsed else ""
+            logger.info(f"{name:<12} {self.status[name]}{seconds}")
+        logger.info(f"⏱ Tiempo total: {elapsed}")
+        logger.info("=" * 60)
+
+        # Etapas omitidas o detenidas por otra ejecución no cuentan como error
+        return FAILED not in self.status.values()
+
+
+class SyncScheduler(SyncOrchestrator):
+    """
+    Modo demonio: cada etapa corre con su propio intervalo
+    
+    Reutiliza las sesiones y la caché de mapeos del orquestador entre ticks
+    (solo se reautentica si se reinicia el proceso). Una etapa no arranca
+    mientras corre alguna de sus dependencias; si le toca un tick y todavía
+    está en curso, el tick se omite.
+    """
+
+    def __init__(self, max_parallel: int = None, only: List[str] = None, in_process: bool = None,
+                 lock_policy: str = None):
+        intervals = SYNC_OPTIONS.get('sync_daemon_intervals', {})
+        only = [name for name in (only or STAGES) if name in intervals]
+        if not only:
+            raise ValueError("Ninguna etapa tiene intervalo en 'sync_daemon_intervals'")
+        # Un tick nunca espera a otra ejecución salvo que se pida con --on-lock
+        super().__init__(max_parallel=max_parallel, only=only, in_process=in_process,
+                         lock_policy=lock_policy or 'skip')
+
+        self.intervals = {name: intervals[name] for name in self.stages}
+        self.jitter = SYNC_OPTIONS.get('sync_daemon_jitter', 0.1)
+        self.max_backoff = SYNC_OPTIONS.get('sync_daemon_max_backoff', 8)
+        self.cache_refresh = SYNC_OPTIONS.get('sync_daemon_cache_refresh', 3600)
+
+        now = time.time()
+        # Las etapas por intervalo corren al arrancar; las diarias, a su hora
+        self.next_due = {
+            name: self.next_daily(interval, now) if isinstance(interval, str) else now
+            for name, interval in self.intervals.items()
+        }
+        self.backoff = {name: 1 for name in self.stages}
+        self.stats = {name: {'runs': 0, 'failed': 0, 'skipped_ticks': 0} for name in self.stages}
+
+    @staticmethod
+    def next_daily(at: str, now: float) -> float:
+        """Próximo instante (timestamp) en que el reloj local marca HH:MM"""
+        hour, minute = (int(part) for part in at.split(':'))
+        current = datetime.fromtimestamp(now)
+        target = current.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        if target.timestamp() <= now:
+            target += timedelta(days=1)
+        return target.timestamp()
+
+    def interval_seconds(self, name: str) -> float:
+        """Duración nominal del intervalo de una etapa"""
+        interval = self.intervals[name]
+        return 86400.0 if isinstance(interval, str) else float(interval)
+
+    def schedule_next(self, name: str, now: float):
+        """Calcula el próximo tick de una etapa aplicando back-off y jitter"""
+        interval = self.interval_seconds(name)
+        spread = min(interval, 3600) * self.jitter
+        jitter = random.uniform(-spread, spread)
+
+        if not isinstance(self.intervals[name], str):
+            self.next_due[name] = now + interval * self.backoff[name] + jitter
+        elif self.backoff[name] == 1:
+            # Diaria: a su hora, solo con jitter positivo para no adelantarse
+            self.next_due[name] = self.next_daily(self.intervals[name], now) + abs(jitter)
+        else:
+            # Diaria que falló o tardó: reintento por horas en lugar de esperar días
+            self.next_due[name] = now + 3600 * self.backoff[name] + abs(jitter)
+
+    def finish_stage(self, name: str, status: str, started: float):
+        """Actualiza estado, estadísticas y back-off al terminar una etapa"""
+        elapsed = time.time() - started
+        self.status[name] = status
+        if status in (SKIPPED, STOPPED):
+            # Otra ejecución tenía la etapa o pidió detenerla: no es lentitud ni error
+            self.stats[name]['skipped_ticks'] += 1
+            return
+        ok = status == OK
+        self.stats[name]['runs'] += 1
+
+        slow = elapsed > self.interval_seconds(name)
+        if ok and not slow:
+            if self.backoff[name] > 1:
+                logger.info(f"✓ Etapa {name} normalizada, intervalo restablecido")
+            self.backoff[name] = 1
+        else:
+            if not ok:
+                self.stats[name]['failed'] += 1
+            self.backoff[name] = min(self.backoff[name] * 2, self.max_backoff)
+            reason = "falló" if not ok else f"tardó {elapsed:.0f}s"
+            logger.warning(f"⚠ Etapa {name} {reason}: back-off x{self.backoff[name]}")
+            # El próximo tick se corre desde ahora con el intervalo ampliado
+            self.schedule_next(name, time.time())
+
+        if ok:
+            logger.info(f"✓ Etapa {name} completada ({elapsed:.0f}s)")
+
+    def run(self) -> bool:
+        """Bucle del demonio; termina con Ctrl+C después de esperar las etapas en curso"""
+        logger.info("")
+        logger.info("╔" + "=" * 58 + "╗")
+        logger.info("║" + "SINCRONIZACIÓN - MODO DEMONIO".center(58) + "║")
+        logger.info("║" + "Odoo 16 → Odoo 18".center(58) + "║")
+        logger.info("╚" + "=" * 58 + "╝")
+        for name, interval in self.intervals.items():
+            every = f"a las {interval}" if isinstance(interval, str) else f"cada {interval}s"
+            logger.info(f"  {name:<12} {every}")
+
+        if self.in_process:
+            for name in self.stages:
+                self.load_module(name)
+
+        running = {}
+        started = {}
+        cache_loaded_at = time.time()
+        executor = ThreadPoolExecutor(max_workers=self.max_parallel)
+
+        try:
+            while True:
+                now = time.time()
+
+                # Relectura periódica de mapeos (cambios hechos fuera del demonio)
+                if not running and now - cache_loaded_at > self.cache_refresh:
+                    self.mapping_cache.invalidate()
+                    cache_loaded_at = now
+
+                for name in self.stages:
+                    if now < self.next_due[name]:
+                        continue
+
+                    if self.status[name] == RUNNING:
+                        self.stats[name]['skipped_ticks'] += 1
+                        logger.warning(f"⏭ Etapa {name} sigue en curso: tick omitido")
+                        self.schedule_next(name, now)
+                        continue
+
+                    # Esperar (sin encolar) a que terminen sus dependencias o haya lugar
+                    if any(self.status[dep] == RUNNING for dep in self.deps_of(name)):
+                        continue
+                    if len(running) >= self.max_parallel:
+                        continue
+
+                    self.status[name] = RUNNING
+                    started[name] = now
+                    self.schedule_next(name, now)
+                    running[executor.submit(self.run_stage, name)] = name
+
+                # Despertar al terminar una etapa o al próximo tick (máximo 1s)
+                timeout = max(0.05, min(1.0, min(self.next_due.values()) - time.time()))
+                if running:
+                    done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+                else:
+                    done = set()
+                    time.sleep(timeout)
+
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        status = future.result()
+                    except Exception as e:
+                        logger.error(f"❌ Etapa {name}: {e}")
+                        status = FAILED
+                    self.finish_stage(name, status, started.pop(name))
+
+        except KeyboardInterrupt:
+            logger.info("\n⚠ Deteniendo demonio: esperando etapas en curso...")
+        finally:
+            executor.shutdown(wait=True)
+
+        logger.info("")
+        logger.info("=" * 60)
+        logger.info("RESUMEN DEL DEMONIO")
+        logger.info("=" * 60)
+        for name, stats in self.stats.items():
+            logger.info(f"{name:<12} ejecuciones: {stats['runs']} - errores: {stats['failed']}"
+                        f" - ticks omitidos: {stats['skipped_ticks']}")
+        logger.info("=" * 60)
+        return True
+
+
+def parse_args(argv: List[str]) -> Dict:
+    """Lee --max-parallel N, --only a,b,c, --on-lock y --subprocess/--in-process (--daemon se lee aparte)"""
+    options = {'lock_policy': policy_from_argv(argv)}
+    if '--subprocess' in argv:
+        options['in_process'] = False
+    elif '--in-process' in argv:
+        options['in_process'] = True
+    if '--max-parallel' in argv:
+        options['max_parallel'] = int(argv[argv.index('--max-parallel') + 1])
+    if '--only' in argv:
+        only = argv[argv.index('--only') + 1].split(',')
+        unknown = [name for name in only if name not in STAGES]
+        if unknown:
+            raise ValueError(f"Etapas desconocidas: {', '.join(unknown)}")
+        options['only'] = only
+    return options
+
+
+if __name__ == "__main__":
+    try:
+        orchestrator_class = SyncScheduler if '--daemon' in sys.argv else SyncOrchestrator
+        orchestrator = orchestrator_class(**parse_args(sys.argv[1:]))
+        sys.exit(0 if orchestrator.run() else 1)
+    except KeyboardInterrupt:
+        logger.info("\n⚠ Sincronización interrumpida por el usuario")
+        sys.exit(0)
+    except Exception as e:
+        logger.error(f"❌ Error fatal: {e}")
+        sys.exit(1)
@@ -6,7 +6,7 @@ import sys
 import os
 
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
-from config import ODOO_16, ODOO_18
+from config import ODOO_16, ODOO_18, SYNC_OPTIONS
 
 logging.basicConfig(
     level=logging.INFO,
@@ -19,12 +19,23 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
+from sync_lock import StageLock, StopRequested, EXIT_STOPPED, policy_from_argv
+from sync_session import source_map_from_rows
+from sync_mapping_store import default_mapping_cache
+from sync_snapshot import source_snapshot
+
 
 class Odoo:
-    def __init__(self, cfg, name):
+    def __init__(self, cfg, name, session=None):
         self.cfg = cfg
         self.name = name
 
+        if session:
+            # Sesión compartida (sync_all.py en proceso): sin autenticar de nuevo
+            self.uid = session.uid
+            self.models = session.models
+            return
+
         common = xmlrpc.client.ServerProxy(f"{cfg['url']}/xmlrpc/2/common")
         self.uid = common.authenticate(
             cfg["db"], cfg["username"], cfg["password"], {}
@@ -38,6 +49,17 @@ class Odoo:
 
         logger.info(f"✓ {name} conectado ({common.version()['server_version']})")
 
+    def execute(self, model, method, *args, **kwargs):
+        return self.models.execute_kw(
+            self.cfg["db"],
+            self.uid,
+            self.cfg["password"],
+            model,
+            method,
+            list(args),
+            kwargs
+        )
+
     def search_read(self, model, domain, fields):
         return self.models.execute_kw(
             self.cfg["db"],
@@ -61,90 +83,195 @@ class Odoo:
         )
 
 
-def run():
-    o16 = Odoo(ODOO_16, "Odoo 16")
-    o18 = Odoo(ODOO_18, "Odoo 18")
+def chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def reactivate_products(o18, to_reactivate):
+    """
+    Reactiva variantes (product_id, template_id) y sus templates archivados
+
+    Reactivar un template en Odoo reactiva todas sus variantes: las que
+    estaban archivadas y no se pidieron se vuelven a archivar, de modo que
+    solo cambian las variantes indicadas.
+    """
+    variant_ids = {pid for pid, _ in to_reactivate}
+    tmpl_ids = sorted({t for _, t in to_reactivate if t})
+    if tmpl_ids:
+        tmpl_ids = [
+            t["id"] for t in o18.search_read(
+                "product.template", [("id", "in", tmpl_ids), ("active", "=", False)], ["id"]
+            )
+        ]
+
+    keep_archived = []
+    if tmpl_ids:
+        keep_archived = [
+            p["id"] for p in o18.search_read(
+                "product.product",
+                [("product_tmpl_id", "in", tmpl_ids), ("active", "=", False)],
+                ["id"]
+            )
+            if p["id"] not in variant_ids
+        ]
+        o18.write("product.template", tmpl_ids, {"active": True})
+
+    o18.write("product.product", sorted(variant_ids), {"active": True})
+    if keep_archived:
+        o18.write("product.product", keep_archived, {"active": False})
+
+
+def run(source_session=None, target_session=None, mapping_cache=None, lock=None):
+    o16 = Odoo(ODOO_16, "Odoo 16", session=source_session)
+    o18 = Odoo(ODOO_18, "Odoo 18", session=target_session)
+
+    batch_size = SYNC_OPTIONS.get("archive_batch_size", 1000)
+    reactivate = SYNC_OPTIONS.get("archive_reactivate", False)
 
     logger.info("=" * 60)
     logger.info("SINCRONIZACIÓN DE ARCHIVADOS (Odoo 16 → Odoo 18)")
     logger.info("=" * 60)
 
-    mappings = o18.search_read(
-        "ir.model.data",
-        [
-            ("module", "=", "sync_script"),
-            ("model", "=", "product.product"),
-            ("name", "like", "sync_product_product_%"),
-        ],
-        ["name", "res_id"]
-    )
+    # Caché de sync_all.py o, si corre solo, el almacén local (sync_mapping_store.py)
+    if mapping_cache is None:
+        mapping_cache = default_mapping_cache()
 
-    logger.info(f"🔗 Productos sincronizados encontrados: {len(mappings)}")
+    if mapping_cache is not None:
+        product_map = mapping_cache.source_map(o18, "product.product", "sync_product_product_")
+    else:
+        product_map = source_map_from_rows(
+            o18.search_read(
+                "ir.model.data",
+                [
+                    ("module", "=", "sync_script"),
+                    ("model", "=", "product.product"),
+                    ("name", "=like", "sync_product_product_%"),
+                ],
+                ["name", "res_id"]
+            ),
+            "sync_product_product_"
+        )
+
+    logger.info(f"🔗 Productos sincronizados encontrados: {len(product_map)}")
+
+    # Estado activo desde la instantánea local (sync_snapshot.py) si está disponible
+    snapshot = source_snapshot("product.product", ["active"])
+    if snapshot is not None:
+        try:
+            snapshot.refresh(o16)
+        except Exception as e:
+            logger.warning(f"⚠ No se pudo usar la instantánea local ({e}), leyendo de Odoo 16")
+            snapshot = None
 
     checked = 0
     archived = 0
+    reactivated = 0
     skipped_missing = 0
+    errors = 0
 
-    for m in mappings:
-        checked += 1
+    # Por lote: 1 lectura en cada servidor y 1 write agrupado por acción
+    for source_ids in chunks(sorted(product_map), batch_size):
+        if lock:
+            lock.check_stop()
+        checked += len(source_ids)
 
         try:
-            source_id = int(m["name"].replace("sync_product_product_", ""))
-        except Exception:
-            continue
-
-        # Estado en Odoo 16
-        src = o16.search_read(
-            "product.product",
-            [("id", "=", source_id)],
-            ["active"]
-        )
+            # Estado en Odoo 16 (incluye archivados)
+            if snapshot is not None:
+                src_active = {
+                    source_id: p["active"]
+                    for source_id, p in snapshot.rows(source_ids, ["active"]).items()
+                }
+            else:
+                src_active = {
+                    p["id"]: p["active"]
+                    for p in o16.search_read(
+                        "product.product", [("id", "in", source_ids)], ["active"]
+                    )
+                }
 
-        if not src or src[0]["active"] is not False:
-            continue
+            # 🔐 EXISTENCIA, ESTADO Y TEMPLATE EN ODOO 18
+            target_ids = [product_map[sid] for sid in source_ids]
+            targets = {
+                p["id"]: p
+                for p in o18.search_read(
+                    "product.product",
+                    [("id", "in", target_ids)],
+                    ["active", "product_tmpl_id"]
+                )
+            }
 
-        product_18_id = m["res_id"]
+            to_archive = []
+            to_reactivate = []
 
-        # 🔐 VERIFICAR EXISTENCIA EN ODOO 18
-        exists = o18.search_read(
-            "product.product",
-            [("id", "=", product_18_id)],
-            ["id"]
-        )
+            for sid in source_ids:
+                if sid not in src_active:
+                    continue
 
-        if not exists:
-            skipped_missing += 1
-            continue
+                target = targets.get(product_map[sid])
+                if not target:
+                    skipped_missing += 1
+                    continue
 
-        # Archivar producto
-        o18.write(
-            "product.product",
-            [product_18_id],
-            {"active": False}
-        )
+                tmpl_id = target["product_tmpl_id"][0] if target.get("product_tmpl_id") else None
 
-        # Archivar template
-        tmpl = o18.search_read(
-            "product.product",
-            [("id", "=", product_18_id)],
-            ["product_tmpl_id"]
-        )
+                if src_active[sid] is False:
+                    if target["active"]:
+                        to_archive.append((target["id"], tmpl_id))
+                elif reactivate and not target["active"]:
+                    to_reactivate.append((target["id"], tmpl_id))
 
-        if tmpl and tmpl[0].get("product_tmpl_id"):
-            o18.write(
-                "product.template",
-                [tmpl[0]["product_tmpl_id"][0]],
-                {"active": False}
-            )
+            if to_archive:
+                # Archivar productos y luego sus templates, salvo los que todavía
+                # tienen otras variantes activas (1 lectura para todo el lote)
+                o18.write("product.product", [pid for pid, _ in to_archive], {"active": False})
+                tmpl_ids = {t for _, t in to_archive if t}
+                if tmpl_ids:
+                    still_active = {
+                        p["product_tmpl_id"][0]
+                        for p in o18.search_read(
+                            "product.product",
+                            [("product_tmpl_id", "in", sorted(tmpl_ids)), ("active", "=", True)],
+                            ["product_tmpl_id"]
+                        )
+                    }
+                    tmpl_ids = sorted(tmpl_ids - still_active)
+                if tmpl_ids:
+                    o18.write("product.template", tmpl_ids, {"active": False})
+                archived += len(to_archive)
+
+            if to_reactivate:
+                reactivate_products(o18, to_reactivate)
+                reactivated += len(to_reactivate)
+        except Exception as e:
+            # Un lote con error no frena el resto: se revisa en la próxima ejecución
+            logger.error(f"❌ Error con lote de productos ({source_ids[0]}-{source_ids[-1]}): {e}")
+            errors += 1
 
-        archived += 1
+        logger.info(f"[{checked}/{len(product_map)}] Archivados: {archived} - Reactivados: {reactivated}")
 
     logger.info("=" * 60)
     logger.info(f"Revisados:                 {checked}")
     logger.info(f"Archivados en Odoo 18:     {archived}")
+    logger.info(f"Reactivados en Odoo 18:    {reactivated}")
     logger.info(f"IDs inexistentes en Odoo 18: {skipped_missing}")
+    logger.info(f"Lotes con error:           {errors}")
     logger.info("=" * 60)
 
+    # La etapa no debe figurar como exitosa en sync_all.py ni en el programador
+    if errors:
+        raise Exception(f"{errors} lotes de productos con error")
+
 
 if __name__ == "__main__":
-    run()
+    lock = StageLock("archived", policy=policy_from_argv(sys.argv))
+    if not lock.acquire():
+        sys.exit(0)
+    try:
+        run(lock=lock)
+    except StopRequested as e:
+        logger.warning(f"🛑 {e}")
+        sys.exit(EXIT_STOPPED)
+    finally:
+        lock.release()
@@ -0,0 +1,263 @@
+"""
+Carga masiva en Odoo 18 con load() y external_id
+
+El camino habitual crea cada registro y después su fila de ir.model.data:
+dos llamadas (o dos create múltiples) por lote y, si la segunda falla, un
+registro huérfano que la próxima ejecución vuelve a crear. load(fields,
+rows) de Odoo crea o actualiza por external_id en una sola llamada y en una
+sola transacción:
+
+    - La columna 'id' lleva el external_id (sync_script.<nombre>): si existe
+      se actualiza el registro, si no (o si apunta a un registro borrado)
+      se crea junto con su ir.model.data.
+    - Los vals de prepare_values se serializan como texto. Los many2one y
+      many2many con IDs de Odoo 18 van en columnas '<campo>/.id'; una
+      ExternalRef va en '<campo>/id' y puede apuntar a un registro creado
+      antes en el mismo load (ej: la categoría padre).
+    - Los registros se agrupan por conjunto de campos: un campo ausente en
+      los vals no se manda vacío (no se borra en Odoo 18).
+
+Si load devuelve errores no se guarda nada del lote: los mensajes traen el
+índice de la fila, se traducen al ID de Odoo 16, esas filas se apartan y
+el resto se vuelve a cargar. Un error sin fila (o una excepción de XML-RPC)
+parte el lote en mitades hasta aislar el registro.
+
+Cada cargador mide registros y segundos de escritura (WriteTimer, también
+usado por el camino create/write) para comparar ambos modos en el resumen
+de cada etapa. Se activa con 'bulk_load' o con --bulk-load.
+"""
+
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+from config import SYNC_OPTIONS
+
+MODULE = 'sync_script'
+
+
+class ExternalRef(str):
+    """Referencia 'módulo.nombre' para una columna relacional '<campo>/id'"""
+
+
+def external_ref(name: str) -> ExternalRef:
+    """Referencia a un external_id del módulo sync_script"""
+    return ExternalRef(f"{MODULE}.{name}")
+
+
+def bulk_load_enabled() -> bool:
+    """True si las etapas deben escribir con load()"""
+    return bool(SYNC_OPTIONS.get('bulk_load', False))
+
+
+def bulk_loader(connection, model: str, mapping_cache=None, timer=None):
+    """Cargador del modelo (None si 'bulk_load' está desactivado)"""
+    if bulk_load_enabled():
+        return BulkLoader(connection, model, mapping_cache=mapping_cache, timer=timer)
+    return None
+
+
+class LoadError(Exception):
+    """Error informado por load() para una fila"""
+
+
+class WriteTimer:
+    """Registros escritos y segundos de escritura, para medir el rendimiento de un modo"""
+
+    def __init__(self, mode: str):
+        self.mode = mode
+        self.records = 0
+        self.seconds = 0.0
+        self.calls = 0
+
+    @contextmanager
+    def measure(self, records: int = 1):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds += time.perf_counter() - start
+            self.records += records
+            self.calls += 1
+
+    def summary(self) -> str:
+        rate = self.records / self.seconds if self.seconds else 0.0
+        return (f"{self.mode}: {self.records} registros en {self.seconds:.1f} s "
+                f"({rate:.1f} reg/s, {self.calls} llamadas)")
+
+
+class BulkLoader:
+    """Crea o actualiza registros de un modelo con load(), identificados por external_id"""
+
+    def __init__(self, connection, model: str, mapping_cache=None, batch_size: int = None,
+                 timer: WriteTimer = None):
+        self.connection = connection
+        self.model = model
+        self.mapping_cache = mapping_cache
+        self.batch_size = batch_size or SYNC_OPTIONS.get('bulk_load_batch_size', 200)
+        # Puede compartirse entre los cargadores de una etapa
+        self.timer = timer or WriteTimer('load()')
+        self._field_types: Optional[Dict[str, str]] = None
+
+    # ========================================
+    # SERIALIZACIÓN DE VALS
+    # ========================================
+
+    def field_types(self) -> Dict[str, str]:
+        """Tipo de cada campo del modelo en Odoo 18 (una llamada por cargador)"""
+        if self._field_types is None:
+            described = self.connection.execute(self.model, 'fields_get', attributes=['type'])
+            self._field_types = {field: spec['type'] for field, spec in described.items()}
+        return self._field_types
+
+    @staticmethod
+    def command_ids(value) -> List[int]:
+        """IDs de un many2many escrito como comandos ((6, 0, ids), (4, id)) o como lista de IDs"""
+        ids = []
+        for command in value or []:
+            if isinstance(command, int):
+                ids.append(command)
+            elif command[0] == 6:
+                ids = list(command[2])
+            elif command[0] == 4:
+                ids.append(command[1])
+            elif command[0] == 5:
+                ids = []
+            else:
+                raise ValueError(f"comando many2many {command[0]} no soportado por load()")
+        return ids
+
+    def columns(self, vals: Dict) -> Dict[str, str]:
+        """Columnas de load() ({columna: texto}) para unos vals de create/write"""
+        types = self.field_types()
+        row = {}
+        for field, value in vals.items():
+            field_type = types.get(field)
+            if field_type is None:
+                raise ValueError(f"campo {field} inexistente en {self.model}")
+
+            if field_type == 'many2one':
+                if isinstance(value, ExternalRef):
+                    row[f"{field}/id"] = str(value)
+                else:
+                    row[f"{field}/.id"] = str(value) if value else ''
+            elif field_type == 'many2many':
+                row[f"{field}/.id"] = ','.join(str(i) for i in self.command_ids(value))
+            elif field_type == 'one2many':
+                raise ValueError(f"campo one2many {field} no soportado por load()")
+            elif field_type == 'boolean':
+                row[field] = '1' if value else '0'
+            elif value is False or value is None:
+                row[field] = ''
+            else:
+                row[field] = str(value)
+        return row
+
+    # ========================================
+    # CARGA
+    # ========================================
+
+    def load(self, records: List[Tuple[int, str, Dict, Optional[int]]], ordered: bool = False
+             ) -> Tuple[Dict[int, int], Dict[int, Exception]]:
+        """
+        Crea o actualiza registros con load(), por lotes
+
+        Args:
+            records: (ID de Odoo 16, nombre del external_id, vals, ID de Odoo 18 conocido o None)
+            ordered: respetar el orden de records (ExternalRef a filas anteriores,
+                     ej: padres antes que hijos); solo se agrupan filas consecutivas
+
+        Returns:
+            ({ID de Odoo 16: ID de Odoo 18} cargados, {ID de Odoo 16: error} fallidos)
+        """
+        loaded: Dict[int, int] = {}
+        failed: Dict[int, Exception] = {}
+
+        # Un load por conjunto de columnas: lo que no está en vals no se toca
+        groups: List[Tuple[Tuple[str, ...], List[Tuple[int, str, Dict[str, str]]]]] = []
+        by_fields: Dict[Tuple[str, ...], List[Tuple[int, str, Dict[str, str]]]] = {}
+        for source_id, name, vals, _ in records:
+            try:
+                row = self.columns(vals)
+            except Exception as e:
+                failed[source_id] = e
+                continue
+            fields = tuple(sorted(row))
+            if ordered:
+                if not groups or groups[-1][0] != fields:
+                    groups.append((fields, []))
+                groups[-1][1].append((source_id, name, row))
+            else:
+                if fields not in by_fields:
+                    by_fields[fields] = []
+                    groups.append((fields, by_fields[fields]))
+                by_fields[fields].append((source_id, name, row))
+
+        for fields, rows in groups:
+            for i in range(0, len(rows), self.batch_size):
+                self.load_rows(['id', *fields], rows[i:i + self.batch_size], loaded, failed)
+
+        self.remember_external_ids(records, loaded)
+        return loaded, failed
+
+    def load_rows(self, fields: List[str], rows: List[Tuple[int, str, Dict[str, str]]],
+                  loaded: Dict[int, int], failed: Dict[int, Exception]):
+        """Carga un lote; aparta las filas con error y reintenta el resto"""
+        while rows:
+            data = [[f"{MODULE}.{name}"] + [row[field] for field in fields[1:]]
+                    for _, name, row in rows]
+            try:
+                # Solo cuentan como cargadas las filas de un load exitoso
+                with self.timer.measure(0):
+                    result = self.connection.execute(self.model, 'load', fields, data)
+            except Exception as e:
+                result = {'ids': False, 'messages': [{'type': 'error', 'message': str(e)}]}
+
+            if result.get('ids'):
+                loaded.update(zip([source_id for source_id, _, _ in rows], result['ids']))
+                self.timer.records += len(rows)
+                return
+
+            # Errores por fila: se apartan y el resto se carga de nuevo
+            errors = {}
+            for message in result.get('messages', []):
+                index = message.get('record', (message.get('rows') or {}).get('from'))
+                if message.get('type') == 'error' and index is not None and 0 <= index < len(rows):
+                    errors.setdefault(index, message['message'])
+
+            if errors:
+                for index, message in errors.items():
+                    failed[rows[index][0]] = LoadError(message)
+                rows = [row for index, row in enumerate(rows) if index not in errors]
+                continue
+
+            # Error sin fila: mitades hasta aislar el registro
+            message = '; '.join(m.get('message', '') for m in result.get('messages', [])) \
+                or 'load() no devolvió IDs'
+            if len(rows) == 1:
+                failed[rows[0][0]] = LoadError(message)
+                return
+            middle = len(rows) // 2
+            self.load_rows(fields, rows[:middle], loaded, failed)
+            rows = rows[middle:]
+
+    def remember_external_ids(self, records: List[Tuple[int, str, Dict, Optional[int]]],
+                              loaded: Dict[int, int]):
+        """Registra en la caché de mapeos los external_id creados o reapuntados por load()"""
+        if self.mapping_cache is None:
+            return
+        names = [name for source_id, name, _, known_id in records
+                 if source_id in loaded and loaded[source_id] != known_id]
+        if not names:
+            return
+        try:
+            rows = self.connection.execute(
+                'ir.model.data', 'search_read',
+                [('module', '=', MODULE), ('model', '=', self.model), ('name', 'in', names)],
+                fields=['name', 'res_id']
+            )
+        except Exception:
+            # Los registros ya quedaron cargados: la caché se verifica en el próximo uso
+            self.mapping_cache.invalidate([self.model])
+            return
+        self.mapping_cache.record(self.model, rows)
@@ -12,12 +12,13 @@ Respeta la jerarquía padre-hijo
 
 Uso:
     python3 sync_categories.py
+    python3 sync_categories.py --bulk-load   (escribe con load() por lotes)
 """
 
 import xmlrpc.client
 import logging
 from datetime import datetime
-from typing import Dict, List, Set
+from typing import Dict, List, Set, Tuple
 import sys
 import os
 
@@ -46,16 +47,27 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+from sync_lock import StageLock, StopRequested, EXIT_STOPPED, policy_from_argv
+from sync_mapping_store import default_mapping_cache
+from sync_hash_store import default_hash_store, vals_hash
+from sync_bulk_load import bulk_load_enabled, bulk_loader, external_ref, WriteTimer
+
 
 class OdooConnection:
     """Maneja la conexión a una instancia de Odoo"""
     
-    def __init__(self, config: Dict, name: str):
+    def __init__(self, config: Dict, name: str, session=None):
         self.config = config
         self.name = name
         self.uid = None
         self.models = None
-        self.connect()
+        
+        if session:
+            # Sesión compartida (sync_all.py en proceso): sin autenticar de nuevo
+            self.uid = session.uid
+            self.models = session.models
+        else:
+            self.connect()
     
     def connect(self):
         """Establece la conexión con Odoo"""
@@ -136,19 +148,37 @@ class OdooConnection:
 class CategorySync:
     """Sincroniza categorías entre dos instancias de Odoo"""
     
-    def __init__(self):
-        self.source = OdooConnection(ODOO_16, "Odoo 16 (VPS)")
-        self.target = OdooConnection(ODOO_18, "Odoo 18 (Local)")
+    def __init__(self, source_session=None, target_session=None, mapping_cache=None, lock=None):
+        self.source = OdooConnection(ODOO_16, "Odoo 16 (VPS)", session=source_session)
+        self.target = OdooConnection(ODOO_18, "Odoo 18 (Local)", session=target_session)
+        
+        # Mapeos de ir.model.data compartidos entre etapas (sync_all.py en
+        # proceso) o, si el script corre solo, el almacén local (sync_mapping_store.py)
+        self.mapping_cache = mapping_cache if mapping_cache is not None else default_mapping_cache()
+        
+        # Bloqueo de la etapa (sync_lock.py): entre tipos de categoría se
+        # revisa si otra invocación pidió detenerla
+        self.lock = lock
         
         # Mapeo de IDs (source_id -> target_id) para cada tipo
         self.product_category_map = {}
         self.pos_category_map = {}
         self.public_category_map = {}
         
+        # Huellas de los últimos vals enviados: las categorías que no
+        # cambiaron no se escriben (sync_hash_store.py)
+        self.hash_store = default_hash_store()
+        
+        # Carga masiva con load() (sync_bulk_load.py): las categorías de cada
+        # modelo se acumulan y se cargan juntas, padres antes que hijos
+        self.bulk_load = bulk_load_enabled()
+        self.pending: Dict[str, Dict[int, Tuple[str, Dict, int, str]]] = {}
+        self.write_timer = WriteTimer('load()' if self.bulk_load else 'create/write')
+        
         self.stats = {
-            'product_categories': {'total': 0, 'created': 0, 'updated': 0, 'errors': 0},
-            'pos_categories': {'total': 0, 'created': 0, 'updated': 0, 'errors': 0},
-            'public_categories': {'total': 0, 'created': 0, 'updated': 0, 'errors': 0}
+            'product_categories': {'total': 0, 'created': 0, 'updated': 0, 'unchanged': 0, 'errors': 0},
+            'pos_categories': {'total': 0, 'created': 0, 'updated': 0, 'unchanged': 0, 'errors': 0},
+            'public_categories': {'total': 0, 'created': 0, 'updated': 0, 'unchanged': 0, 'errors': 0}
         }
     
     def get_external_id(self, model: str, source_id: int) -> str:
@@ -159,6 +189,9 @@ class CategorySync:
     def find_existing_record(self, model: str, external_id: str) -> int:
         """Busca si el registro ya existe en Odoo 18"""
         try:
+            if self.mapping_cache is not None:
+                return self.mapping_cache.lookup(self.target, model, external_id)
+            
             existing = self.target.search(
                 'ir.model.data',
                 [
@@ -184,15 +217,100 @@ class CategorySync:
     def create_external_id(self, model: str, external_id: str, record_id: int):
         """Crea un external_id en Odoo 18"""
         try:
-            self.target.create('ir.model.data', {
+            xmlid_id = self.target.create('ir.model.data', {
                 'name': external_id,
                 'model': model,
                 'module': 'sync_script',
                 'res_id': record_id
             })
+            if self.mapping_cache is not None:
+                self.mapping_cache.record(model, [{'id': xmlid_id, 'name': external_id, 'res_id': record_id}])
         except Exception as e:
             logger.error(f"Error creando external_id: {e}")
     
+    def push_category(self, model: str, stats_key: str, category_map: Dict[int, int],
+                      source_id: int, vals: Dict):
+        """Crea o actualiza una categoría (sin escribir si sus vals no cambiaron desde el último envío)"""
+        external_id = self.get_external_id(model, source_id)
+        existing_id = self.find_existing_record(model, external_id)
+        digest = vals_hash(vals)
+        
+        if existing_id and self.hash_store and \
+                self.hash_store.get(model, source_id) == (digest, existing_id):
+            self.stats[stats_key]['unchanged'] += 1
+            category_map[source_id] = existing_id
+            return
+        
+        if self.bulk_load:
+            # Se carga con el resto del modelo (flush_categories)
+            self.pending.setdefault(model, {})[source_id] = (external_id, vals, existing_id, digest)
+            return
+        
+        with self.write_timer.measure():
+            if existing_id:
+                # Actualizar
+                self.target.write(model, [existing_id], vals)
+                self.stats[stats_key]['updated'] += 1
+            else:
+                # Crear
+                existing_id = self.target.create(model, vals)
+                self.create_external_id(model, external_id, existing_id)
+                self.stats[stats_key]['created'] += 1
+        
+        category_map[source_id] = existing_id
+        if self.hash_store:
+            self.hash_store.save(model, [(source_id, existing_id, digest)])
+    
+    def flush_categories(self, model: str, stats_key: str, category_map: Dict[int, int]):
+        """Carga con load() las categorías acumuladas del modelo, en orden jerárquico"""
+        pending = self.pending.pop(model, {})
+        if not pending:
+            return
+        
+        # Por nivel (padres antes que hijos) y dentro del nivel por campos:
+        # pocas llamadas a load() sin romper las referencias al padre
+        source_by_ref = {external_ref(external_id): source_id
+                         for source_id, (external_id, _, _, _) in pending.items()}
+        level = {}
+        for source_id, (_, vals, _, _) in pending.items():
+            parent = source_by_ref.get(vals.get('parent_id'))
+            level[source_id] = level[parent] + 1 if parent in level else 0
+        records = sorted(
+            ((source_id, external_id, vals, existing_id)
+             for source_id, (external_id, vals, existing_id, _) in pending.items()),
+            key=lambda record: (level[record[0]], sorted(record[2]))
+        )
+        
+        loader = bulk_loader(self.target, model, self.mapping_cache, timer=self.write_timer)
+        try:
+            loaded, failed = loader.load(records, ordered=True)
+        except Exception as e:
+            loaded, failed = {}, {source_id: e for source_id in pending}
+        
+        pushed = []
+        for source_id, (_, vals, existing_id, digest) in pending.items():
+            if source_id in failed:
+                logger.error(f"❌ Error con categoría {vals['name']}: {failed[source_id]}")
+                self.stats[stats_key]['errors'] += 1
+            elif source_id in loaded:
+                self.stats[stats_key]['updated' if loaded[source_id] == existing_id else 'created'] += 1
+                category_map[source_id] = loaded[source_id]
+                pushed.append((source_id, loaded[source_id], digest))
+        
+        if self.hash_store:
+            self.hash_store.save(model, pushed)
+        logger.info(f"⚡ Cargadas con load(): {len(pushed)} categorías, {len(failed)} con error")
+    
+    def parent_value(self, model: str, category_map: Dict[int, int], parent_source_id: int):
+        """
+        Categoría padre en Odoo 18: su ID o, con carga masiva, su external_id
+        (así el padre puede crearse en el mismo load que el hijo)
+        """
+        if self.bulk_load and (parent_source_id in category_map
+                               or parent_source_id in self.pending.get(model, {})):
+            return external_ref(self.get_external_id(model, parent_source_id))
+        return category_map.get(parent_source_id)
+    
     def order_categories_by_hierarchy(self, categories: List[Dict]) -> List[Dict]:
         """Ordena categorías para sincronizar primero padres, luego hijos"""
         ordered = []
@@ -254,6 +372,8 @@ class CategorySync:
             for i, category in enumerate(ordered_categories, 1):
                 logger.info(f"[{i}/{len(ordered_categories)}] Procesando: {category.get('complete_name', category['name'])}")
                 self.sync_product_category(category)
+            
+            self.flush_categories('product.category', 'product_categories', self.product_category_map)
                 
         except Exception as e:
             logger.error(f"❌ Error sincronizando categorías de productos: {e}")
@@ -262,7 +382,6 @@ class CategorySync:
         """Sincroniza una categoría de producto individual"""
         source_id = category['id']
         category_name = category['name']
-        external_id = self.get_external_id('product.category', source_id)
         
         try:
             # Preparar valores
@@ -275,24 +394,12 @@ class CategorySync:
             if parent_id and isinstance(parent_id, (list, tuple)):
                 parent_source_id = parent_id[0]
                 # Buscar el ID del padre en Odoo 18
-                parent_target_id = self.product_category_map.get(parent_source_id)
+                parent_target_id = self.parent_value('product.category', self.product_category_map,
+                                                     parent_source_id)
                 if parent_target_id:
                     vals['parent_id'] = parent_target_id
             
-            # Buscar si existe
-            existing_id = self.find_existing_record('product.category', external_id)
-            
-            if existing_id:
-                # Actualizar
-                self.target.write('product.category', [existing_id], vals)
-                self.stats['product_categories']['updated'] += 1
-                self.product_category_map[source_id] = existing_id
-            else:
-                # Crear
-                new_id = self.target.create('product.category', vals)
-                self.create_external_id('product.category', external_id, new_id)
-                self.stats['product_categories']['created'] += 1
-                self.product_category_map[source_id] = new_id
+            self.push_category('product.category', 'product_categories', self.product_category_map, source_id, vals)
                 
         except Exception as e:
             logger.error(f"❌ Error con categoría {category_name}: {e}")
@@ -331,6 +438,8 @@ class CategorySync:
             for i, category in enumerate(ordered_categories, 1):
                 logger.info(f"[{i}/{len(ordered_categories)}] Procesando: {category['name']}")
                 self.sync_pos_category(category)
+            
+            self.flush_categories('pos.category', 'pos_categories', self.pos_category_map)
                 
         except Exception as e:
             logger.error(f"❌ Error sincronizando categorías de POS: {e}")
@@ -339,7 +448,6 @@ class CategorySync:
         """Sincroniza una categoría de POS individual"""
         source_id = category['id']
         category_name = category['name']
-        external_id = self.get_external_id('pos.category', source_id)
         
         try:
             # Preparar valores
@@ -351,24 +459,12 @@ class CategorySync:
             parent_id = category.get('parent_id')
             if parent_id and isinstance(parent_id, (list, tuple)):
                 parent_source_id = parent_id[0]
-                parent_target_id = self.pos_category_map.get(parent_source_id)
+                parent_target_id = self.parent_value('pos.category', self.pos_category_map,
+                                                     parent_source_id)
                 if parent_target_id:
                     vals['parent_id'] = parent_target_id
             
-            # Buscar si existe
-            existing_id = self.find_existing_record('pos.category', external_id)
-            
-            if existing_id:
-                # Actualizar
-                self.target.write('pos.category', [existing_id], vals)
-                self.stats['pos_categories']['updated'] += 1
-                self.pos_category_map[source_id] = existing_id
-            else:
-                # Crear
-                new_id = self.target.create('pos.category', vals)
-                self.create_external_id('pos.category', external_id, new_id)
-                self.stats['pos_categories']['created'] += 1
-                self.pos_category_map[source_id] = new_id
+            self.push_category('pos.category', 'pos_categories', self.pos_category_map, source_id, vals)
                 
         except Exception as e:
             logger.error(f"❌ Error con categoría POS {category_name}: {e}")
@@ -407,6 +503,8 @@ class CategorySync:
             for i, category in enumerate(ordered_categories, 1):
                 logger.info(f"[{i}/{len(ordered_categories)}] Procesando: {category['name']}")
                 self.sync_public_category(category)
+            
+            self.flush_categories('product.public.category', 'public_categories', self.public_category_map)
                 
         except Exception as e:
             logger.error(f"❌ Error sincronizando categorías públicas: {e}")
@@ -415,7 +513,6 @@ class CategorySync:
         """Sincroniza una categoría pública individual"""
         source_id = category['id']
         category_name = category['name']
-        external_id = self.get_external_id('product.public.category', source_id)
         
         try:
             # Preparar valores
@@ -431,24 +528,12 @@ class CategorySync:
             parent_id = category.get('parent_id')
             if parent_id and isinstance(parent_id, (list, tuple)):
                 parent_source_id = parent_id[0]
-                parent_target_id = self.public_category_map.get(parent_source_id)
+                parent_target_id = self.parent_value('product.public.category', self.public_category_map,
+                                                     parent_source_id)
                 if parent_target_id:
                     vals['parent_id'] = parent_target_id
             
-            # Buscar si existe
-            existing_id = self.find_existing_record('product.public.category', external_id)
-            
-            if existing_id:
-                # Actualizar
-                self.target.write('product.public.category', [existing_id], vals)
-                self.stats['public_categories']['updated'] += 1
-                self.public_category_map[source_id] = existing_id
-            else:
-                # Crear
-                new_id = self.target.create('product.public.category', vals)
-                self.create_external_id('product.public.category', external_id, new_id)
-                self.stats['public_categories']['created'] += 1
-                self.public_category_map[source_id] = new_id
+            self.push_category('product.public.category', 'public_categories', self.public_category_map, source_id, vals)
                 
         except Exception as e:
             logger.error(f"❌ Error con categoría pública {category_name}: {e}")
@@ -467,9 +552,12 @@ class CategorySync:
         
         try:
             # Sincronizar cada tipo de categoría
-            self.sync_product_categories()
-            self.sync_pos_categories()
-            self.sync_public_categories()
+            for sync_type in (self.sync_product_categories,
+                              self.sync_pos_categories,
+                              self.sync_public_categories):
+                if self.lock:
+                    self.lock.check_stop()
+                sync_type()
             
             # Resumen
             elapsed = datetime.now() - start_time
@@ -483,21 +571,25 @@ class CategorySync:
             logger.info(f"   Total:        {self.stats['product_categories']['total']}")
             logger.info(f"   ✓ Creadas:    {self.stats['product_categories']['created']}")
             logger.info(f"   ✓ Actualizadas: {self.stats['product_categories']['updated']}")
+            logger.info(f"   = Sin cambios: {self.stats['product_categories']['unchanged']}")
             logger.info(f"   ❌ Errores:    {self.stats['product_categories']['errors']}")
             
             logger.info("\n🏪 CATEGORÍAS DE POS:")
             logger.info(f"   Total:        {self.stats['pos_categories']['total']}")
             logger.info(f"   ✓ Creadas:    {self.stats['pos_categories']['created']}")
             logger.info(f"   ✓ Actualizadas: {self.stats['pos_categories']['updated']}")
+            logger.info(f"   = Sin cambios: {self.stats['pos_categories']['unchanged']}")
             logger.info(f"   ❌ Errores:    {self.stats['pos_categories']['errors']}")
             
             logger.info("\n🌐 CATEGORÍAS DE SITIO WEB:")
             logger.info(f"   Total:        {self.stats['public_categories']['total']}")
             logger.info(f"   ✓ Creadas:    {self.stats['public_categories']['created']}")
             logger.info(f"   ✓ Actualizadas: {self.stats['public_categories']['updated']}")
+            logger.info(f"   = Sin cambios: {self.stats['public_categories']['unchanged']}")
             logger.info(f"   ❌ Errores:    {self.stats['public_categories']['errors']}")
             
-            logger.info(f"\n⏱ Tiempo total: {elapsed}")
+            logger.info(f"\n⚡ Escritura: {self.write_timer.summary()}")
+            logger.info(f"⏱ Tiempo total: {elapsed}")
             logger.info("=" * 60)
             
             total_errors = (
@@ -517,9 +609,20 @@ class CategorySync:
 
 
 if __name__ == "__main__":
+    if '--bulk-load' in sys.argv:
+        SYNC_OPTIONS['bulk_load'] = True
     try:
-        sync = CategorySync()
-        sync.run()
+        lock = StageLock('categories', policy=policy_from_argv(sys.argv))
+        if not lock.acquire():
+            sys.exit(0)
+        try:
+            sync = CategorySync(lock=lock)
+            sync.run()
+        finally:
+            lock.release()
+    except StopRequested as e:
+        logger.warning(f"🛑 {e}")
+        sys.exit(EXIT_STOPPED)
     except KeyboardInterrupt:
         logger.info("\n⚠ Sincronización interrumpida por el usuario")
         sys.exit(0)
@@ -0,0 +1,120 @@
+"""
+Cola persistente de registros fallidos (dead-letter queue)
+
+Cuando un producto, contacto o regla de precios falla, la sincronización
+guarda el registro acá (modelo, ID de Odoo 16, clase y mensaje del error,
+cantidad de intentos) y sigue: la marca de agua puede avanzar porque el
+registro no se pierde. Cada script reintenta al final de su ejecución, en
+una pasada pequeña, los registros cuyo back-off ya venció (o solo eso con
+--retry-failed). Un registro que vuelve a sincronizarse bien sale de la cola.
+
+El back-off es exponencial: 'dead_letter_retry_base' segundos, duplicando
+en cada intento hasta 'dead_letter_retry_max'. Después de
+'dead_letter_max_attempts' intentos el registro queda en la cola (para
+revisarlo a mano) pero ya no se reintenta.
+
+Se guarda en SQLite ('dead_letter_file'); varias etapas pueden escribir a la
+vez (sync_all.py en proceso o en procesos separados).
+"""
+
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List
+
+from config import SYNC_OPTIONS
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS dead_letters (
+    model TEXT NOT NULL,
+    source_id INTEGER NOT NULL,
+    error_class TEXT NOT NULL,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 1,
+    first_failed TEXT NOT NULL,
+    last_failed TEXT NOT NULL,
+    next_retry REAL NOT NULL,
+    PRIMARY KEY (model, source_id)
+)
+"""
+
+
+class DeadLetterQueue:
+    """Registros fallidos por (modelo, ID de origen) con reintentos y back-off"""
+
+    def __init__(self, path: str = None):
+        self.path = path or SYNC_OPTIONS.get('dead_letter_file', 'sync_dead_letters.db')
+        self.retry_base = SYNC_OPTIONS.get('dead_letter_retry_base', 300)
+        self.retry_max = SYNC_OPTIONS.get('dead_letter_retry_max', 86400)
+        self.max_attempts = SYNC_OPTIONS.get('dead_letter_max_attempts', 10)
+        self._lock = threading.Lock()
+
+        with self.connect() as db:
+            db.execute(SCHEMA)
+
+    def connect(self) -> sqlite3.Connection:
+        """Conexión nueva por operación (seguro entre hilos y procesos)"""
+        return sqlite3.connect(self.path, timeout=30)
+
+    def backoff(self, attempts: int) -> float:
+        """Segundos hasta el próximo reintento después de attempts fallos"""
+        return min(self.retry_base * 2 ** (attempts - 1), self.retry_max)
+
+    def add(self, model: str, source_id: int, error: BaseException):
+        """Registra un fallo (suma un intento si el registro ya estaba en la cola)"""
+        now = time.time()
+        stamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        with self._lock, self.connect() as db:
+            row = db.execute(
+                "SELECT attempts FROM dead_letters WHERE model = ? AND source_id = ?",
+                (model, source_id)
+            ).fetchone()
+            attempts = row[0] + 1 if row else 1
+            db.execute(
+                """INSERT INTO dead_letters
+                       (model, source_id, error_class, error, attempts, first_failed, last_failed, next_retry)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                   ON CONFLICT (model, source_id) DO UPDATE SET
+                       error_class = excluded.error_class,
+                       error = excluded.error,
+                       attempts = excluded.attempts,
+                       last_failed = excluded.last_failed,
+                       next_retry = excluded.next_retry""",
+                (model, source_id, type(error).__name__, str(error)[:2000], attempts,
+                 stamp, stamp, now + self.backoff(attempts))
+            )
+
+    def resolve(self, model: str, source_ids: Iterable[int]) -> int:
+        """Saca de la cola los registros que se sincronizaron bien; devuelve cuántos había"""
+        params = [(model, source_id) for source_id in source_ids]
+        if not params:
+            return 0
+        with self._lock, self.connect() as db:
+            before = db.total_changes
+            db.executemany(
+                "DELETE FROM dead_letters WHERE model = ? AND source_id = ?", params
+            )
+            return db.total_changes - before
+
+    def due(self, model: str, limit: int = None) -> List[int]:
+        """IDs de origen del modelo cuyo reintento ya venció (los más viejos primero)"""
+        limit = limit or SYNC_OPTIONS.get('dead_letter_retry_limit', 500)
+        with self.connect() as db:
+            rows = db.execute(
+                """SELECT source_id FROM dead_letters
+                   WHERE model = ? AND next_retry <= ? AND attempts < ?
+                   ORDER BY next_retry LIMIT ?""",
+                (model, time.time(), self.max_attempts, limit)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def summary(self, model: str) -> Dict[str, int]:
+        """Cantidad de registros pendientes y agotados (sin más reintentos) del modelo"""
+        with self.connect() as db:
+            pending, exhausted = db.execute(
+                """SELECT COALESCE(SUM(attempts < ?), 0), COALESCE(SUM(attempts >= ?), 0)
+                   FROM dead_letters WHERE model = ?""",
+                (self.max_attempts, self.max_attempts, model)
+            ).fetchone()
+        return {'pending': pending, 'exhausted': exhausted}
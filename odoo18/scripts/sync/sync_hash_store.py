@@ -0,0 +1,107 @@
+"""
+Huellas de los últimos valores enviados a Odoo 18 por registro
+
+Después de escribir (o de comprobar que Odoo 18 ya tenía esos valores) se
+guarda, por (modelo, ID de Odoo 16), una huella de los vals que devolvió
+prepare_values junto con el ID de destino. En la próxima ejecución, si los
+vals preparados dan la misma huella y el mapeo sigue apuntando al mismo
+registro, no se lee ni se escribe nada en Odoo 18: el costo de una pasada
+depende solo de los registros que cambiaron.
+
+Un cambio hecho a mano en Odoo 18 no cambia la huella; para corregirlos
+cada huella vence a los 'pushed_hash_max_age' segundos y el registro se
+vuelve a comparar contra Odoo 18. Se activa con 'pushed_hash_store'.
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from config import SYNC_OPTIONS
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pushed_hashes (
+    model TEXT NOT NULL,
+    source_id INTEGER NOT NULL,
+    target_id INTEGER NOT NULL,
+    hash TEXT NOT NULL,
+    pushed_at REAL NOT NULL,
+    PRIMARY KEY (model, source_id)
+)
+"""
+
+# Parámetros por consulta IN (límite de variables de SQLite)
+CHUNK = 500
+
+
+def vals_hash(vals: Dict) -> str:
+    """Huella estable de un diccionario de valores (independiente del orden de las claves)"""
+    payload = json.dumps(vals, sort_keys=True, default=str, separators=(',', ':'))
+    return hashlib.blake2b(payload.encode(), digest_size=16).hexdigest()
+
+
+def default_hash_store():
+    """Almacén de huellas (None si 'pushed_hash_store' está desactivado)"""
+    if SYNC_OPTIONS.get('pushed_hash_store', True):
+        return PushedHashStore()
+    return None
+
+
+class PushedHashStore:
+    """Huella y destino de los últimos vals enviados por (modelo, ID de origen), en SQLite"""
+
+    def __init__(self, path: str = None):
+        self.path = path or SYNC_OPTIONS.get('pushed_hash_file', 'sync_pushed_hashes.db')
+        self.max_age = SYNC_OPTIONS.get('pushed_hash_max_age', 7 * 86400)
+        self._local = threading.local()
+
+        db = self.db()
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute(SCHEMA)
+
+    def db(self) -> sqlite3.Connection:
+        """Conexión propia de cada hilo"""
+        connection = getattr(self._local, 'db', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = connection
+        return connection
+
+    def known(self, model: str, source_ids: Iterable[int]) -> Dict[int, Tuple[str, int]]:
+        """(huella, ID de destino) vigentes de los registros indicados"""
+        source_ids = list(source_ids)
+        oldest = time.time() - self.max_age
+        known = {}
+        for i in range(0, len(source_ids), CHUNK):
+            chunk = source_ids[i:i + CHUNK]
+            rows = self.db().execute(
+                f"""SELECT source_id, hash, target_id FROM pushed_hashes
+                    WHERE model = ? AND pushed_at >= ?
+                    AND source_id IN ({','.join('?' * len(chunk))})""",
+                [model, oldest, *chunk]
+            )
+            known.update((source_id, (digest, target_id)) for source_id, digest, target_id in rows)
+        return known
+
+    def get(self, model: str, source_id: int) -> Optional[Tuple[str, int]]:
+        """(huella, ID de destino) vigente de un registro (None si no hay)"""
+        return self.known(model, [source_id]).get(source_id)
+
+    def save(self, model: str, rows: List[Tuple[int, int, str]]):
+        """Guarda (ID de origen, ID de destino, huella) de registros enviados, en una transacción"""
+        if not rows:
+            return
+        now = time.time()
+        with self.db() as db:
+            db.executemany(
+                """INSERT INTO pushed_hashes (model, source_id, target_id, hash, pushed_at)
+                   VALUES (?, ?, ?, ?, ?)
+                   ON CONFLICT (model, source_id) DO UPDATE SET
+                       target_id = excluded.target_id, hash = excluded.hash,
+                       pushed_at = excluded.pushed_at""",
+                [(model, source_id, target_id, digest, now) for source_id, target_id, digest in rows]
+            )
@@ -0,0 +1,303 @@
+"""
+Bloqueo por etapa y cancelación cooperativa de las sincronizaciones
+
+Cada etapa (products, stock, partners, ...) toma un archivo de bloqueo
+.sync_<etapa>.lock con el PID, el host y la hora de inicio. Si una segunda
+invocación encuentra el bloqueo tomado, según la política configurada
+('sync_lock_policy' o --on-lock):
+
+    wait    espera a que se libere (hasta 'sync_lock_wait_timeout')
+    skip    no ejecuta la etapa
+    cancel  pide a la ejecución en curso que se detenga en el próximo
+            límite de lote (archivo .sync_<etapa>.stop) y espera su salida
+
+Un bloqueo de este host es obsoleto solo si su proceso ya no existe: un
+proceso vivo nunca lo pierde, por más que dure. Los de otro host (o sin PID
+legible) son obsoletos si no se renovaron en 'sync_lock_stale_seconds' (la
+ejecución en curso, o el script hijo de sync_all.py que lo heredó, lo renueva
+cada vez que revisa si debe detenerse). Cada decisión queda registrada con su
+motivo en 'sync_lock_history_file'.
+
+Si sync_all.py corre una etapa en un proceso aparte le pasa el bloqueo por
+la variable de entorno SYNC_LOCK_HELD: el script hijo no lo vuelve a tomar
+pero sigue atendiendo los pedidos de detención.
+"""
+
+import json
+import logging
+import os
+import socket
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from config import SYNC_OPTIONS
+
+logger = logging.getLogger(__name__)
+
+POLICIES = ('wait', 'skip', 'cancel')
+
+# Variable de entorno con las etapas cuyo bloqueo ya tomó el proceso padre
+HELD_ENV = 'SYNC_LOCK_HELD'
+
+# Código de salida de un script detenido por pedido de otra invocación
+EXIT_STOPPED = 3
+
+
+class StopRequested(BaseException):
+    """
+    Otra invocación pidió detener la etapa en el próximo límite de lote
+
+    Hereda de BaseException (como KeyboardInterrupt) para que los
+    'except Exception' que cuentan errores por registro no la absorban.
+    """
+
+
+def policy_from_argv(argv: List[str]) -> Optional[str]:
+    """Lee --on-lock wait|skip|cancel (None si no se indicó)"""
+    if '--on-lock' not in argv:
+        return None
+    policy = argv[argv.index('--on-lock') + 1]
+    if policy not in POLICIES:
+        raise ValueError(f"Política de bloqueo desconocida: {policy} (usar {', '.join(POLICIES)})")
+    return policy
+
+
+class StageLock:
+    """Archivo de bloqueo de una etapa con detección de bloqueos obsoletos"""
+
+    def __init__(self, stage: str, policy: str = None):
+        self.stage = stage
+        self.policy = policy or SYNC_OPTIONS.get('sync_lock_policy', 'wait')
+        self.lock_dir = SYNC_OPTIONS.get('sync_lock_dir', '.')
+        self.stale_seconds = SYNC_OPTIONS.get('sync_lock_stale_seconds', 1800)
+        self.wait_timeout = SYNC_OPTIONS.get('sync_lock_wait_timeout', 3600)
+        self.poll_seconds = SYNC_OPTIONS.get('sync_lock_poll_seconds', 5)
+        self.history_file = SYNC_OPTIONS.get('sync_lock_history_file', 'sync_locks.log')
+
+        self.lock_file = os.path.join(self.lock_dir, f".sync_{stage}.lock")
+        self.stop_file = os.path.join(self.lock_dir, f".sync_{stage}.stop")
+        self.owned = False
+        self.inherited = False
+        self.last_heartbeat = 0.0
+
+    # ========================================
+    # ESTADO DEL BLOQUEO
+    # ========================================
+
+    def read_holder(self) -> Optional[Dict]:
+        """Datos de quien tiene el bloqueo (None si está libre)"""
+        return self.read_holder_from(self.lock_file)
+
+    @staticmethod
+    def read_holder_from(path: str) -> Optional[Dict]:
+        """Datos de un archivo de bloqueo (None si no existe)"""
+        try:
+            with open(path) as f:
+                holder = json.load(f)
+            holder['heartbeat'] = os.path.getmtime(path)
+            return holder
+        except FileNotFoundError:
+            return None
+        except (ValueError, OSError):
+            # Archivo a medio escribir o corrupto: tratarlo como tomado por desconocido
+            try:
+                return {'pid': None, 'host': None, 'heartbeat': os.path.getmtime(path)}
+            except FileNotFoundError:
+                return None
+
+    def stale_reason(self, holder: Dict) -> Optional[str]:
+        """Motivo por el que el bloqueo es obsoleto (None si sigue vigente)"""
+        if holder.get('host') == socket.gethostname() and holder.get('pid'):
+            try:
+                os.kill(holder['pid'], 0)
+            except ProcessLookupError:
+                return f"el proceso {holder['pid']} ya no existe"
+            except PermissionError:
+                # Existe pero es de otro usuario
+                pass
+            # Proceso vivo en este host: vigente aunque no se haya renovado
+            return None
+        # Otro host o PID desconocido: solo queda la antigüedad
+        age = time.time() - holder['heartbeat']
+        if age > self.stale_seconds:
+            return f"sin renovar hace {age:.0f}s"
+        return None
+
+    def describe(self, holder: Dict) -> str:
+        """Descripción corta de quien tiene el bloqueo"""
+        return f"pid {holder.get('pid')}@{holder.get('host')} desde {holder.get('started', '?')}"
+
+    def record(self, action: str, reason: str, holder: Dict = None):
+        """Registra una decisión del bloqueo con su motivo"""
+        event = {
+            'time': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'stage': self.stage,
+            'action': action,
+            'reason': reason,
+            'pid': os.getpid(),
+        }
+        if holder:
+            event['holder'] = self.describe(holder)
+        try:
+            with open(self.history_file, 'a') as f:
+                f.write(json.dumps(event, ensure_ascii=False) + '\n')
+        except OSError as e:
+            logger.warning(f"No se pudo registrar el evento de bloqueo: {e}")
+
+    # ========================================
+    # TOMAR Y LIBERAR
+    # ========================================
+
+    def try_acquire(self) -> bool:
+        """Intenta crear el archivo de bloqueo de forma atómica"""
+        try:
+            fd = os.open(self.lock_file, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        except FileExistsError:
+            return False
+
+        with os.fdopen(fd, 'w') as f:
+            json.dump({
+                'pid': os.getpid(),
+                'host': socket.gethostname(),
+                'started': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            }, f)
+        self.owned = True
+        self.last_heartbeat = time.time()
+        return True
+
+    def acquire(self) -> bool:
+        """
+        Toma el bloqueo aplicando la política ante una ejecución en curso
+
+        Returns:
+            bool: True si la etapa puede ejecutarse
+        """
+        if self.stage in os.environ.get(HELD_ENV, '').split(','):
+            self.inherited = True
+            return True
+
+        deadline = time.time() + self.wait_timeout
+        announced = False
+
+        while not self.try_acquire():
+            holder = self.read_holder()
+            if holder is None:
+                continue
+
+            reason = self.stale_reason(holder)
+            if reason:
+                if self.remove_stale(holder):
+                    logger.warning(f"🔓 Bloqueo obsoleto de {self.stage} ({reason}): se elimina")
+                    self.record('stale_removed', reason, holder)
+                continue
+
+            if self.policy == 'skip':
+                reason = f"{self.stage} en curso ({self.describe(holder)})"
+                logger.warning(f"⏭ Etapa {self.stage} omitida: {reason}")
+                self.record('skipped', reason, holder)
+                return False
+
+            if not announced:
+                announced = True
+                if self.policy == 'cancel':
+                    self.request_stop(f"cancelación pedida por pid {os.getpid()}")
+                    logger.warning(f"🛑 Pedido de detención a {self.stage} ({self.describe(holder)})")
+                    self.record('cancel_requested', "política cancel", holder)
+                else:
+                    logger.info(f"⏳ Esperando a {self.stage} en curso ({self.describe(holder)})")
+                    self.record('waiting', "política wait", holder)
+
+            if time.time() > deadline:
+                reason = f"{self.stage} siguió en curso más de {self.wait_timeout}s"
+                logger.warning(f"⏭ Etapa {self.stage} omitida: {reason}")
+                self.record('timeout', reason, holder)
+                return False
+
+            time.sleep(self.poll_seconds)
+
+        if announced:
+            self.record('acquired', f"tras política {self.policy}")
+        # Un pedido de detención viejo no debe frenar a esta ejecución
+        self.remove(self.stop_file)
+        return True
+
+    def release(self):
+        """Libera el bloqueo si lo tomó esta ejecución"""
+        if self.owned:
+            self.remove(self.lock_file)
+            self.owned = False
+
+    def remove_stale(self, holder: Dict) -> bool:
+        """
+        Elimina el bloqueo obsoleto solo si sigue siendo el mismo que se evaluó
+
+        Entre leerlo y borrarlo otra invocación pudo eliminarlo y tomar uno
+        nuevo: se aparta con un rename atómico, se verifica que sea el mismo
+        y, si no lo es, se devuelve a su lugar sin pisar a nadie.
+        """
+        moved = f"{self.lock_file}.{os.getpid()}.stale"
+        try:
+            os.rename(self.lock_file, moved)
+        except FileNotFoundError:
+            return False
+
+        current = self.read_holder_from(moved)
+        if current is not None and all(
+            current.get(key) == holder.get(key) for key in ('pid', 'host', 'started', 'heartbeat')
+        ):
+            self.remove(moved)
+            return True
+
+        # Era un bloqueo nuevo: se restaura (link falla si ya hay otro tomado)
+        try:
+            os.link(moved, self.lock_file)
+        except FileExistsError:
+            pass
+        self.remove(moved)
+        return False
+
+    @staticmethod
+    def remove(path: str):
+        """Elimina un archivo ignorando si ya no existe"""
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    # ========================================
+    # CANCELACIÓN COOPERATIVA
+    # ========================================
+
+    def request_stop(self, reason: str):
+        """Pide a la ejecución en curso que se detenga en el próximo lote"""
+        with open(self.stop_file, 'w') as f:
+            json.dump({'reason': reason, 'pid': os.getpid(),
+                       'time': datetime.now().strftime('%Y-%m-%d %H:%M:%S')}, f)
+
+    def stop_requested(self) -> Optional[str]:
+        """Motivo del pedido de detención (None si no hay); también renueva el bloqueo"""
+        now = time.time()
+        # El hijo de sync_all.py --subprocess renueva el bloqueo que tomó el padre
+        if (self.owned or self.inherited) and now - self.last_heartbeat > 30:
+            try:
+                os.utime(self.lock_file)
+            except FileNotFoundError:
+                pass
+            self.last_heartbeat = now
+
+        if not os.path.exists(self.stop_file):
+            return None
+        try:
+            with open(self.stop_file) as f:
+                return json.load(f).get('reason', 'sin motivo')
+        except (ValueError, OSError):
+            return 'sin motivo'
+
+    def check_stop(self):
+        """Lanza StopRequested si se pidió detener la etapa (llamar entre lotes)"""
+        reason = self.stop_requested()
+        if reason:
+            self.record('stopped', reason)
+            self.remove(self.stop_file)
+            raise StopRequested(f"Etapa {self.stage} detenida: {reason}")
@@ -0,0 +1,230 @@
+"""
+Almacén local (SQLite) de los external_id sync_script de Odoo 18
+
+Guarda todas las filas de ir.model.data del módulo sync_script (ID, modelo,
+nombre, res_id) junto con el prefijo y el ID de Odoo 16 ya extraídos del
+nombre, así cualquier etapa traduce IDs de origen a destino sin consultar
+Odoo 18 y sin parsear nombres por su cuenta.
+
+Para detectar cambios hechos por otros procesos (o a mano) compara, con
+una sola llamada read_group agrupada por modelo, la cantidad de filas, el
+mayor ID y la suma de res_id de cada modelo contra los valores locales.
+Si difieren, primero trae solo las filas nuevas (los IDs de ir.model.data
+son crecientes) y, si aún no coincide (filas eliminadas o reapuntadas),
+relee el modelo completo.
+
+Los scripts registran acá los external_id que crean, en la misma
+transacción para todo el lote.
+
+Tiene la misma interfaz que MappingCache (rows, source_map, lookup,
+invalidate, record), así que las etapas lo usan igual que a la caché de
+sync_all.py. Se activa con 'mapping_store'.
+"""
+
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from config import SYNC_OPTIONS
+from sync_session import split_name
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS mappings (
+    imd_id INTEGER PRIMARY KEY,
+    model TEXT NOT NULL,
+    name TEXT NOT NULL,
+    res_id INTEGER NOT NULL,
+    prefix TEXT NOT NULL,
+    source_id INTEGER
+);
+CREATE INDEX IF NOT EXISTS mappings_source ON mappings (model, prefix, source_id);
+CREATE INDEX IF NOT EXISTS mappings_name ON mappings (model, name);
+"""
+
+
+def default_mapping_cache():
+    """Almacén local para los scripts que corren solos (None si está desactivado)"""
+    if SYNC_OPTIONS.get('mapping_store', True):
+        return MappingStore()
+    return None
+
+
+class MappingStore:
+    """Mapeos sync_script persistidos en SQLite (modo WAL) y sincronizados con Odoo 18"""
+
+    def __init__(self, path: str = None):
+        self.path = path or SYNC_OPTIONS.get('mapping_store_file', 'sync_mappings.db')
+        self.check_seconds = SYNC_OPTIONS.get('mapping_store_check_seconds', 60)
+        self.page_size = SYNC_OPTIONS.get('mapping_store_page_size', 20000)
+
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        # Modelo -> momento en que se verificó contra Odoo 18
+        self._checked: Dict[str, float] = {}
+
+        db = self.db()
+        db.execute("PRAGMA journal_mode=WAL")
+        db.executescript(SCHEMA)
+
+    def db(self) -> sqlite3.Connection:
+        """Conexión propia de cada hilo"""
+        connection = getattr(self._local, 'db', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = connection
+        return connection
+
+    # ========================================
+    # DETECCIÓN DE CAMBIOS Y RELECTURA
+    # ========================================
+
+    def remote_state(self, connection) -> Dict[str, Tuple[int, int, int]]:
+        """(cantidad, mayor ID, suma de res_id) por modelo en Odoo 18, en una llamada"""
+        groups = connection.execute(
+            'ir.model.data', 'read_group',
+            [('module', '=', 'sync_script')],
+            ['model', 'id:max', 'res_id:sum'],
+            ['model'],
+            lazy=False
+        )
+        return {
+            group['model']: (group['__count'], group['id'] or 0, group['res_id'] or 0)
+            for group in groups
+        }
+
+    def local_state(self) -> Dict[str, Tuple[int, int, int]]:
+        """(cantidad, mayor ID, suma de res_id) por modelo en el almacén local"""
+        rows = self.db().execute(
+            "SELECT model, COUNT(*), MAX(imd_id), SUM(res_id) FROM mappings GROUP BY model"
+        ).fetchall()
+        return {model: (count, max_id or 0, res_sum or 0) for model, count, max_id, res_sum in rows}
+
+    def fetch(self, connection, model: str, min_id: int = 0) -> List[Dict]:
+        """Lee (paginado) las filas sync_script del modelo con ID mayor a min_id"""
+        rows = []
+        offset = 0
+        while True:
+            page = connection.execute(
+                'ir.model.data', 'search_read',
+                [('module', '=', 'sync_script'), ('model', '=', model), ('id', '>', min_id)],
+                fields=['name', 'res_id'], order='id', offset=offset, limit=self.page_size
+            )
+            rows.extend(page)
+            if len(page) < self.page_size:
+                return rows
+            offset += self.page_size
+
+    def refresh(self, connection, models: Iterable[str] = None):
+        """Sincroniza con Odoo 18 los modelos indicados (todos si models es None) que cambiaron"""
+        with self._lock:
+            remote = self.remote_state(connection)
+            local = self.local_state()
+            now = time.time()
+
+            # La misma lectura sirve para dar por verificados los modelos sin cambios
+            for model, state in remote.items():
+                if local.get(model) == state:
+                    self._checked[model] = now
+
+            for model in (models if models is not None else set(remote) | set(local)):
+                self._checked[model] = now
+                expected = remote.get(model, (0, 0, 0))
+                if local.get(model, (0, 0, 0)) == expected:
+                    continue
+
+                # Primero solo las filas nuevas; si no alcanza, el modelo completo
+                max_id = local.get(model, (0, 0, 0))[1]
+                self.write_rows(model, self.fetch(connection, model, max_id))
+                if self.local_state().get(model, (0, 0, 0)) != expected:
+                    self.write_rows(model, self.fetch(connection, model), replace=True)
+
+    def ensure_fresh(self, connection, model: str):
+        """Verifica el modelo contra Odoo 18 si pasó 'mapping_store_check_seconds'"""
+        if time.time() - self._checked.get(model, 0) > self.check_seconds:
+            self.refresh(connection, [model])
+
+    # ========================================
+    # ESCRITURA
+    # ========================================
+
+    def write_rows(self, model: str, rows: List[Dict], replace: bool = False):
+        """Inserta o actualiza filas {id, name, res_id} en una transacción (replace: reemplaza el modelo)"""
+        if not rows and not replace:
+            return
+        params = []
+        for row in rows:
+            prefix, source_id = split_name(row['name'])
+            params.append((row['id'], model, row['name'], row['res_id'], prefix, source_id))
+        with self.db() as db:
+            if replace:
+                db.execute("DELETE FROM mappings WHERE model = ?", (model,))
+            db.executemany(
+                """INSERT INTO mappings (imd_id, model, name, res_id, prefix, source_id)
+                   VALUES (?, ?, ?, ?, ?, ?)
+                   ON CONFLICT (imd_id) DO UPDATE SET
+                       name = excluded.name, res_id = excluded.res_id,
+                       prefix = excluded.prefix, source_id = excluded.source_id""",
+                params
+            )
+
+    def record(self, model: str, rows: List[Dict]):
+        """Registra external_id recién creados o reapuntados en Odoo 18 ({id, name, res_id})"""
+        with self._lock:
+            self.write_rows(model, rows)
+
+    def invalidate(self, models: Iterable[str] = None):
+        """Fuerza verificar los modelos indicados (todos si models es None) en el próximo uso"""
+        with self._lock:
+            if models is None:
+                self._checked.clear()
+            for model in models or []:
+                self._checked.pop(model, None)
+
+    # ========================================
+    # CONSULTAS
+    # ========================================
+
+    def rows(self, connection, model: str) -> List[Dict]:
+        """Filas {id, name, res_id} del modelo (misma interfaz que MappingCache)"""
+        self.ensure_fresh(connection, model)
+        return [
+            {'id': imd_id, 'name': name, 'res_id': res_id}
+            for imd_id, name, res_id in self.db().execute(
+                "SELECT imd_id, name, res_id FROM mappings WHERE model = ? ORDER BY imd_id", (model,)
+            )
+        ]
+
+    def source_map(self, connection, model: str, prefix: str) -> Dict[int, int]:
+        """ID de Odoo 16 -> ID de Odoo 18 de los external_id <prefix><id> del modelo"""
+        self.ensure_fresh(connection, model)
+        return dict(self.db().execute(
+            "SELECT source_id, res_id FROM mappings WHERE model = ? AND prefix = ? AND source_id IS NOT NULL",
+            (model, prefix)
+        ))
+
+    def lookup(self, connection, model: str, name: str) -> Optional[int]:
+        """
+        res_id de un external_id del modelo (None si no existe)
+
+        Los aciertos no consultan Odoo 18; un faltante se confirma con una
+        lectura puntual (otro proceso pudo haberlo creado desde la última
+        verificación) para no duplicar el registro.
+        """
+        self.ensure_fresh(connection, model)
+        row = self.db().execute(
+            "SELECT res_id FROM mappings WHERE model = ? AND name = ?", (model, name)
+        ).fetchone()
+        if row:
+            return row[0]
+
+        found = connection.execute(
+            'ir.model.data', 'search_read',
+            [('module', '=', 'sync_script'), ('model', '=', model), ('name', '=', name)],
+            fields=['name', 'res_id'], limit=1
+        )
+        if not found:
+            return None
+        self.record(model, found)
+        return found[0]['res_id']
@@ -0,0 +1,1244 @@
+#!/usr/bin/env python3
+"""
+Script de sincronización de CONTACTOS (clientes y proveedores)
+Odoo 16 (VPS) -> Odoo 18 (Local)
+
+Lee en una sola pasada paginada todos los contactos que son cliente o
+proveedor (customer_rank > 0 o supplier_rank > 0), conserva ambos rangos
+y escribe cada contacto una única vez bajo un solo external_id
+(sync_partner_<id>). También sincroniza sus contactos hijos (direcciones de
+entrega/facturación y personas de contacto).
+
+Los external_id heredados de sync_customers.py (sync_customer_<id>) y
+sync_suppliers.py (sync_supplier_<id>) se migran automáticamente.
+
+Sincronización incremental: solo se leen los contactos con write_date
+posterior a la última ejecución; cada 'partner_full_sync_days' días (o con
+--full) se relee y concilia el padrón completo.
+
+Uso:
+    python3 sync_partners.py
+    python3 sync_partners.py --full
+    python3 sync_partners.py --retry-failed   (solo reintenta la cola de fallidos)
+    python3 sync_partners.py --bulk-load      (crea los contactos nuevos con load())
+"""
+
+import xmlrpc.client
+import logging
+from datetime import datetime
+from typing import Dict, List, Set, Tuple
+import sys
+import os
+
+# Agregar directorio actual al path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# Importar configuración
+try:
+    from config import ODOO_16, ODOO_18, SYNC_OPTIONS
+except ImportError as e:
+    print("❌ Error: No se encontró el archivo config.py")
+    print(f"Directorio actual: {os.getcwd()}")
+    print(f"Script ubicado en: {os.path.dirname(os.path.abspath(__file__))}")
+    print(f"Error técnico: {e}")
+    print("\nVerifica que config.py existe en el mismo directorio que este script")
+    sys.exit(1)
+
+# Configuración de logging (si sync_customers.py/sync_suppliers.py ya la
+# configuraron, basicConfig no hace nada y se conserva su archivo de log)
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.FileHandler('sync_partners.log'),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger(__name__)
+
+from sync_lock import StageLock, StopRequested, EXIT_STOPPED, policy_from_argv
+from sync_dead_letter import DeadLetterQueue
+from sync_session import split_name
+from sync_mapping_store import default_mapping_cache
+from sync_hash_store import default_hash_store, vals_hash
+from sync_bulk_load import bulk_loader, WriteTimer
+
+# Prefijos de external_id de los scripts anteriores (uno por rango)
+LEGACY_PREFIXES = ('sync_customer_', 'sync_supplier_')
+
+# Modelos de referencia que se resuelven por ID o nombre sin consultas por contacto
+REFERENCE_MODELS = ('res.country', 'res.country.state', 'l10n_ar.afip.responsibility.type')
+
+# Rangos que solo se suben: Odoo 18 puede haberlos incrementado con sus documentos
+RANK_FIELDS = ('customer_rank', 'supplier_rank')
+
+# Campos de los contactos hijos (direcciones de entrega/facturación, personas)
+CHILD_FIELDS = [
+    'name', 'type', 'function', 'email', 'phone', 'mobile',
+    'street', 'street2', 'city', 'zip', 'country_id', 'state_id',
+    'parent_id', 'active', 'write_date'
+]
+
+# Tipos de dirección de Odoo 16 sin equivalente en Odoo 18
+CHILD_TYPE_MAP = {'private': 'other'}
+
+# Claves para adoptar contactos existentes en Odoo 18, en orden de prioridad
+MATCH_KEYS = ('vat', 'ref', 'email')
+
+
+def normalize_vat(value) -> str:
+    """CUIT/VAT sin separadores ni prefijo de país; vacío si es genérico (ej: 0, 99999999)"""
+    if not value:
+        return ''
+    key = ''.join(ch for ch in str(value).upper() if ch.isalnum())
+    if key[:2] == 'AR':
+        key = key[2:]
+    if len(key) < 6 or len(set(key)) == 1:
+        return ''
+    return key
+
+
+def normalize_ref(value) -> str:
+    """Referencia interna sin espacios ni mayúsculas"""
+    return ''.join(str(value).split()).lower() if value else ''
+
+
+def normalize_email(value) -> str:
+    """Email en minúsculas; vacío si no parece un email"""
+    key = str(value).strip().lower() if value else ''
+    return key if '@' in key else ''
+
+
+NORMALIZERS = {'vat': normalize_vat, 'ref': normalize_ref, 'email': normalize_email}
+
+
+class OdooConnection:
+    """Maneja la conexión a una instancia de Odoo"""
+
+    def __init__(self, config: Dict, name: str, session=None):
+        self.config = config
+        self.name = name
+        self.uid = None
+        self.models = None
+
+        if session:
+            # Sesión compartida (sync_all.py en proceso): sin autenticar de nuevo
+            self.uid = session.uid
+            self.models = session.models
+        else:
+            self.connect()
+
+    def connect(self):
+        """Establece la conexión con Odoo"""
+        try:
+            logger.info(f"Conectando a {self.name} ({self.config['url']})...")
+
+            common = xmlrpc.client.ServerProxy(
+                f"{self.config['url']}/xmlrpc/2/common"
+            )
+
+            self.uid = common.authenticate(
+                self.config['db'],
+                self.config['username'],
+                self.config['password'],
+                {}
+            )
+
+            if not self.uid:
+                raise Exception(f"Autenticación fallida en {self.name}")
+
+            self.models = xmlrpc.client.ServerProxy(
+                f"{self.config['url']}/xmlrpc/2/object"
+            )
+
+            # Verificar versión
+            version = common.version()
+            logger.info(f"✓ Conectado a {self.name} - Versión: {version['server_version']}")
+
+        except Exception as e:
+            logger.error(f"❌ Error conectando a {self.name}: {e}")
+            raise
+
+    def execute(self, model: str, method: str, *args, **kwargs):
+        """Ejecuta un método en Odoo"""
+        return self.models.execute_kw(
+            self.config['db'],
+            self.uid,
+            self.config['password'],
+            model,
+            method,
+            args,
+            kwargs
+        )
+
+    def search_read(self, model: str, domain: List, fields: List,
+                    offset: int = 0, limit: int = 0, order: str = None) -> List[Dict]:
+        """Busca y lee registros"""
+        kwargs = {'fields': fields}
+        if offset > 0:
+            kwargs['offset'] = offset
+        if limit > 0:
+            kwargs['limit'] = limit
+        if order:
+            kwargs['order'] = order
+
+        try:
+            return self.models.execute_kw(
+                self.config['db'],
+                self.uid,
+                self.config['password'],
+                model,
+                'search_read',
+                [domain],
+                kwargs
+            )
+        except Exception as e:
+            logger.error(f"Error en search_read - Model: {model}, Fields: {fields}")
+            logger.error(f"Domain: {domain}")
+            raise
+
+    def search(self, model: str, domain: List, limit: int = None) -> List[int]:
+        """Busca IDs de registros"""
+        kwargs = {}
+        if limit:
+            kwargs['limit'] = limit
+        return self.execute(model, 'search', domain, **kwargs)
+
+    def read(self, model: str, record_ids: List[int], fields: List) -> List[Dict]:
+        """Lee registros por ID"""
+        return self.execute(model, 'read', record_ids, fields)
+
+    def create(self, model: str, values: Dict) -> int:
+        """Crea un registro"""
+        return self.execute(model, 'create', values)
+
+    def create_multi(self, model: str, values_list: List[Dict]) -> List[int]:
+        """Crea varios registros en una sola llamada"""
+        if not values_list:
+            return []
+        return self.execute(model, 'create', values_list)
+
+    def write(self, model: str, record_ids: List[int], values: Dict) -> bool:
+        """Actualiza registros"""
+        return self.execute(model, 'write', record_ids, values)
+
+    def unlink(self, model: str, record_ids: List[int]) -> bool:
+        """Elimina registros"""
+        return self.execute(model, 'unlink', record_ids)
+
+
+class PartnerSync:
+    """Sincroniza clientes y proveedores entre dos instancias de Odoo"""
+
+    # Nombre para los logs y dominio adicional (los envoltorios
+    # CustomerSync/SupplierSync restringen a un solo rango)
+    label = 'CONTACTOS'
+    rank_domain: List = ['|', ('customer_rank', '>', 0), ('supplier_rank', '>', 0)]
+
+    # Marca de agua propia: cada dominio avanza la suya
+    sync_file = 'last_partner_sync.txt'
+
+    def __init__(self, full: bool = False, source_session=None, target_session=None,
+                 mapping_cache=None, lock=None):
+        self.source = OdooConnection(ODOO_16, "Odoo 16 (VPS)", session=source_session)
+        self.target = OdooConnection(ODOO_18, "Odoo 18 (Local)", session=target_session)
+
+        # Mapeos de ir.model.data compartidos entre etapas (sync_all.py en
+        # proceso) o, si el script corre solo, el almacén local (sync_mapping_store.py)
+        self.mapping_cache = mapping_cache if mapping_cache is not None else default_mapping_cache()
+
+        # Bloqueo de la etapa (sync_lock.py): entre lotes se revisa si otra
+        # invocación pidió detenerla
+        self.lock = lock
+
+        # Sincronización incremental: write_date de Odoo 16 (marca de agua)
+        # y fecha de la última conciliación completa
+        self.force_full = full
+        self.last_sync = None
+        self.new_sync = None
+        self.last_full_sync = None
+
+        # Cantidad de contactos por página de lectura y por lote de escritura
+        self.batch_size = SYNC_OPTIONS.get('partner_batch_size', 500)
+
+        # Mapeo precargado: ID Odoo 16 -> ID Odoo 18 (y ID de su ir.model.data)
+        self.partner_map: Dict[int, int] = {}
+        self.partner_xmlid_ids: Dict[int, int] = {}
+
+        # Modelo -> (IDs existentes, nombre -> ID) en Odoo 18
+        self.reference_maps: Dict[str, Tuple[Set[int], Dict[str, int]]] = {}
+
+        # Adopción de contactos existentes: clave -> valor normalizado -> ID
+        # Odoo 18 (None si el valor es ambiguo). Se carga solo si hace falta
+        self.adopt_existing = SYNC_OPTIONS.get('partner_adopt_existing', True)
+        self.match_index: Dict[str, Dict[str, int]] = None
+        # Contactos de usuarios y de compañías: nunca se adoptan
+        self.protected_partner_ids: Set[int] = set()
+
+        # IDs de Odoo 16 ya sincronizados en esta ejecución (padres e hijos)
+        self.processed_ids: Set[int] = set()
+
+        # Cola de fallidos: los contactos con error se reintentan después y
+        # no frenan la marca de agua
+        self.dead_letters = DeadLetterQueue()
+        self.failed_ids: Set[int] = set()
+
+        # Huellas de los últimos vals enviados: los contactos que no
+        # cambiaron no se leen ni se escriben en Odoo 18 (sync_hash_store.py)
+        self.hash_store = default_hash_store()
+
+        # Carga masiva con load() (sync_bulk_load.py): los contactos nuevos se
+        # crean junto con su external_id en una sola llamada por lote. Las
+        # actualizaciones siguen comparando contra Odoo 18 (rangos que no bajan)
+        self.loader = bulk_loader(self.target, 'res.partner', self.mapping_cache)
+        self.write_timer = self.loader.timer if self.loader else WriteTimer('create/write')
+
+        self.stats = {
+            'total': 0,
+            'created': 0,
+            'updated': 0,
+            'unchanged': 0,
+            'errors': 0,
+            'skipped': 0,
+            'migrated': 0,
+            'adopted': 0,
+            'children': 0,
+            'duplicates': 0,
+            'queued': 0,
+            'recovered': 0
+        }
+
+    def get_external_id(self, source_id: int) -> str:
+        """Genera un external_id único para mapear registros"""
+        return f"sync_partner_{source_id}"
+
+    def migrate_legacy_external_ids(self):
+        """
+        Unifica los external_id sync_customer_<id>/sync_supplier_<id> en
+        sync_partner_<id>.
+
+        Si un contacto quedó duplicado en Odoo 18 (uno creado como cliente y
+        otro como proveedor) se conserva el de cliente y se informa el otro
+        para fusionarlo a mano; no se elimina ningún contacto.
+        """
+        domain = [
+            ('module', '=', 'sync_script'),
+            ('model', '=', 'res.partner'),
+            '|', '|',
+            ('name', '=like', 'sync_partner_%'),
+            ('name', '=like', 'sync_customer_%'),
+            ('name', '=like', 'sync_supplier_%'),
+        ]
+        rows = self.target.search_read('ir.model.data', domain, ['name', 'res_id'])
+
+        unified: Dict[int, int] = {}
+        legacy: Dict[int, Dict[str, Dict]] = {}
+        for row in rows:
+            prefix, source_id = split_name(row['name'])
+            if source_id is None:
+                continue
+            if prefix == 'sync_partner_':
+                unified[source_id] = row['res_id']
+            elif prefix in LEGACY_PREFIXES:
+                legacy.setdefault(source_id, {})[prefix] = row
+
+        if not legacy:
+            return
+
+        logger.info(f"Migrando external_id heredados de {len(legacy)} contactos...")
+        obsolete = []
+
+        for source_id, by_prefix in legacy.items():
+            keep = by_prefix.get('sync_customer_') or by_prefix['sync_supplier_']
+            keep_res_id = unified.get(source_id, keep['res_id'])
+
+            if source_id not in unified:
+                try:
+                    self.target.write('ir.model.data', [keep['id']], {
+                        'name': self.get_external_id(source_id)
+                    })
+                    self.stats['migrated'] += 1
+                except Exception as e:
+                    # Sin el renombre, las filas heredadas siguen siendo el único mapeo
+                    logger.error(f"Error migrando external_id de {source_id}: {e}")
+                    self.stats['errors'] += 1
+                    continue
+
+            for row in by_prefix.values():
+                if row is keep and source_id not in unified:
+                    continue
+                obsolete.append(row['id'])
+                if row['res_id'] != keep_res_id:
+                    logger.warning(
+                        f"⚠ Contacto duplicado (origen {source_id}): se conserva "
+                        f"ID {keep_res_id}, fusionar ID {row['res_id']} a mano"
+                    )
+                    self.stats['duplicates'] += 1
+
+        if obsolete:
+            try:
+                self.target.unlink('ir.model.data', obsolete)
+            except Exception as e:
+                # Quedan como filas heredadas: la próxima ejecución las vuelve a descartar
+                logger.error(f"Error eliminando {len(obsolete)} external_id heredados: {e}")
+                self.stats['errors'] += 1
+
+        # Los nombres cambiaron: descartar filas de res.partner ya leídas
+        if self.mapping_cache is not None:
+            self.mapping_cache.invalidate(['res.partner'])
+
+        logger.info(f"✓ Migrados {self.stats['migrated']} external_id")
+
+    def get_last_sync_date(self):
+        """Lee la marca de agua (línea 1) y la fecha de la última sincronización completa (línea 2)"""
+        try:
+            if os.path.exists(self.sync_file):
+                with open(self.sync_file, 'r') as f:
+                    lines = f.read().split('\n')
+                self.last_sync = lines[0].strip() or None
+                if len(lines) > 1 and lines[1].strip():
+                    self.last_full_sync = datetime.strptime(lines[1].strip(), '%Y-%m-%d')
+                if self.last_sync:
+                    logger.info(f"✓ Última sincronización de contactos: {self.last_sync}")
+        except Exception as e:
+            logger.warning(f"No se pudo leer última sincronización: {e}")
+            self.last_sync = None
+            self.last_full_sync = None
+
+    def save_sync_date(self, sync_date: str, full_sync_date: datetime):
+        """Guarda la marca de agua y la fecha de la última sincronización completa"""
+        try:
+            with open(self.sync_file, 'w') as f:
+                f.write(f"{sync_date}\n{full_sync_date.strftime('%Y-%m-%d') if full_sync_date else ''}")
+
+            logger.info(f"✓ Fecha de sincronización guardada: {sync_date}")
+        except Exception as e:
+            logger.warning(f"No se pudo guardar fecha de sincronización: {e}")
+
+    def is_full_sync_due(self) -> bool:
+        """Indica si corresponde una conciliación completa (forzada, sin marca o vencida)"""
+        if self.force_full or not SYNC_OPTIONS.get('incremental_partner_sync', True):
+            return True
+        if not self.last_sync or not self.last_full_sync:
+            return True
+
+        full_sync_days = SYNC_OPTIONS.get('partner_full_sync_days', 7)
+        return (datetime.now() - self.last_full_sync).days >= full_sync_days
+
+    def get_partners_from_source(self, since: str = None, only_ids: List[int] = None) -> List[Dict]:
+        """
+        Obtiene clientes y proveedores desde Odoo 16 en una pasada paginada
+
+        Con since solo lee los contactos con write_date >= since (reloj de
+        Odoo 16, con solapamiento: repetir un contacto no cambia nada); con
+        only_ids solo esos contactos (reintentos de la cola de fallidos)
+
+        Odoo 16 sube customer_rank/supplier_rank con un UPDATE directo que no
+        toca write_date: en modo incremental también se leen los contactos del
+        dominio que todavía no están mapeados (comparación de IDs, sin campos)
+        """
+        logger.info("=" * 60)
+        logger.info(f"OBTENIENDO {self.label} DESDE ODOO 16")
+        logger.info("=" * 60)
+
+        # Construir dominio de búsqueda
+        domain = list(self.rank_domain)
+
+        # Agregar filtro de activos si está configurado
+        if SYNC_OPTIONS.get('only_active', True):
+            domain.append(('active', '=', True))
+
+        # Agregar filtros personalizados
+        if SYNC_OPTIONS.get('custom_filter'):
+            domain.extend(SYNC_OPTIONS['custom_filter'])
+
+        base_domain = list(domain)
+
+        # Solo modificados desde la última sincronización
+        if since:
+            domain.append(('write_date', '>=', since))
+        if only_ids is not None:
+            domain.append(('id', 'in', only_ids))
+
+        # Campos básicos de contacto
+        fields = [
+            'id',
+            'name',
+            'email',
+            'phone',
+            'mobile',
+            'vat',
+            'ref',
+            'street',
+            'street2',
+            'city',
+            'zip',
+            'website',
+            'is_company',
+            'active',
+            'country_id',
+            'state_id',
+            'customer_rank',
+            'supplier_rank',
+            'parent_id',
+            'write_date',
+            'l10n_ar_afip_responsibility_type_id'  # Campo AFIP
+        ]
+
+        # Agregar campos extras si están configurados
+        if SYNC_OPTIONS.get('extra_fields'):
+            fields.extend(SYNC_OPTIONS['extra_fields'])
+
+        def read_pages(read_domain: List) -> List[Dict]:
+            records = []
+            offset = 0
+            while True:
+                page = self.source.search_read(
+                    'res.partner', read_domain, fields,
+                    offset=offset, limit=self.batch_size, order='id'
+                )
+                records.extend(page)
+                if len(page) < self.batch_size:
+                    break
+                offset += self.batch_size
+            return records
+
+        try:
+            partners = read_pages(domain)
+
+            if since:
+                logger.info(f"📅 Sincronización incremental: {len(partners)} contactos modificados desde {since}")
+
+                # Nuevos clientes/proveedores por rango (sin cambio de write_date)
+                read_ids = {partner['id'] for partner in partners}
+                missing_ids = sorted(
+                    set(self.source.search('res.partner', base_domain))
+                    - set(self.partner_map) - read_ids
+                )
+                if missing_ids:
+                    partners.extend(read_pages(base_domain + [('id', 'in', missing_ids)]))
+                    logger.info(f"✓ {len(missing_ids)} contactos sin sincronizar agregados")
+            else:
+                logger.info(f"✓ Encontrados {len(partners)} contactos")
+            return partners
+        except Exception as e:
+            logger.error(f"❌ Error obteniendo contactos: {e}")
+            raise
+
+    def load_reference_maps(self):
+        """Carga países, provincias y responsabilidades AFIP de Odoo 18 (una lectura por modelo)"""
+        for model in REFERENCE_MODELS:
+            records = self.target.search_read(model, [], ['name'])
+            self.reference_maps[model] = (
+                {r['id'] for r in records},
+                {r['name']: r['id'] for r in records}
+            )
+
+    def resolve_reference(self, model: str, data) -> int:
+        """Busca el ID de Odoo 18 de un many2one de Odoo 16: mismo ID o mismo nombre"""
+        if not data or not isinstance(data, (list, tuple)):
+            return None
+
+        ids, by_name = self.reference_maps[model]
+        if data[0] in ids:
+            return data[0]
+
+        name = data[1] if len(data) > 1 else None
+        return by_name.get(name) if name else None
+
+    def sync_country(self, country_data) -> int:
+        """Sincroniza/busca país en Odoo 18"""
+        return self.resolve_reference('res.country', country_data)
+
+    def sync_state(self, state_data) -> int:
+        """Sincroniza/busca provincia/estado en Odoo 18"""
+        return self.resolve_reference('res.country.state', state_data)
+
+    def sync_afip_responsibility(self, afip_data) -> int:
+        """Sincroniza/busca tipo de responsabilidad AFIP en Odoo 18"""
+        return self.resolve_reference('l10n_ar.afip.responsibility.type', afip_data)
+
+    def prepare_values(self, partner: Dict) -> Dict:
+        """Prepara los valores para crear/actualizar en Odoo 18"""
+        vals = {
+            'name': partner['name'],
+            'is_company': partner.get('is_company', True),
+            'active': partner.get('active', True),
+        }
+
+        # Rangos de cliente/proveedor (solo se suben, nunca se ponen en 0:
+        # Odoo 18 puede haberlos incrementado con sus propios documentos)
+        for rank_field in RANK_FIELDS:
+            if partner.get(rank_field):
+                vals[rank_field] = partner[rank_field]
+
+        # Contacto hijo que además es cliente/proveedor
+        parent_id = self.partner_map.get(partner['parent_id'][0]) if partner.get('parent_id') else None
+        if parent_id:
+            vals['parent_id'] = parent_id
+
+        # Campos opcionales (solo incluir si tienen valor)
+        optional_fields = {
+            'email': partner.get('email'),
+            'phone': partner.get('phone'),
+            'mobile': partner.get('mobile'),
+            'vat': partner.get('vat'),
+            'ref': partner.get('ref'),
+            'street': partner.get('street'),
+            'street2': partner.get('street2'),
+            'city': partner.get('city'),
+            'zip': partner.get('zip'),
+            'website': partner.get('website'),
+        }
+
+        # Solo agregar campos que no sean False/None/''
+        for field, value in optional_fields.items():
+            if value:
+                vals[field] = value
+
+        # Campos relacionales
+        # País
+        if partner.get('country_id'):
+            country_id = self.sync_country(partner['country_id'])
+            if country_id:
+                vals['country_id'] = country_id
+
+        # Estado/Provincia
+        if partner.get('state_id'):
+            state_id = self.sync_state(partner['state_id'])
+            if state_id:
+                vals['state_id'] = state_id
+
+        # Responsabilidad AFIP
+        if partner.get('l10n_ar_afip_responsibility_type_id'):
+            afip_id = self.sync_afip_responsibility(partner['l10n_ar_afip_responsibility_type_id'])
+            if afip_id:
+                vals['l10n_ar_afip_responsibility_type_id'] = afip_id
+
+        return vals
+
+    def load_partner_mapping(self):
+        """Carga todos los external_id sync_partner_<id> de Odoo 18 en una sola llamada"""
+        if self.mapping_cache is not None:
+            rows = self.mapping_cache.rows(self.target, 'res.partner')
+        else:
+            rows = self.target.search_read(
+                'ir.model.data',
+                [
+                    ('module', '=', 'sync_script'),
+                    ('model', '=', 'res.partner'),
+                    ('name', '=like', 'sync_partner_%')
+                ],
+                ['name', 'res_id']
+            )
+
+        for row in rows:
+            prefix, source_id = split_name(row['name'])
+            if prefix == 'sync_partner_' and source_id is not None:
+                self.partner_map[source_id] = row['res_id']
+                self.partner_xmlid_ids[source_id] = row['id']
+
+        logger.info(f"✓ Mapeo precargado: {len(self.partner_map)} contactos")
+
+    def create_external_ids(self, pairs: List[Tuple[int, int]], created: bool = True):
+        """
+        Crea los external_id de varios contactos (source_id, target_id) en una llamada
+
+        Si la llamada agrupada falla se reintenta uno por uno. Un contacto que
+        sigue sin external_id pasa a la cola de fallidos y, si se acaba de
+        crear (created), se elimina de Odoo 18 para no duplicarlo en la
+        próxima ejecución; uno adoptado ya existía y se deja como estaba.
+        """
+        values_list = [{
+            'name': self.get_external_id(source_id),
+            'model': 'res.partner',
+            'module': 'sync_script',
+            'res_id': target_id
+        } for source_id, target_id in pairs]
+
+        try:
+            xmlid_ids = self.target.create_multi('ir.model.data', values_list)
+        except Exception as e:
+            logger.warning(f"⚠ Falló la creación de external_id en lote ({e}). Reintentando uno por uno...")
+            mapped = []
+            for pair, vals in zip(pairs, values_list):
+                try:
+                    mapped.append((pair, vals, self.target.create('ir.model.data', vals)))
+                except Exception as e2:
+                    source_id, target_id = pair
+                    logger.error(f"❌ Error creando external_id del contacto {source_id}: {e2}")
+                    if created:
+                        try:
+                            self.target.unlink('res.partner', [target_id])
+                        except Exception as e3:
+                            logger.error(f"❌ No se pudo eliminar el contacto sin external_id ID {target_id}: {e3}")
+                    self.record_failure(source_id, e2)
+            pairs = [pair for pair, _, _ in mapped]
+            values_list = [vals for _, vals, _ in mapped]
+            xmlid_ids = [xmlid_id for _, _, xmlid_id in mapped]
+
+        for (source_id, target_id), xmlid_id in zip(pairs, xmlid_ids):
+            self.partner_map[source_id] = target_id
+            self.partner_xmlid_ids[source_id] = xmlid_id
+
+        if self.mapping_cache is not None:
+            self.mapping_cache.record('res.partner', [
+                {'id': xmlid_id, 'name': vals['name'], 'res_id': vals['res_id']}
+                for xmlid_id, vals in zip(xmlid_ids, values_list)
+            ])
+
+    @staticmethod
+    def normalize_value(value):
+        """Normaliza un valor leído de Odoo 18 para compararlo con vals"""
+        if isinstance(value, (list, tuple)):
+            return value[0] if value else False
+        return value
+
+    def create_partners(self, items: List[Tuple[Dict, Dict]]):
+        """Crea contactos nuevos en un create múltiple y sus external_id en otro"""
+        if not items:
+            return
+
+        if self.loader is not None:
+            self.load_partners(items)
+            return
+
+        with self.write_timer.measure(len(items)):
+            try:
+                new_ids = self.target.create_multi('res.partner', [vals for _, vals in items])
+            except Exception as e:
+                # Fallback: crear uno por uno para aislar el registro con error
+                logger.warning(f"⚠ Falló la creación en lote ({e}). Reintentando uno por uno...")
+                new_ids = []
+                created = []
+                for partner, vals in items:
+                    try:
+                        new_ids.append(self.target.create('res.partner', vals))
+                        created.append((partner, vals))
+                    except Exception as e2:
+                        logger.error(f"❌ Error con {partner['name']}: {e2}")
+                        self.record_failure(partner['id'], e2)
+                items = created
+
+            self.create_external_ids([
+                (partner['id'], new_id) for (partner, _), new_id in zip(items, new_ids)
+            ])
+        # Solo cuentan los que quedaron con external_id
+        self.stats['created'] += sum(1 for partner, _ in items if partner['id'] in self.partner_map)
+
+    def load_partners(self, items: List[Tuple[Dict, Dict]]):
+        """Crea contactos nuevos y sus external_id con load() (los errores se traducen al ID de Odoo 16)"""
+        try:
+            loaded, failed = self.loader.load([
+                (partner['id'], self.get_external_id(partner['id']), vals, None)
+                for partner, vals in items
+            ])
+        except Exception as e:
+            loaded, failed = {}, {partner['id']: e for partner, _ in items}
+
+        for partner, _ in items:
+            source_id = partner['id']
+            if source_id in failed:
+                logger.error(f"❌ Error con {partner['name']}: {failed[source_id]}")
+                self.record_failure(source_id, failed[source_id])
+            elif source_id in loaded:
+                self.partner_map[source_id] = loaded[source_id]
+                self.stats['created'] += 1
+
+    def update_partners(self, items: List[Tuple[Dict, Dict]]):
+        """
+        Actualiza contactos existentes: una lectura por lote y un write por
+        cada conjunto idéntico de cambios (los que no cambiaron no se escriben)
+        """
+        if not items:
+            return
+
+        fields = sorted({field for _, vals in items for field in vals})
+        target_ids = [self.partner_map[partner['id']] for partner, _ in items]
+        source_by_target = {self.partner_map[partner['id']]: partner['id'] for partner, _ in items}
+        current = {r['id']: r for r in self.target.read('res.partner', target_ids, fields)}
+
+        groups: Dict[Tuple, List[int]] = {}
+        recreate = []
+        for partner, vals in items:
+            target_id = self.partner_map[partner['id']]
+            record = current.get(target_id)
+
+            # Mapeo apunta a un contacto eliminado en Odoo 18
+            if record is None:
+                recreate.append((partner, vals))
+                continue
+
+            changes = {}
+            for field, value in vals.items():
+                old = self.normalize_value(record.get(field))
+                if field in RANK_FIELDS and (old or 0) >= value:
+                    continue
+                if old != value:
+                    changes[field] = value
+
+            if not changes:
+                self.stats['unchanged'] += 1
+                continue
+            groups.setdefault(tuple(sorted(changes.items())), []).append(target_id)
+
+        for key, ids in groups.items():
+            changes = dict(key)
+            try:
+                self.target.write('res.partner', ids, changes)
+                self.stats['updated'] += len(ids)
+            except Exception as e:
+                logger.warning(f"⚠ Falló la escritura agrupada ({e}). Reintentando uno por uno...")
+                for target_id in ids:
+                    try:
+                        self.target.write('res.partner', [target_id], changes)
+                        self.stats['updated'] += 1
+                    except Exception as e2:
+                        logger.error(f"❌ Error actualizando contacto ID {target_id}: {e2}")
+                        self.record_failure(source_by_target[target_id], e2)
+
+        for partner, vals in recreate:
+            try:
+                new_id = self.target.create('res.partner', vals)
+                xmlid_id = self.partner_xmlid_ids[partner['id']]
+                self.target.write('ir.model.data', [xmlid_id], {'res_id': new_id})
+                self.partner_map[partner['id']] = new_id
+                if self.mapping_cache is not None:
+                    self.mapping_cache.record('res.partner', [{
+                        'id': xmlid_id, 'name': self.get_external_id(partner['id']), 'res_id': new_id
+                    }])
+                logger.info(f"✓ Recreado: {partner['name']} (ID: {new_id})")
+                self.stats['created'] += 1
+            except Exception as e:
+                logger.error(f"❌ Error con {partner['name']}: {e}")
+                self.record_failure(partner['id'], e)
+
+    def skip_unchanged(self, items: List[Tuple[Dict, Dict]]) -> List[Tuple[Dict, Dict]]:
+        """Descarta los contactos mapeados cuyos vals coinciden con la huella de lo último enviado"""
+        if not self.hash_store or not items:
+            return items
+
+        known = self.hash_store.known('res.partner', [partner['id'] for partner, _ in items])
+        pending = []
+        for partner, vals in items:
+            if known.get(partner['id']) == (vals_hash(vals), self.partner_map.get(partner['id'])):
+                self.stats['unchanged'] += 1
+            else:
+                pending.append((partner, vals))
+        return pending
+
+    def remember_pushed(self, items: List[Tuple[Dict, Dict]]):
+        """Guarda la huella de los contactos que quedaron creados o actualizados sin error"""
+        if not self.hash_store:
+            return
+        self.hash_store.save('res.partner', [
+            (partner['id'], self.partner_map[partner['id']], vals_hash(vals))
+            for partner, vals in items
+            if partner['id'] in self.partner_map and partner['id'] not in self.failed_ids
+        ])
+
+    def load_protected_partners(self):
+        """
+        Contactos de Odoo 18 que pertenecen a un usuario (también archivado,
+        ej: OdooBot) o a una compañía: adoptarlos haría que la sincronización
+        les escribiera encima
+        """
+        users = self.target.execute(
+            'res.users', 'search_read', [], fields=['partner_id'],
+            context={'active_test': False}
+        )
+        companies = self.target.search_read('res.company', [], ['partner_id'])
+        self.protected_partner_ids = {
+            record['partner_id'][0] for record in users + companies if record.get('partner_id')
+        }
+
+    def load_match_index(self):
+        """
+        Indexa en memoria vat, ref y email normalizados de los contactos de
+        Odoo 18 que aún no tienen external_id (una lectura paginada), sin los
+        contactos de usuarios ni de compañías
+        """
+        logger.info("Indexando contactos existentes en Odoo 18 (vat/ref/email)...")
+        self.match_index = {key: {} for key in MATCH_KEYS}
+        self.load_protected_partners()
+        excluded = set(self.partner_map.values()) | self.protected_partner_ids
+
+        offset = 0
+        while True:
+            page = self.target.search_read(
+                'res.partner', [('parent_id', '=', False), ('user_ids', '=', False)], list(MATCH_KEYS),
+                offset=offset, limit=self.batch_size * 10, order='id'
+            )
+            for record in page:
+                if record['id'] in excluded:
+                    continue
+                for key in MATCH_KEYS:
+                    value = NORMALIZERS[key](record.get(key))
+                    if not value:
+                        continue
+                    index = self.match_index[key]
+                    # Valor repetido en Odoo 18: no se puede adoptar con seguridad
+                    index[value] = None if value in index else record['id']
+            if len(page) < self.batch_size * 10:
+                break
+            offset += self.batch_size * 10
+
+        sizes = ', '.join(f"{key}: {len(self.match_index[key])}" for key in MATCH_KEYS)
+        logger.info(f"✓ Índices de adopción cargados ({sizes})")
+
+    def match_existing_partner(self, partner: Dict, bound: Set[int]) -> int:
+        """Busca en los índices un contacto de Odoo 18 equivalente (vat, luego ref, luego email)"""
+        for key in MATCH_KEYS:
+            value = NORMALIZERS[key](partner.get(key))
+            target_id = self.match_index[key].get(value) if value else None
+            if target_id and target_id not in bound and target_id not in self.protected_partner_ids:
+                return target_id
+        return None
+
+    def adopt_partners(self, items: List[Tuple[Dict, Dict]]):
+        """Vincula contactos nuevos con contactos ya existentes en Odoo 18 creando solo el external_id"""
+        if self.match_index is None:
+            self.load_match_index()
+
+        bound = set(self.partner_map.values())
+        pairs = []
+        for partner, _ in items:
+            target_id = self.match_existing_partner(partner, bound)
+            if target_id:
+                bound.add(target_id)
+                pairs.append((partner['id'], target_id))
+                logger.info(f"🔗 Adoptado: {partner['name']} -> ID {target_id}")
+
+        if pairs:
+            self.create_external_ids(pairs, created=False)
+            self.stats['adopted'] += sum(1 for source_id, _ in pairs if source_id in self.partner_map)
+
+    def sync_partner_batch(self, partners: List[Dict]):
+        """Sincroniza un lote de contactos con un número constante de llamadas"""
+        new_items = []
+        existing_items = []
+
+        for partner in partners:
+            try:
+                vals = self.prepare_values(partner)
+            except Exception as e:
+                logger.error(f"❌ Error con {partner['name']}: {e}")
+                self.record_failure(partner['id'], e)
+                continue
+
+            if partner['id'] in self.partner_map:
+                existing_items.append((partner, vals))
+            else:
+                new_items.append((partner, vals))
+
+        # Contactos nuevos que ya existen en Odoo 18 (cargados a mano, AFIP,
+        # POS): se vinculan y pasan a actualizarse en lugar de crearse
+        if new_items and self.adopt_existing:
+            self.adopt_partners(new_items)
+            existing_items.extend(item for item in new_items if item[0]['id'] in self.partner_map)
+            # Una adopción fallida queda en la cola: crearlo duplicaría el contacto
+            new_items = [
+                item for item in new_items
+                if item[0]['id'] not in self.partner_map and item[0]['id'] not in self.failed_ids
+            ]
+
+        existing_items = self.skip_unchanged(existing_items)
+        self.create_partners(new_items)
+        self.update_partners(existing_items)
+        self.remember_pushed(new_items + existing_items)
+
+    def get_children_from_source(self, domain: List) -> List[Dict]:
+        """Lee contactos hijos (direcciones y personas) de Odoo 16 en una llamada"""
+        domain = list(domain)
+        if SYNC_OPTIONS.get('only_active', True):
+            domain.append(('active', '=', True))
+        return self.source.search_read('res.partner', domain, CHILD_FIELDS, order='id')
+
+    def prepare_child_values(self, child: Dict) -> Dict:
+        """Prepara los valores de un contacto hijo; el padre se traduce con el mapeo precargado"""
+        child_type = child.get('type') or 'contact'
+        vals = {
+            'parent_id': self.partner_map[child['parent_id'][0]],
+            'type': CHILD_TYPE_MAP.get(child_type, child_type),
+            'active': child.get('active', True),
+        }
+
+        for field in ('name', 'function', 'email', 'phone', 'mobile',
+                      'street', 'street2', 'city', 'zip'):
+            if child.get(field):
+                vals[field] = child[field]
+
+        country_id = self.sync_country(child.get('country_id'))
+        if country_id:
+            vals['country_id'] = country_id
+
+        state_id = self.sync_state(child.get('state_id'))
+        if state_id:
+            vals['state_id'] = state_id
+
+        return vals
+
+    def sync_children_batch(self, children: List[Dict]):
+        """Sincroniza contactos hijos cuyo padre ya está mapeado (create/update en lote)"""
+        new_items = []
+        existing_items = []
+
+        for child in children:
+            # Ya sincronizado en esta ejecución como cliente/proveedor
+            if child['id'] in self.processed_ids:
+                continue
+            if not child.get('parent_id') or child['parent_id'][0] not in self.partner_map:
+                self.stats['skipped'] += 1
+                continue
+
+            self.processed_ids.add(child['id'])
+            if child.get('write_date'):
+                self.new_sync = max(self.new_sync or child['write_date'], child['write_date'])
+
+            try:
+                vals = self.prepare_child_values(child)
+            except Exception as e:
+                logger.error(f"❌ Error con contacto hijo {child['id']}: {e}")
+                self.record_failure(child['id'], e)
+                continue
+
+            if not child.get('name'):
+                child = dict(child, name=f"{child['parent_id'][1]} ({vals['type']})")
+
+            if child['id'] in self.partner_map:
+                existing_items.append((child, vals))
+            else:
+                new_items.append((child, vals))
+
+        self.stats['children'] += len(new_items) + len(existing_items)
+        existing_items = self.skip_unchanged(existing_items)
+        self.create_partners(new_items)
+        self.update_partners(existing_items)
+        self.remember_pushed(new_items + existing_items)
+
+    def sync_children(self, parents: List[Dict]):
+        """Lee (parent_id in lote) y sincroniza los contactos hijos de un lote de padres"""
+        parent_ids = [p['id'] for p in parents if p['id'] in self.partner_map]
+        if not parent_ids:
+            return
+
+        try:
+            children = self.get_children_from_source([('parent_id', 'in', parent_ids)])
+        except Exception as e:
+            logger.error(f"❌ Error obteniendo contactos hijos: {e}")
+            self.stats['errors'] += 1
+            return
+
+        self.sync_children_batch(children)
+
+    def sync_changed_children(self, since: str):
+        """
+        Sincronización incremental: hijos modificados desde la marca de agua
+        cuyo padre no cambió (y por eso no se leyeron con su lote)
+        """
+        try:
+            children = self.get_children_from_source([
+                ('parent_id', '!=', False),
+                ('write_date', '>=', since)
+            ])
+        except Exception as e:
+            logger.error(f"❌ Error obteniendo contactos hijos: {e}")
+            self.stats['errors'] += 1
+            return
+
+        if children:
+            logger.info(f"📅 {len(children)} contactos hijos modificados desde {since}")
+        for start in range(0, len(children), self.batch_size):
+            self.sync_children_batch(children[start:start + self.batch_size])
+
+    def record_failure(self, source_id: int, error: Exception):
+        """Cuenta el error y guarda el contacto en la cola de fallidos"""
+        self.stats['errors'] += 1
+        self.failed_ids.add(source_id)
+        try:
+            self.dead_letters.add('res.partner', source_id, error)
+            self.stats['queued'] += 1
+        except Exception as e:
+            logger.error(f"❌ No se pudo encolar el contacto {source_id}: {e}")
+
+    def retry_dead_letters(self):
+        """
+        Reintenta los contactos de la cola de fallidos cuyo back-off venció
+        (excepto los ya procesados en esta ejecución)
+
+        Los que ya no existen en Odoo 16 o ya no corresponden también salen
+        de la cola: no queda nada que sincronizar.
+        """
+        source_ids = [
+            sid for sid in self.dead_letters.due('res.partner')
+            if sid not in self.processed_ids
+        ]
+        if not source_ids:
+            return
+
+        logger.info("")
+        logger.info(f"♻ Reintentando {len(source_ids)} contactos de la cola de fallidos")
+
+        if not self.reference_maps:
+            # --retry-failed: no hubo pasada principal que cargara los mapeos
+            self.load_partner_mapping()
+            self.load_reference_maps()
+
+        for start in range(0, len(source_ids), self.batch_size):
+            if self.lock:
+                self.lock.check_stop()
+            chunk = source_ids[start:start + self.batch_size]
+
+            partners = self.get_partners_from_source(only_ids=chunk)
+            self.sync_partner_batch(partners)
+            self.processed_ids.update(p['id'] for p in partners)
+
+            # Hijos de los contactos recuperados (pudieron quedar sin padre)
+            if SYNC_OPTIONS.get('sync_partner_children', True):
+                self.sync_children(partners)
+
+            # Hijos fallidos: no entran en el dominio de rangos, se leen aparte
+            remaining = [sid for sid in chunk if sid not in self.processed_ids]
+            if remaining:
+                self.sync_children_batch(self.get_children_from_source([
+                    ('id', 'in', remaining),
+                    ('parent_id', '!=', False)
+                ]))
+
+        recovered = self.dead_letters.resolve(
+            'res.partner', [sid for sid in source_ids if sid not in self.failed_ids]
+        )
+        self.stats['recovered'] += recovered
+        logger.info(f"♻ Recuperados: {recovered} - Siguen fallando: {len(self.failed_ids & set(source_ids))}")
+
+    def run(self):
+        """Ejecuta la sincronización completa"""
+        start_time = datetime.now()
+
+        title = f"SINCRONIZACIÓN DE {self.label}"
+        logger.info("")
+        logger.info("╔" + "=" * 58 + "╗")
+        logger.info("║" + title.center(58) + "║")
+        logger.info("║" + "Odoo 16 → Odoo 18".center(58) + "║")
+        logger.info("╚" + "=" * 58 + "╝")
+        logger.info("")
+
+        try:
+            # Unificar external_id de los scripts de clientes/proveedores
+            self.migrate_legacy_external_ids()
+            self.load_partner_mapping()
+            self.load_reference_maps()
+
+            # Incremental por write_date, con conciliación completa periódica
+            self.get_last_sync_date()
+            full_sync = self.is_full_sync_due()
+            if full_sync:
+                logger.info("🔄 Sincronización completa (conciliación de todos los contactos)")
+
+            sync_children = SYNC_OPTIONS.get('sync_partner_children', True)
+
+            # Obtener contactos
+            partners = self.get_partners_from_source(None if full_sync else self.last_sync)
+            self.stats['total'] = len(partners)
+            self.new_sync = max(
+                (p['write_date'] for p in partners if p.get('write_date')),
+                default=self.last_sync
+            )
+
+            if not partners:
+                logger.warning("⚠ No se encontraron contactos para sincronizar")
+
+            logger.info("")
+            logger.info("=" * 60)
+            logger.info(f"SINCRONIZANDO {self.label}")
+            logger.info("=" * 60)
+
+            # Sincronizar por lotes
+            for start in range(0, len(partners), self.batch_size):
+                if self.lock:
+                    self.lock.check_stop()
+                batch = partners[start:start + self.batch_size]
+                logger.info(f"[{start + len(batch)}/{len(partners)}] Procesando lote de {len(batch)} contactos")
+                self.sync_partner_batch(batch)
+                self.processed_ids.update(p['id'] for p in batch)
+
+                # Direcciones de entrega/facturación y personas de contacto
+                if sync_children:
+                    self.sync_children(batch)
+
+            if sync_children and not full_sync and self.last_sync:
+                self.sync_changed_children(self.last_sync)
+
+            # Los que salieron bien dejan la cola; después, pasada de reintentos
+            self.stats['recovered'] += self.dead_letters.resolve(
+                'res.partner', self.processed_ids - self.failed_ids
+            )
+            self.retry_dead_letters()
+
+            # Resumen
+            elapsed = datetime.now() - start_time
+
+            logger.info("")
+            logger.info("=" * 60)
+            logger.info("RESUMEN DE SINCRONIZACIÓN")
+            logger.info("=" * 60)
+            logger.info(f"Total procesados: {self.stats['total']}")
+            logger.info(f"✓ Creados:       {self.stats['created']}")
+            logger.info(f"✓ Actualizados:  {self.stats['updated']}")
+            logger.info(f"= Sin cambios:   {self.stats['unchanged']}")
+            logger.info(f"↻ IDs migrados:  {self.stats['migrated']}")
+            logger.info(f"🔗 Adoptados:     {self.stats['adopted']}")
+            logger.info(f"👥 Contactos hijos: {self.stats['children']}")
+            logger.info(f"⚠ Duplicados:    {self.stats['duplicates']}")
+            logger.info(f"❌ Errores:       {self.stats['errors']}")
+            logger.info(f"📥 En cola:       {self.stats['queued']}")
+            logger.info(f"♻ Recuperados:   {self.stats['recovered']}")
+            logger.info(f"⚡ Altas:          {self.write_timer.summary()}")
+            logger.info(f"⏱ Tiempo:         {elapsed}")
+            logger.info("=" * 60)
+
+            # La marca de agua avanza si todos los errores quedaron en la cola
+            # de fallidos (se reintentan aparte, no hace falta releerlos)
+            if self.stats['errors'] == self.stats['queued']:
+                if self.new_sync:
+                    self.save_sync_date(
+                        self.new_sync,
+                        datetime.now() if full_sync else self.last_full_sync
+                    )
+            else:
+                logger.warning("⚠ Marca de agua sin avanzar: hubo errores fuera de la cola de fallidos")
+
+            if self.stats['errors'] == 0:
+                logger.info("✓ ¡Sincronización completada exitosamente!")
+            else:
+                logger.warning(f"⚠ Completado con {self.stats['errors']} errores")
+
+        except Exception as e:
+            logger.error(f"❌ Error crítico en sincronización: {e}")
+            raise
+
+
+if __name__ == "__main__":
+    if '--bulk-load' in sys.argv:
+        SYNC_OPTIONS['bulk_load'] = True
+    try:
+        lock = StageLock('partners', policy=policy_from_argv(sys.argv))
+        if not lock.acquire():
+            sys.exit(0)
+        try:
+            sync = PartnerSync(full='--full' in sys.argv, lock=lock)
+            if '--retry-failed' in sys.argv:
+                sync.retry_dead_letters()
+            else:
+                sync.run()
+        finally:
+            lock.release()
+    except StopRequested as e:
+        logger.warning(f"🛑 {e}")
+        sys.exit(EXIT_STOPPED)
+    except KeyboardInterrupt:
+        logger.info("\n⚠ Sincronización interrumpida por el usuario")
+        sys.exit(0)
+    except Exception as e:
+        logger.error(f"❌ Error fatal: {e}")
+        sys.exit(1)
@@ -6,12 +6,16 @@ Odoo 16 (VPS) -> Odoo 18 (Local)
 Sincroniza:
 - Listas de Precios (product.pricelist)
 - Reglas de Precios (product.pricelist.item)
+- Eliminaciones: reglas y listas borradas en origen (las listas archivadas
+  se sincronizan con active=False y conservan sus reglas)
 
 ¡MODIFICADO para Odoo 16+: Se eliminó 'parent_id', 'discount_policy' y 'sequence'
 de product.pricelist.item!
 
 Uso:
     python3 sync_pricelists.py
+    python3 sync_pricelists.py --retry-failed   (solo reintenta la cola de fallidos)
+    python3 sync_pricelists.py --bulk-load      (escribe las reglas con load())
 """
 
 import xmlrpc.client
@@ -43,6 +47,19 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+from sync_lock import StageLock, StopRequested, EXIT_STOPPED, policy_from_argv
+from sync_dead_letter import DeadLetterQueue
+from sync_session import source_map_from_rows
+from sync_mapping_store import default_mapping_cache
+from sync_hash_store import default_hash_store, vals_hash
+from sync_snapshot import source_snapshot
+from sync_bulk_load import bulk_loader, WriteTimer
+
+# Lecturas de origen que incluyen registros archivados: las reglas tienen
+# 'active' relacionado (almacenado) con el de su lista, así que archivar una
+# lista las ocultaría y la conciliación las tomaría por eliminadas
+WITH_ARCHIVED = {'active_test': False}
+
 
 # =======================================================
 # CLASE OdooConnection 
@@ -51,12 +68,18 @@ logger = logging.getLogger(__name__)
 class OdooConnection:
     """Maneja la conexión a una instancia de Odoo"""
     
-    def __init__(self, config: Dict, name: str):
+    def __init__(self, config: Dict, name: str, session=None):
         self.config = config
         self.name = name
         self.uid = None
         self.models = None
-        self.connect()
+        
+        if session:
+            # Sesión compartida (sync_all.py en proceso): sin autenticar de nuevo
+            self.uid = session.uid
+            self.models = session.models
+        else:
+            self.connect()
     
     def connect(self):
         """Establece la conexión con Odoo"""
@@ -96,13 +119,16 @@ class OdooConnection:
             kwargs
         )
     
-    def search_read(self, model: str, domain: List, fields: List, offset: int = 0, limit: int = 0) -> List[Dict]:
+    def search_read(self, model: str, domain: List, fields: List, offset: int = 0, limit: int = 0,
+                    context: Dict = None) -> List[Dict]:
         """Busca y lee registros"""
         kwargs = {'fields': fields}
         if offset > 0:
              kwargs['offset'] = offset
         if limit > 0:
              kwargs['limit'] = limit
+        if context:
+            kwargs['context'] = context
         
         try:
             return self.models.execute_kw(
@@ -119,20 +145,36 @@ class OdooConnection:
             logger.error(f"Domain: {domain}")
             raise
     
-    def search(self, model: str, domain: List, limit: int = None) -> List[int]:
+    def search(self, model: str, domain: List, limit: int = None, context: Dict = None) -> List[int]:
         """Busca IDs de registros"""
         kwargs = {}
         if limit:
             kwargs['limit'] = limit
+        if context:
+            kwargs['context'] = context
         return self.execute(model, 'search', domain, kwargs)
     
+    def read(self, model: str, record_ids: List[int], fields: List) -> List[Dict]:
+        """Lee registros por ID"""
+        return self.execute(model, 'read', record_ids, fields)
+    
     def create(self, model: str, values: Dict) -> int:
         """Crea un registro"""
         return self.execute(model, 'create', values)
     
+    def create_multi(self, model: str, values_list: List[Dict]) -> List[int]:
+        """Crea varios registros en una sola llamada"""
+        if not values_list:
+            return []
+        return self.execute(model, 'create', values_list)
+    
     def write(self, model: str, record_ids: List[int], values: Dict) -> bool:
         """Actualiza registros"""
         return self.execute(model, 'write', record_ids, values)
+    
+    def unlink(self, model: str, record_ids: List[int]) -> bool:
+        """Elimina registros"""
+        return self.execute(model, 'unlink', record_ids)
 
 # =======================================================
 # CLASE PriceListSync
@@ -141,9 +183,17 @@ class OdooConnection:
 class PriceListSync:
     """Sincroniza Listas de Precios (product.pricelist y product.pricelist.item)"""
     
-    def __init__(self):
-        self.source = OdooConnection(ODOO_16, "Odoo 16 (VPS)")
-        self.target = OdooConnection(ODOO_18, "Odoo 18 (Local)")
+    def __init__(self, source_session=None, target_session=None, mapping_cache=None, lock=None):
+        self.source = OdooConnection(ODOO_16, "Odoo 16 (VPS)", session=source_session)
+        self.target = OdooConnection(ODOO_18, "Odoo 18 (Local)", session=target_session)
+        
+        # Mapeos de ir.model.data compartidos entre etapas (sync_all.py en
+        # proceso) o, si el script corre solo, el almacén local (sync_mapping_store.py)
+        self.mapping_cache = mapping_cache if mapping_cache is not None else default_mapping_cache()
+        
+        # Bloqueo de la etapa (sync_lock.py): entre lotes se revisa si otra
+        # invocación pidió detenerla
+        self.lock = lock
         
         # Mapeo de IDs (source_id -> target_id)
         self.pricelist_map: Dict[int, int] = {}
@@ -161,18 +211,48 @@ class PriceListSync:
         self.pricelist_item_fields = [
             'id', 'name', 'applied_on', 'min_quantity', 'base', 'price_surcharge',
             'price_discount', 'price_round', 'price_min_margin', 'price_max_margin',
-            'compute_price', 'date_start', 'date_end', 
+            'compute_price', 'fixed_price', 'percent_price', 'date_start', 'date_end', 
             'product_tmpl_id', 
             'product_id',      
             'categ_id',        
             'pricelist_id',    
+            'base_pricelist_id',
         ]
         
+        # Cantidad de reglas por create/read agrupado
+        self.batch_size = SYNC_OPTIONS.get('pricelist_batch_size', 500)
+        
+        # Sincronización incremental: nueva marca de agua y reglas eliminadas en origen
+        self.new_sync = None
+        self.deleted_item_ids = set()
+        
+        # Conciliación: IDs de origen leídos en esta ejecución (None = lectura fallida)
+        self.source_pricelist_ids = None
+        self.source_item_ids = None
+        self.synced_pricelist_map: Dict[int, int] = {}
+        
         self.stats = {
-            'pricelists': {'total': 0, 'created': 0, 'updated': 0, 'errors': 0},
-            'pricelist_items': {'total': 0, 'created': 0, 'updated': 0, 'errors': 0}
+            'pricelists': {'total': 0, 'created': 0, 'updated': 0, 'removed': 0, 'errors': 0,
+                           'queued': 0, 'recovered': 0},
+            'pricelist_items': {'total': 0, 'created': 0, 'updated': 0, 'unchanged': 0, 'removed': 0,
+                                'errors': 0, 'queued': 0, 'recovered': 0}
         }
         
+        # Cola de fallidos: listas y reglas con error se reintentan después y
+        # no frenan la marca de agua
+        self.dead_letters = DeadLetterQueue()
+        self.failed_ids: Dict[str, Set[int]] = {'product.pricelist': set(), 'product.pricelist.item': set()}
+        self.processed_item_ids: Set[int] = set()
+        
+        # Huellas de los últimos vals enviados: las reglas que no cambiaron
+        # no se leen ni se escriben en Odoo 18 (sync_hash_store.py)
+        self.hash_store = default_hash_store()
+        
+        # Carga masiva con load() (sync_bulk_load.py): las reglas se crean o
+        # actualizan junto con su external_id en una llamada por lote
+        self.loader = bulk_loader(self.target, 'product.pricelist.item', self.mapping_cache)
+        self.write_timer = self.loader.timer if self.loader else WriteTimer('create/write')
+        
         # Mapeos de IDs externos para dependencias
         self.product_tmpl_map = self._load_external_id_map('product.template')
         self.product_map = self._load_external_id_map('product.product')
@@ -183,29 +263,22 @@ class PriceListSync:
         """Carga el mapeo de IDs de Odoo 16 (Source) a Odoo 18 (Target)
            para modelos dependientes (ej: productos, categorías, monedas)."""
         
-        model_clean = model.replace('.', '_')
-        domain = [
-            ('model', '=', model),
-            ('module', '=', 'sync_script') # Módulo que usas en tu script de categorías
-        ]
-        fields = ['name', 'res_id']
+        # Solo los nombres sync_<modelo>_<id> exactos: con un prefijo más
+        # largo (sync_product_pricelist_item_15 al leer product.pricelist)
+        # el resto no es el ID de origen
+        prefix = f"sync_{model.replace('.', '_')}_"
         
         logger.info(f"Cargando mapeo de IDs para el modelo: {model}...")
         try:
-            data = self.target.search_read('ir.model.data', domain, fields)
-            
-            id_map = {}
-            for rec in data:
-                try:
-                    # Extraer source_id: sync_product_template_123 -> 123
-                    name_parts = rec['name'].split('_')
-                    if len(name_parts) >= 3 and name_parts[0] == 'sync' and name_parts[1] == model_clean:
-                        source_id = int(name_parts[-1])
-                        target_id = rec['res_id']
-                        id_map[source_id] = target_id
-                except ValueError:
-                    logger.warning(f"No se pudo parsear el external ID: {rec['name']}")
-                    continue
+            if self.mapping_cache is not None:
+                id_map = self.mapping_cache.source_map(self.target, model, prefix)
+            else:
+                data = self.target.search_read(
+                    'ir.model.data',
+                    [('model', '=', model), ('module', '=', 'sync_script')],
+                    ['name', 'res_id']
+                )
+                id_map = source_map_from_rows(data, prefix)
             
             logger.info(f"✓ Mapeo cargado para {model}: {len(id_map)} IDs encontrados.")
             return id_map
@@ -213,6 +286,32 @@ class PriceListSync:
             logger.error(f"❌ Error al cargar mapeo para {model}: {e}")
             return {}
 
+    def get_last_sync_date(self) -> str:
+        """Obtiene la write_date (reloj de Odoo 16) de la última sincronización de reglas"""
+        try:
+            sync_file = 'last_pricelist_sync.txt'
+            
+            if os.path.exists(sync_file):
+                with open(sync_file, 'r') as f:
+                    last_sync = f.read().strip()
+                    if last_sync:
+                        logger.info(f"✓ Última sincronización de reglas: {last_sync}")
+                        return last_sync
+        except Exception as e:
+            logger.warning(f"No se pudo leer última sincronización: {e}")
+        
+        return None
+    
+    def save_sync_date(self, sync_date: str):
+        """Guarda la marca de agua de la sincronización de reglas"""
+        try:
+            with open('last_pricelist_sync.txt', 'w') as f:
+                f.write(sync_date)
+            
+            logger.info(f"✓ Fecha de sincronización guardada: {sync_date}")
+        except Exception as e:
+            logger.warning(f"No se pudo guardar fecha de sincronización: {e}")
+    
     def get_external_id(self, model: str, source_id: int) -> str:
         """Genera un external_id único para mapear registros"""
         model_clean = model.replace('.', '_')
@@ -245,16 +344,68 @@ class PriceListSync:
             return None
     
     def create_external_id(self, model: str, external_id: str, record_id: int):
-        """Crea un external_id en Odoo 18"""
-        try:
-            self.target.create('ir.model.data', {
-                'name': external_id,
+        """Crea un external_id en Odoo 18 (las excepciones las maneja quien llama)"""
+        xmlid_id = self.target.create('ir.model.data', {
+            'name': external_id,
+            'model': model,
+            'module': 'sync_script',
+            'res_id': record_id
+        })
+        if self.mapping_cache is not None:
+            self.mapping_cache.record(model, [{'id': xmlid_id, 'name': external_id, 'res_id': record_id}])
+    
+    def create_external_ids(self, model: str, records: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+        """
+        Crea en una sola llamada los external_ids de varios registros (source_id, target_id)
+        
+        Si la llamada agrupada falla se reintenta uno por uno. Un registro que
+        sigue sin external_id se elimina de Odoo 18 (si no, la próxima
+        ejecución lo crearía de nuevo) y pasa a la cola de fallidos.
+        
+        Returns:
+            list: los (source_id, target_id) que quedaron mapeados
+        """
+        if not records:
+            return []
+        
+        values_list = [
+            {
+                'name': self.get_external_id(model, source_id),
                 'model': model,
                 'module': 'sync_script',
-                'res_id': record_id
-            })
+                'res_id': target_id
+            }
+            for source_id, target_id in records
+        ]
+        try:
+            xmlid_ids = self.target.create_multi('ir.model.data', values_list)
+            if self.mapping_cache is not None:
+                self.mapping_cache.record(model, [
+                    {'id': xmlid_id, 'name': vals['name'], 'res_id': vals['res_id']}
+                    for xmlid_id, vals in zip(xmlid_ids, values_list)
+                ])
+            return list(records)
+        except Exception as e:
+            logger.warning(f"⚠ Falló la creación agrupada de external_ids ({len(records)} registros), "
+                           f"reintentando uno por uno: {e}")
+        
+        mapped = []
+        for (source_id, target_id), vals in zip(records, values_list):
+            try:
+                self.create_external_id(model, vals['name'], target_id)
+                mapped.append((source_id, target_id))
+            except Exception as e:
+                logger.error(f"❌ Error creando external_id de {model} {source_id}: {e}")
+                self.discard_unmapped(model, target_id)
+                self.record_failure(model, source_id, e)
+        return mapped
+    
+    def discard_unmapped(self, model: str, target_id: int):
+        """Elimina un registro recién creado que quedó sin external_id"""
+        try:
+            self.target.unlink(model, [target_id])
         except Exception as e:
-            logger.error(f"Error creando external_id: {e}")
+            logger.error(f"❌ No se pudo eliminar {model} {target_id} sin external_id: {e}")
 
     # ========================================
     # LISTAS DE PRECIOS (product.pricelist)
@@ -269,16 +420,24 @@ class PriceListSync:
         
         try:
             # Obtener todas las listas de precios
-            pricelists = self.source.search_read('product.pricelist', [], self.pricelist_fields)
+            pricelists = self.source.search_read(
+                'product.pricelist', [], self.pricelist_fields, context=WITH_ARCHIVED
+            )
+            self.source_pricelist_ids = {pricelist['id'] for pricelist in pricelists}
             
             logger.info(f"✓ Encontradas {len(pricelists)} listas de precios")
             self.stats['pricelists']['total'] = len(pricelists)
             
+            # Mapeo de listas ya sincronizadas (una sola lectura)
+            self.synced_pricelist_map = self._load_external_id_map('product.pricelist')
+            
             if not pricelists:
                 return
             
             # Sincronizar en orden
             for i, pricelist in enumerate(pricelists, 1):
+                if self.lock:
+                    self.lock.check_stop()
                 logger.info(f"[{i}/{len(pricelists)}] Procesando Lista: {pricelist['name']}")
                 self.sync_pricelist(pricelist)
                 
@@ -286,6 +445,8 @@ class PriceListSync:
             
         except Exception as e:
             logger.error(f"❌ Error sincronizando listas de precios: {e}")
+            # Sin listas leídas no hay conciliación ni marca de agua nueva
+            self.stats['pricelists']['errors'] += 1
 
     def sync_pricelist(self, pricelist: Dict):
         """Sincroniza una lista de precios individual"""
@@ -310,7 +471,7 @@ class PriceListSync:
                     vals['currency_id'] = self.get_default_currency_id() 
             
             # Buscar si existe
-            existing_id = self.find_existing_record('product.pricelist', external_id)
+            existing_id = self.synced_pricelist_map.get(source_id)
             
             if existing_id:
                 # Actualizar 
@@ -320,13 +481,18 @@ class PriceListSync:
             else:
                 # Crear
                 new_id = self.target.create('product.pricelist', vals)
-                self.create_external_id('product.pricelist', external_id, new_id)
+                try:
+                    self.create_external_id('product.pricelist', external_id, new_id)
+                except Exception:
+                    # Sin external_id la próxima ejecución la duplicaría
+                    self.discard_unmapped('product.pricelist', new_id)
+                    raise
                 self.stats['pricelists']['created'] += 1
                 self.pricelist_map[source_id] = new_id
                 
         except Exception as e:
             logger.error(f"❌ Error con Lista de Precios {pricelist_name}: {e}")
-            self.stats['pricelists']['errors'] += 1
+            self.record_failure('product.pricelist', source_id, e)
 
     def get_default_currency_id(self) -> int:
         """Obtiene el ID de la moneda por defecto del Target (Odoo 18)"""
@@ -350,7 +516,14 @@ class PriceListSync:
     # ========================================
     
     def sync_pricelist_items(self):
-        """Sincroniza las reglas de precios asociadas a las listas"""
+        """
+        Sincroniza las reglas de precios asociadas a las listas
+        
+        Carga una sola vez el mapeo de reglas ya sincronizadas, crea las
+        nuevas con create múltiple por bloque (y sus external_ids en una
+        llamada por bloque) y agrupa las actualizaciones, saltando las reglas
+        cuyos valores normalizados no cambiaron.
+        """
         logger.info("")
         logger.info("=" * 60)
         logger.info("SINCRONIZANDO REGLAS DE PRECIOS (product.pricelist.item)")
@@ -363,85 +536,581 @@ class PriceListSync:
         # Solo buscar reglas para las listas de precios que se han sincronizado
         source_pricelist_ids = list(self.pricelist_map.keys())
         domain = [('pricelist_id', 'in', source_pricelist_ids)] 
+        fields = self.pricelist_item_fields + ['write_date']
+        
+        # Sincronización incremental: solo reglas modificadas desde la última vez
+        last_sync = None
+        if SYNC_OPTIONS.get('incremental_pricelist_sync', False):
+            last_sync = self.get_last_sync_date()
         
         try:
-            # Obtener todas las reglas
-            items = self.source.search_read('product.pricelist.item', domain, self.pricelist_item_fields)
+            # Mapeo de reglas ya sincronizadas (una sola lectura)
+            item_map = self._load_external_id_map('product.pricelist.item')
+            self.pricelist_item_map.update(item_map)
+            
+            if last_sync:
+                items = self.source.search_read(
+                    'product.pricelist.item', domain + [('write_date', '>=', last_sync)], fields,
+                    context=WITH_ARCHIVED
+                )
+                logger.info(f"📅 Sincronización incremental: {len(items)} reglas modificadas desde {last_sync}")
+                
+                # Comparación de conjuntos de IDs (solo IDs, sin campos):
+                # reglas eliminadas en origen y reglas aún no sincronizadas
+                source_ids = set(self.source.search('product.pricelist.item', domain, context=WITH_ARCHIVED))
+                read_ids = {item['id'] for item in items}
+                missing_ids = source_ids - set(item_map.keys()) - read_ids
+                
+                if missing_ids:
+                    items.extend(self.source.search_read(
+                        'product.pricelist.item', [('id', 'in', list(missing_ids))], fields,
+                        context=WITH_ARCHIVED
+                    ))
+                    logger.info(f"✓ {len(missing_ids)} reglas sin sincronizar agregadas")
+            else:
+                # Obtener todas las reglas
+                items = self.source.search_read('product.pricelist.item', domain, fields, context=WITH_ARCHIVED)
+                source_ids = {item['id'] for item in items}
+            
+            self.deleted_item_ids = set(item_map.keys()) - source_ids
+            self.source_item_ids = source_ids
+            if self.deleted_item_ids:
+                logger.info(f"⚠ {len(self.deleted_item_ids)} reglas ya no existen en Odoo 16")
             
             logger.info(f"✓ Encontradas {len(items)} reglas de precios para sincronizar")
             self.stats['pricelist_items']['total'] = len(items)
             
-            for i, item in enumerate(items, 1):
-                logger.debug(f"[{i}/{len(items)}] Procesando Regla: {item.get('name', 'Regla sin nombre')}")
-                self.sync_pricelist_item(item)
+            self.sync_items(items)
+            
+            # Nueva marca de agua con el reloj de Odoo 16 (solo si el lote terminó)
+            self.new_sync = max((item['write_date'] for item in items if item.get('write_date')), default=last_sync)
                 
         except Exception as e:
             logger.error(f"❌ Error sincronizando reglas de precios: {e}")
+            # Error sin regla asociada ni cola: retiene la marca de agua
+            self.stats['pricelist_items']['errors'] += 1
 
-    def sync_pricelist_item(self, item: Dict):
-        """Sincroniza una regla de precios individual"""
-        source_id = item['id']
-        external_id = self.get_external_id('product.pricelist.item', source_id)
+    def sync_items(self, items: List[Dict]):
+        """Prepara reglas leídas de Odoo 16 y las crea o actualiza en bloque"""
+        # Plantillas referenciadas que no tienen external_id propio
+        self.complete_template_map(items)
         
-        # Obtener el ID de la lista de precios (pricelist_id) del origen
-        pricelist_source_id = item.get('pricelist_id')[0] 
+        model = 'product.pricelist.item'
+        to_create = []  # (source_id, vals)
+        to_update = []  # (source_id, target_id, vals)
+        digests: Dict[int, str] = {}
+        known = self.hash_store.known(model, [item['id'] for item in items]) if self.hash_store else {}
+        
+        for item in items:
+            vals = self.prepare_item_values(item)
+            if vals is None:
+                continue
+            
+            target_id = self.pricelist_item_map.get(item['id'])
+            digests[item['id']] = vals_hash(vals)
+            if target_id and known.get(item['id']) == (digests[item['id']], target_id):
+                # Mismos vals que la última vez sobre la misma regla
+                self.stats['pricelist_items']['unchanged'] += 1
+                self.processed_item_ids.add(item['id'])
+            elif target_id:
+                to_update.append((item['id'], target_id, vals))
+            else:
+                to_create.append((item['id'], vals))
+        
+        logger.info(f"⏳ {len(to_create)} reglas nuevas, {len(to_update)} existentes para comparar")
+        
+        if self.loader is not None:
+            self.load_pricelist_items(to_update + [(source_id, None, vals) for source_id, vals in to_create])
+        else:
+            with self.write_timer.measure(len(to_update) + len(to_create)):
+                self.update_pricelist_items(to_update)
+                self.create_pricelist_items(to_create)
+        
+        if self.hash_store:
+            pushed = [source_id for source_id, _, _ in to_update] + [source_id for source_id, _ in to_create]
+            self.hash_store.save(model, [
+                (source_id, self.pricelist_item_map[source_id], digests[source_id])
+                for source_id in pushed
+                if source_id in self.pricelist_item_map and source_id not in self.failed_ids[model]
+            ])
+
+    def complete_template_map(self, items: List[Dict]):
+        """
+        Completa el mapeo de plantillas (product.template) a partir de las variantes
+        
+        sync_products.py solo registra external_ids de product.product, así que
+        las plantillas usadas por reglas '1_product' se deducen leyendo en bloque
+        una variante mapeada de cada plantilla en ambos lados.
+        """
+        missing = {
+            item['product_tmpl_id'][0] for item in items
+            if item.get('product_tmpl_id') and item['product_tmpl_id'][0] not in self.product_tmpl_map
+        }
+        
+        if not missing or not self.product_map:
+            return
         
         try:
-            # 1. Preparar valores
-            vals = {k: v for k, v in item.items() if k in self.pricelist_item_fields and k != 'id'}
-            
-            # 2. Mapear la Lista de Precios
-            pricelist_target_id = self.pricelist_map.get(pricelist_source_id)
-            if not pricelist_target_id:
-                logger.error(f"❌ Error: Lista de Precios {pricelist_source_id} (Origen) no mapeada. Regla {source_id} no sincronizada.")
-                self.stats['pricelist_items']['errors'] += 1
+            source_variants = None
+            snapshot = source_snapshot('product.product', ['product_tmpl_id'])
+            if snapshot is not None:
+                try:
+                    # Plantilla de cada variante mapeada, desde la instantánea local
+                    snapshot.refresh(self.source)
+                    source_variants = [
+                        variant for variant in snapshot.rows(self.product_map, ['product_tmpl_id']).values()
+                        if variant['product_tmpl_id'] and variant['product_tmpl_id'][0] in missing
+                    ]
+                except Exception as e:
+                    logger.warning(f"⚠ No se pudo usar la instantánea local ({e}), leyendo de Odoo 16")
+            
+            if source_variants is None:
+                source_variants = self.source.search_read(
+                    'product.product',
+                    [('product_tmpl_id', 'in', list(missing))],
+                    ['product_tmpl_id']
+                )
+            
+            # Plantilla de origen -> variante de destino
+            target_variant_by_tmpl = {}
+            for variant in source_variants:
+                target_variant = self.product_map.get(variant['id'])
+                if target_variant:
+                    target_variant_by_tmpl.setdefault(variant['product_tmpl_id'][0], target_variant)
+            
+            if not target_variant_by_tmpl:
                 return
             
-            vals['pricelist_id'] = pricelist_target_id # Asignar el ID del destino
-            
-            # 3. Mapear Dependencias según 'applied_on'
-            applied_on = vals.get('applied_on')
-            
-            if applied_on == '1_product': # Producto Variante (product.product)
-                product_id = vals.pop('product_id', False)
-                if product_id and isinstance(product_id, (list, tuple)):
-                    vals['product_id'] = self.product_map.get(product_id[0])
-            
-            elif applied_on == '2_product_category': # Categoría de Producto (product.category)
-                categ_id = vals.pop('categ_id', False)
-                if categ_id and isinstance(categ_id, (list, tuple)):
-                    vals['categ_id'] = self.category_map.get(categ_id[0])
-                    
-            elif applied_on == '3_product_template': # Producto Plantilla (product.template)
-                product_tmpl_id = vals.pop('product_tmpl_id', False)
-                if product_tmpl_id and isinstance(product_tmpl_id, (list, tuple)):
-                    vals['product_tmpl_id'] = self.product_tmpl_map.get(product_tmpl_id[0])
-
-            # 4. Manejar Campos de Fecha (Asegurar que son strings o None)
-            for date_field in ['date_start', 'date_end']:
-                if vals.get(date_field) and isinstance(vals[date_field], datetime):
-                    vals[date_field] = vals[date_field].strftime('%Y-%m-%d')
-                
-            # 5. Buscar si existe
-            existing_id = self.find_existing_record('product.pricelist.item', external_id)
+            target_variants = self.target.read(
+                'product.product',
+                list(set(target_variant_by_tmpl.values())),
+                ['product_tmpl_id']
+            )
+            target_tmpl = {v['id']: v['product_tmpl_id'][0] for v in target_variants}
             
-            if existing_id:
-                # Actualizar
-                self.target.write('product.pricelist.item', [existing_id], vals)
-                self.stats['pricelist_items']['updated'] += 1
-                self.pricelist_item_map[source_id] = existing_id
+            for source_tmpl_id, target_variant in target_variant_by_tmpl.items():
+                if target_variant in target_tmpl:
+                    self.product_tmpl_map[source_tmpl_id] = target_tmpl[target_variant]
+            
+            logger.info(f"✓ Plantillas deducidas desde variantes: {len(target_variant_by_tmpl)}")
+        except Exception as e:
+            logger.warning(f"⚠ No se pudo completar el mapeo de plantillas: {e}")
+
+    def prepare_item_values(self, item: Dict) -> Dict:
+        """
+        Prepara los valores de una regla de precios para Odoo 18
+        
+        Returns:
+            dict con los valores, o None si falta una dependencia obligatoria
+        """
+        source_id = item['id']
+        
+        # Obtener el ID de la lista de precios (pricelist_id) del origen
+        pricelist_source_id = item['pricelist_id'][0] if item.get('pricelist_id') else None
+        
+        # 1. Preparar valores ('name' es calculado, no se escribe)
+        vals = {
+            k: v for k, v in item.items()
+            if k in self.pricelist_item_fields and k not in ('id', 'name')
+        }
+        
+        # 2. Mapear la Lista de Precios
+        pricelist_target_id = self.pricelist_map.get(pricelist_source_id)
+        if not pricelist_target_id:
+            logger.error(f"❌ Error: Lista de Precios {pricelist_source_id} (Origen) no mapeada. Regla {source_id} no sincronizada.")
+            self.record_failure('product.pricelist.item', source_id,
+                                LookupError(f"Lista de Precios {pricelist_source_id} no mapeada"))
+            return None
+        
+        vals['pricelist_id'] = pricelist_target_id # Asignar el ID del destino
+        
+        # 3. Mapear todas las dependencias informadas
+        # applied_on: '0_product_variant' → product_id, '1_product' → product_tmpl_id,
+        #             '2_product_category' → categ_id, '3_global' → ninguna
+        relation_maps = {
+            'product_id': self.product_map,
+            'product_tmpl_id': self.product_tmpl_map,
+            'categ_id': self.category_map,
+            'base_pricelist_id': self.pricelist_map,
+        }
+        for field, id_map in relation_maps.items():
+            value = vals.pop(field, False)
+            if value and isinstance(value, (list, tuple)):
+                vals[field] = id_map.get(value[0], False)
             else:
-                # Crear
-                new_id = self.target.create('product.pricelist.item', vals)
-                self.create_external_id('product.pricelist.item', external_id, new_id)
-                self.stats['pricelist_items']['created'] += 1
+                vals[field] = False
+        
+        required_field = {
+            '0_product_variant': 'product_id',
+            '1_product': 'product_tmpl_id',
+            '2_product_category': 'categ_id',
+        }.get(vals.get('applied_on'))
+        
+        if required_field and not vals.get(required_field):
+            logger.error(
+                f"❌ Error: {required_field} de la Regla {source_id} (Lista {pricelist_source_id}) "
+                f"no mapeado. Regla no sincronizada."
+            )
+            self.record_failure('product.pricelist.item', source_id,
+                                LookupError(f"{required_field} no mapeado"))
+            return None
+        
+        # 4. Manejar Campos de Fecha (Asegurar que son strings o None)
+        for date_field in ['date_start', 'date_end']:
+            if vals.get(date_field) and isinstance(vals[date_field], datetime):
+                vals[date_field] = vals[date_field].strftime('%Y-%m-%d')
+        
+        return vals
+
+    def normalize_value(self, value):
+        """Normaliza un valor leído/escrito por XML-RPC para poder compararlo"""
+        if isinstance(value, (list, tuple)):
+            # many2one: [id, nombre] -> id
+            return value[0] if value else False
+        if value is None or value == '':
+            return False
+        if isinstance(value, float):
+            return round(value, 6)
+        return value
+
+    def create_pricelist_items(self, to_create: List[Tuple[int, Dict]]):
+        """Crea reglas nuevas con create múltiple por bloque y sus external_ids en una llamada"""
+        model = 'product.pricelist.item'
+        
+        for i in range(0, len(to_create), self.batch_size):
+            if self.lock:
+                self.lock.check_stop()
+            chunk = to_create[i:i + self.batch_size]
+            
+            try:
+                new_ids = self.target.create_multi(model, [vals for _, vals in chunk])
+                created = list(zip([source_id for source_id, _ in chunk], new_ids))
+            except Exception as e:
+                logger.warning(f"⚠ Falló la creación agrupada, reintentando regla por regla: {e}")
+                created = []
+                for source_id, vals in chunk:
+                    try:
+                        created.append((source_id, self.target.create(model, vals)))
+                    except Exception as e:
+                        logger.error(f"❌ Error con Regla de Precio {source_id}: {e}")
+                        self.record_failure(model, source_id, e)
+            
+            created = self.create_external_ids(model, created)
+            
+            for source_id, new_id in created:
                 self.pricelist_item_map[source_id] = new_id
+                self.processed_item_ids.add(source_id)
+            self.stats['pricelist_items']['created'] += len(created)
+            
+            logger.info(f"✓ Creadas {len(created)} reglas ({i + len(chunk)}/{len(to_create)})")
+
+    def update_pricelist_items(self, to_update: List[Tuple[int, int, Dict]]):
+        """
+        Actualiza reglas existentes con escrituras agrupadas
+        
+        Lee los valores actuales del bloque en una llamada, calcula solo los
+        campos que cambiaron y escribe una vez por cada conjunto de cambios
+        idéntico (ej: el mismo descuento aplicado a cientos de reglas).
+        """
+        model = 'product.pricelist.item'
+        
+        for i in range(0, len(to_update), self.batch_size):
+            if self.lock:
+                self.lock.check_stop()
+            chunk = to_update[i:i + self.batch_size]
+            fields = sorted({field for _, _, vals in chunk for field in vals})
+            
+            current = {
+                rec['id']: rec for rec in self.target.search_read(
+                    model, [('id', 'in', [target_id for _, target_id, _ in chunk])], fields,
+                    context=WITH_ARCHIVED
+                )
+            }
+            
+            # {cambios normalizados: [(source_id, target_id)]}
+            groups: Dict[Tuple, List[Tuple[int, int]]] = {}
+            
+            for source_id, target_id, vals in chunk:
+                self.pricelist_item_map[source_id] = target_id
                 
-        except Exception as e:
-            logger.error(f"❌ Error con Regla de Precio {source_id} (Lista {pricelist_source_id}): {e}")
-            self.stats['pricelist_items']['errors'] += 1
+                if target_id not in current:
+                    logger.error(f"❌ Regla {source_id}: el registro {target_id} ya no existe en Odoo 18")
+                    self.record_failure(model, source_id,
+                                        LookupError(f"registro {target_id} inexistente en Odoo 18"))
+                    continue
+                
+                changes = tuple(sorted(
+                    (field, self.normalize_value(value)) for field, value in vals.items()
+                    if self.normalize_value(value) != self.normalize_value(current[target_id].get(field))
+                ))
+                
+                if changes:
+                    groups.setdefault(changes, []).append((source_id, target_id))
+                else:
+                    self.stats['pricelist_items']['unchanged'] += 1
+                    self.processed_item_ids.add(source_id)
+            
+            for changes, records in groups.items():
+                values = dict(changes)
+                try:
+                    self.target.write(model, [target_id for _, target_id in records], values)
+                    self.stats['pricelist_items']['updated'] += len(records)
+                    self.processed_item_ids.update(source_id for source_id, _ in records)
+                except Exception as e:
+                    logger.warning(f"⚠ Falló la actualización agrupada, reintentando regla por regla: {e}")
+                    for source_id, target_id in records:
+                        try:
+                            self.target.write(model, [target_id], values)
+                            self.stats['pricelist_items']['updated'] += 1
+                            self.processed_item_ids.add(source_id)
+                        except Exception as e:
+                            logger.error(f"❌ Error con Regla de Precio {source_id}: {e}")
+                            self.record_failure(model, source_id, e)
+            
+            logger.info(
+                f"✓ Comparadas {i + len(chunk)}/{len(to_update)} reglas "
+                f"({len(groups)} escrituras agrupadas)"
+            )
 
+    def load_pricelist_items(self, records: List[Tuple[int, int, Dict]]):
+        """
+        Crea o actualiza reglas con load() por bloque (source_id, target_id o None, vals)
+        
+        Cada regla va con su external_id en la misma llamada: no quedan reglas
+        sin mapeo si algo falla a mitad de camino.
+        """
+        model = 'product.pricelist.item'
+        
+        for i in range(0, len(records), self.batch_size):
+            if self.lock:
+                self.lock.check_stop()
+            chunk = records[i:i + self.batch_size]
+            
+            try:
+                loaded, failed = self.loader.load([
+                    (source_id, self.get_external_id(model, source_id), vals, target_id)
+                    for source_id, target_id, vals in chunk
+                ])
+            except Exception as e:
+                loaded, failed = {}, {source_id: e for source_id, _, _ in chunk}
+            
+            for source_id, target_id, _ in chunk:
+                if source_id in failed:
+                    logger.error(f"❌ Error con Regla de Precio {source_id}: {failed[source_id]}")
+                    self.record_failure(model, source_id, failed[source_id])
+                elif source_id in loaded:
+                    self.pricelist_item_map[source_id] = loaded[source_id]
+                    stat = 'updated' if loaded[source_id] == target_id else 'created'
+                    self.stats['pricelist_items'][stat] += 1
+                    self.processed_item_ids.add(source_id)
+            
+            logger.info(f"⚡ Cargadas con load() {len(loaded)} reglas ({i + len(chunk)}/{len(records)})")
 
+    # ========================================
+    # CONCILIACIÓN DE ELIMINADOS
+    # ========================================
+    
+    def reconcile_deleted(self):
+        """
+        Propaga a Odoo 18 las listas y reglas que ya no existen en Odoo 16
+        
+        Compara los IDs de origen leídos en esta ejecución con los mapeos
+        precargados (sync_product_pricelist_% / sync_product_pricelist_item_%):
+        las reglas huérfanas se eliminan y las listas huérfanas se archivan
+        (o eliminan, según 'pricelist_orphan_action'), en llamadas por bloque.
+        """
+        logger.info("")
+        logger.info("=" * 60)
+        logger.info("CONCILIANDO LISTAS Y REGLAS ELIMINADAS EN ODOO 16")
+        logger.info("=" * 60)
+        
+        # Sin una lectura completa del origen no se puede decidir qué sobra
+        if not self.source_pricelist_ids or self.source_item_ids is None:
+            logger.warning("⚠ Lectura de origen incompleta. Se omite la conciliación.")
+            return
+        
+        # Una lista con error no entra en el dominio de reglas: sus reglas parecerían eliminadas
+        if self.stats['pricelists']['errors']:
+            logger.warning("⚠ Hubo errores sincronizando listas. Se omite la conciliación.")
+            return
+        
+        # 1. Reglas: no tienen 'active' propio, se eliminan solo las que ya no existen
+        orphan_items = sorted({
+            self.pricelist_item_map[source_id] for source_id in self.confirm_deleted_items()
+            if source_id in self.pricelist_item_map
+        })
+        self.stats['pricelist_items']['removed'] += self.remove_records(
+            'product.pricelist.item', orphan_items, 'unlink'
+        )
+        
+        # 2. Listas de precios
+        action = SYNC_OPTIONS.get('pricelist_orphan_action', 'archive')
+        orphan_pricelists = [
+            target_id for source_id, target_id in self.synced_pricelist_map.items()
+            if source_id not in self.source_pricelist_ids
+        ]
+        
+        if orphan_pricelists and action == 'archive':
+            # Solo las que siguen activas
+            orphan_pricelists = self.target.search(
+                'product.pricelist', [('id', 'in', orphan_pricelists), ('active', '=', True)]
+            )
+        
+        self.stats['pricelists']['removed'] += self.remove_records(
+            'product.pricelist', orphan_pricelists, action
+        )
+        
+        logger.info(
+            f"✓ Conciliación: {self.stats['pricelist_items']['removed']} reglas eliminadas, "
+            f"{self.stats['pricelists']['removed']} listas ({action})"
+        )
+    
+    def confirm_deleted_items(self) -> Set[int]:
+        """
+        Reglas de deleted_item_ids que de verdad no existen en Odoo 16
+        
+        Vuelve a buscarlas por ID, incluidas las archivadas y sin filtrar por
+        lista: una regla que sigue en origen (aunque su lista esté archivada o
+        no se haya leído en esta ejecución) nunca se elimina.
+        """
+        candidates = sorted(self.deleted_item_ids)
+        still_there = set()
+        for i in range(0, len(candidates), self.batch_size):
+            still_there.update(
+                item['id'] for item in self.source.search_read(
+                    'product.pricelist.item', [('id', 'in', candidates[i:i + self.batch_size])],
+                    ['id'], context=WITH_ARCHIVED
+                )
+            )
+        
+        if still_there:
+            logger.warning(f"⚠ {len(still_there)} reglas siguen existiendo en Odoo 16. No se eliminan.")
+        return set(candidates) - still_there
+    
+    def remove_records(self, model: str, record_ids: List[int], action: str) -> int:
+        """
+        Archiva o elimina registros en bloques
+        
+        Si un bloque falla se reintenta registro por registro.
+        
+        Returns:
+            int: cantidad de registros archivados/eliminados
+        """
+        removed = 0
+        stats_key = 'pricelist_items' if model == 'product.pricelist.item' else 'pricelists'
+        
+        def apply(ids):
+            if action == 'unlink':
+                self.target.unlink(model, ids)
+            else:
+                self.target.write(model, ids, {'active': False})
+        
+        for i in range(0, len(record_ids), self.batch_size):
+            chunk = record_ids[i:i + self.batch_size]
+            try:
+                apply(chunk)
+                removed += len(chunk)
+            except Exception as e:
+                logger.warning(f"⚠ Falló la conciliación agrupada de {model}, reintentando uno por uno: {e}")
+                for record_id in chunk:
+                    try:
+                        apply([record_id])
+                        removed += 1
+                    except Exception as e:
+                        logger.error(f"❌ Error conciliando {model} {record_id}: {e}")
+                        self.stats[stats_key]['errors'] += 1
+        
+        return removed
+    
+    # ========================================
+    # COLA DE FALLIDOS
+    # ========================================
+    
+    def record_failure(self, model: str, source_id: int, error: Exception):
+        """Cuenta el error y guarda la lista o regla en la cola de fallidos"""
+        stats_key = 'pricelist_items' if model == 'product.pricelist.item' else 'pricelists'
+        self.stats[stats_key]['errors'] += 1
+        self.failed_ids[model].add(source_id)
+        try:
+            self.dead_letters.add(model, source_id, error)
+            self.stats[stats_key]['queued'] += 1
+        except Exception as e:
+            logger.error(f"❌ No se pudo encolar {model} {source_id}: {e}")
+    
+    def resolve_processed(self):
+        """Saca de la cola las listas y reglas que esta ejecución sincronizó bien"""
+        processed = {
+            'product.pricelist': set(self.pricelist_map),
+            'product.pricelist.item': self.processed_item_ids,
+        }
+        for model, source_ids in processed.items():
+            stats_key = 'pricelist_items' if model == 'product.pricelist.item' else 'pricelists'
+            self.stats[stats_key]['recovered'] += self.dead_letters.resolve(
+                model, source_ids - self.failed_ids[model]
+            )
+    
+    def retry_dead_letters(self):
+        """
+        Reintenta las listas y reglas de la cola de fallidos cuyo back-off
+        venció (excepto las ya procesadas en esta ejecución)
+        
+        Las que ya no existen en Odoo 16 también salen de la cola: no queda
+        nada que sincronizar.
+        """
+        pricelist_ids = [
+            sid for sid in self.dead_letters.due('product.pricelist')
+            if sid not in (self.source_pricelist_ids or ())
+        ]
+        item_ids = [
+            sid for sid in self.dead_letters.due('product.pricelist.item')
+            if sid not in self.processed_item_ids and sid not in self.failed_ids['product.pricelist.item']
+        ]
+        if not pricelist_ids and not item_ids:
+            return
+        
+        logger.info("")
+        logger.info(f"♻ Reintentando {len(pricelist_ids)} listas y {len(item_ids)} reglas de la cola de fallidos")
+        
+        if not self.synced_pricelist_map:
+            # --retry-failed: no hubo pasada principal que cargara los mapeos
+            self.synced_pricelist_map = self._load_external_id_map('product.pricelist')
+            self.pricelist_map.update(self.synced_pricelist_map)
+            self.pricelist_item_map.update(self._load_external_id_map('product.pricelist.item'))
+        
+        if pricelist_ids:
+            for pricelist in self.source.search_read(
+                'product.pricelist', [('id', 'in', pricelist_ids)], self.pricelist_fields,
+                context=WITH_ARCHIVED
+            ):
+                self.sync_pricelist(pricelist)
+        
+        read_item_ids = set()
+        for i in range(0, len(item_ids), self.batch_size):
+            if self.lock:
+                self.lock.check_stop()
+            items = self.source.search_read(
+                'product.pricelist.item', [('id', 'in', item_ids[i:i + self.batch_size])],
+                self.pricelist_item_fields, context=WITH_ARCHIVED
+            )
+            read_item_ids.update(item['id'] for item in items)
+            self.sync_items(items)
+        
+        # Reglas: salen las escritas con éxito y las que ya no existen en origen
+        item_ids = [sid for sid in item_ids if sid in self.processed_item_ids or sid not in read_item_ids]
+        
+        for model, source_ids in (('product.pricelist', pricelist_ids),
+                                  ('product.pricelist.item', item_ids)):
+            stats_key = 'pricelist_items' if model == 'product.pricelist.item' else 'pricelists'
+            recovered = self.dead_letters.resolve(
+                model, [sid for sid in source_ids if sid not in self.failed_ids[model]]
+            )
+            self.stats[stats_key]['recovered'] += recovered
+        
+        logger.info(
+            f"♻ Recuperados: {self.stats['pricelists']['recovered']} listas, "
+            f"{self.stats['pricelist_items']['recovered']} reglas"
+        )
+    
     def run(self):
         """Ejecuta la sincronización completa de las listas y reglas de precios"""
         start_time = datetime.now()
@@ -460,6 +1129,16 @@ class PriceListSync:
             # Sincronizar Reglas de Precios
             self.sync_pricelist_items()
             
+            # Propagar listas y reglas eliminadas en origen
+            if SYNC_OPTIONS.get('pricelist_reconcile', True):
+                if self.lock:
+                    self.lock.check_stop()
+                self.reconcile_deleted()
+            
+            # Las que salieron bien dejan la cola; después, pasada de reintentos
+            self.resolve_processed()
+            self.retry_dead_letters()
+            
             # Resumen
             elapsed = datetime.now() - start_time
             
@@ -472,18 +1151,39 @@ class PriceListSync:
             logger.info(f"   Total:          {self.stats['pricelists']['total']}")
             logger.info(f"   ✓ Creadas:      {self.stats['pricelists']['created']}")
             logger.info(f"   ✓ Actualizadas: {self.stats['pricelists']['updated']}")
+            logger.info(f"   🗑 Conciliadas:  {self.stats['pricelists']['removed']}")
             logger.info(f"   ❌ Errores:      {self.stats['pricelists']['errors']}")
+            logger.info(f"   📥 En cola:      {self.stats['pricelists']['queued']}")
             
             logger.info("\n📜 REGLAS DE PRECIOS (product.pricelist.item):")
             logger.info(f"   Total:          {self.stats['pricelist_items']['total']}")
             logger.info(f"   ✓ Creadas:      {self.stats['pricelist_items']['created']}")
             logger.info(f"   ✓ Actualizadas: {self.stats['pricelist_items']['updated']}")
+            logger.info(f"   ⊙ Sin cambios:  {self.stats['pricelist_items']['unchanged']}")
+            logger.info(f"   🗑 Eliminadas:   {self.stats['pricelist_items']['removed']}")
             logger.info(f"   ❌ Errores:      {self.stats['pricelist_items']['errors']}")
+            logger.info(f"   📥 En cola:      {self.stats['pricelist_items']['queued']}")
+            logger.info(f"   ♻ Recuperadas:  {self.stats['pricelist_items']['recovered']}")
             
-            logger.info(f"\n⏱ Tiempo total: {elapsed}")
+            logger.info(f"\n⚡ Escritura de reglas: {self.write_timer.summary()}")
+            logger.info(f"⏱ Tiempo total: {elapsed}")
             logger.info("=" * 60)
             
             total_errors = self.stats['pricelists']['errors'] + self.stats['pricelist_items']['errors']
+            total_queued = self.stats['pricelists']['queued'] + self.stats['pricelist_items']['queued']
+            
+            # Avanzar la marca de agua si todos los errores quedaron en la cola
+            # de fallidos (se reintentan aparte, no hace falta releerlos). Una
+            # lista con error no entra en el dominio de reglas: sus reglas no se
+            # leyeron y el reintento de la lista no las relee, así que la marca
+            # se retiene hasta que la lista se sincronice
+            if SYNC_OPTIONS.get('incremental_pricelist_sync', False) and self.new_sync:
+                if self.stats['pricelists']['errors']:
+                    logger.warning("⚠ Marca de agua sin avanzar: hubo listas con error (sus reglas no se leyeron)")
+                elif total_errors == total_queued:
+                    self.save_sync_date(self.new_sync)
+                else:
+                    logger.warning("⚠ Marca de agua sin avanzar: hubo errores fuera de la cola de fallidos")
             
             if total_errors == 0:
                 logger.info("✓ ¡Sincronización de Listas de Precios completada exitosamente!")
@@ -496,9 +1196,23 @@ class PriceListSync:
 
 
 if __name__ == "__main__":
+    if '--bulk-load' in sys.argv:
+        SYNC_OPTIONS['bulk_load'] = True
     try:
-        sync = PriceListSync()
-        sync.run()
+        lock = StageLock('pricelists', policy=policy_from_argv(sys.argv))
+        if not lock.acquire():
+            sys.exit(0)
+        try:
+            sync = PriceListSync(lock=lock)
+            if '--retry-failed' in sys.argv:
+                sync.retry_dead_letters()
+            else:
+                sync.run()
+        finally:
+            lock.release()
+    except StopRequested as e:
+        logger.warning(f"🛑 {e}")
+        sys.exit(EXIT_STOPPED)
     except KeyboardInterrupt:
         logger.info("\n⚠ Sincronización interrumpida por el usuario")
         sys.exit(0)
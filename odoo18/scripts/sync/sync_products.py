@@ -11,12 +11,14 @@ Sincroniza:
 
 Uso:
     python3 sync_products.py
+    python3 sync_products.py --retry-failed   (solo reintenta la cola de fallidos)
+    python3 sync_products.py --bulk-load      (escribe con load() por lotes)
 """
 
 import xmlrpc.client
 import logging
 from datetime import datetime
-from typing import Dict, List
+from typing import Dict, List, Set, Tuple
 import sys
 import os
 
@@ -45,16 +47,30 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+from sync_lock import StageLock, StopRequested, EXIT_STOPPED, policy_from_argv
+from sync_dead_letter import DeadLetterQueue
+from sync_session import source_map_from_rows
+from sync_mapping_store import default_mapping_cache
+from sync_hash_store import default_hash_store, vals_hash
+from sync_snapshot import source_snapshot
+from sync_bulk_load import bulk_loader, WriteTimer
+
 
 class OdooConnection:
     """Maneja la conexión a una instancia de Odoo"""
     
-    def __init__(self, config: Dict, name: str):
+    def __init__(self, config: Dict, name: str, session=None):
         self.config = config
         self.name = name
         self.uid = None
         self.models = None
-        self.connect()
+        
+        if session:
+            # Sesión compartida (sync_all.py en proceso): sin autenticar de nuevo
+            self.uid = session.uid
+            self.models = session.models
+        else:
+            self.connect()
     
     def connect(self):
         """Establece la conexión con Odoo"""
@@ -135,9 +151,17 @@ class OdooConnection:
 class ProductSync:
     """Sincroniza productos entre dos instancias de Odoo"""
     
-    def __init__(self):
-        self.source = OdooConnection(ODOO_16, "Odoo 16 (VPS)")
-        self.target = OdooConnection(ODOO_18, "Odoo 18 (Local)")
+    def __init__(self, source_session=None, target_session=None, mapping_cache=None, lock=None):
+        self.source = OdooConnection(ODOO_16, "Odoo 16 (VPS)", session=source_session)
+        self.target = OdooConnection(ODOO_18, "Odoo 18 (Local)", session=target_session)
+        
+        # Mapeos de ir.model.data compartidos entre etapas (sync_all.py en
+        # proceso) o, si el script corre solo, el almacén local (sync_mapping_store.py)
+        self.mapping_cache = mapping_cache if mapping_cache is not None else default_mapping_cache()
+        
+        # Bloqueo de la etapa (sync_lock.py): entre lotes se revisa si otra
+        # invocación pidió detenerla
+        self.lock = lock
         
         # Mapeos de categorías (necesarios para vincular productos)
         self.category_map = {}
@@ -163,9 +187,27 @@ class ProductSync:
             'created': 0,
             'updated': 0,
             'errors': 0,
-            'images_synced': 0
+            'unchanged': 0,
+            'images_synced': 0,
+            'queued': 0,
+            'recovered': 0
         }
         
+        # Huellas de los últimos vals enviados: los productos que no
+        # cambiaron no se escriben (sync_hash_store.py)
+        self.hash_store = default_hash_store()
+        
+        # Cola de fallidos: los productos con error se reintentan después y
+        # no frenan la marca de agua
+        self.dead_letters = DeadLetterQueue()
+        self.failed_ids: Set[int] = set()
+        
+        # Carga masiva con load() (sync_bulk_load.py): los productos se
+        # acumulan y se escriben por lote junto con su external_id
+        self.loader = bulk_loader(self.target, 'product.product', self.mapping_cache)
+        self.pending: List[Tuple[Dict, Dict, int, str]] = []
+        self.write_timer = self.loader.timer if self.loader else WriteTimer('create/write')
+        
         # Cargar mapeos de categorías
         self.load_category_mappings()
         
@@ -261,43 +303,35 @@ class ProductSync:
         except Exception as e:
             logger.warning(f"⚠ Error cargando mapeo de impuestos: {e}")
     
+    def read_source_map(self, model: str, prefix: str) -> Dict[int, int]:
+        """ID de Odoo 16 -> ID de Odoo 18 de los external_id <prefix><id> (del almacén o caché si lo hay)"""
+        if self.mapping_cache is not None:
+            return self.mapping_cache.source_map(self.target, model, prefix)
+        
+        rows = self.target.search_read(
+            'ir.model.data',
+            [
+                ('model', '=', model),
+                ('module', '=', 'sync_script'),
+                ('name', 'like', f'{prefix}%')
+            ],
+            ['name', 'res_id']
+        )
+        return source_map_from_rows(rows, prefix)
+    
     def load_category_mappings(self):
         """Carga los mapeos de categorías sincronizadas previamente"""
         logger.info("Cargando mapeos de categorías...")
         
         try:
             # Cargar categorías de productos
-            product_cats = self.target.search_read(
-                'ir.model.data',
-                [
-                    ('model', '=', 'product.category'),
-                    ('module', '=', 'sync_script'),
-                    ('name', 'like', 'sync_product_category_%')
-                ],
-                ['name', 'res_id']
-            )
-            
-            for cat in product_cats:
-                source_id = int(cat['name'].replace('sync_product_category_', ''))
-                self.category_map[source_id] = cat['res_id']
+            self.category_map.update(self.read_source_map('product.category', 'sync_product_category_'))
             
             logger.info(f"✓ Cargadas {len(self.category_map)} categorías de productos")
             
             # Cargar categorías POS
             try:
-                pos_cats = self.target.search_read(
-                    'ir.model.data',
-                    [
-                        ('model', '=', 'pos.category'),
-                        ('module', '=', 'sync_script'),
-                        ('name', 'like', 'sync_pos_category_%')
-                    ],
-                    ['name', 'res_id']
-                )
-                
-                for cat in pos_cats:
-                    source_id = int(cat['name'].replace('sync_pos_category_', ''))
-                    self.pos_category_map[source_id] = cat['res_id']
+                self.pos_category_map.update(self.read_source_map('pos.category', 'sync_pos_category_'))
                 
                 logger.info(f"✓ Cargadas {len(self.pos_category_map)} categorías de POS")
             except:
@@ -305,20 +339,10 @@ class ProductSync:
             
             # Cargar categorías públicas
             try:
-                public_cats = self.target.search_read(
-                    'ir.model.data',
-                    [
-                        ('model', '=', 'product.public.category'),
-                        ('module', '=', 'sync_script'),
-                        ('name', 'like', 'sync_product_public_category_%')
-                    ],
-                    ['name', 'res_id']
+                self.public_category_map.update(
+                    self.read_source_map('product.public.category', 'sync_product_public_category_')
                 )
                 
-                for cat in public_cats:
-                    source_id = int(cat['name'].replace('sync_product_public_category_', ''))
-                    self.public_category_map[source_id] = cat['res_id']
-                
                 logger.info(f"✓ Cargadas {len(self.public_category_map)} categorías públicas")
             except:
                 logger.info("⚠ No se encontraron categorías públicas")
@@ -362,8 +386,8 @@ class ProductSync:
         except Exception as e:
             logger.warning(f"No se pudo guardar fecha de sincronización: {e}")
     
-    def get_products_from_source(self) -> List[Dict]:
-        """Obtiene productos desde Odoo 16 de uno en uno"""
+    def get_products_from_source(self, only_ids: List[int] = None) -> List[Dict]:
+        """Obtiene productos desde Odoo 16 de uno en uno (solo only_ids si se indican)"""
         logger.info("=" * 60)
         logger.info("OBTENIENDO PRODUCTOS DESDE ODOO 16")
         logger.info("=" * 60)
@@ -375,8 +399,12 @@ class ProductSync:
         if SYNC_OPTIONS.get('only_active', True):
             domain.append(('active', '=', True))
         
+        if only_ids is not None:
+            # Reintento de la cola de fallidos: solo esos productos
+            domain.append(('id', 'in', only_ids))
+        
         # Sincronización incremental
-        if SYNC_OPTIONS.get('incremental_sync', False):
+        elif SYNC_OPTIONS.get('incremental_sync', False):
             last_sync = self.get_last_sync_date()
             if last_sync:
                 domain.append(('write_date', '>', last_sync))
@@ -423,16 +451,36 @@ class ProductSync:
             fields.extend(custom_fields)
             logger.info(f"✓ Campos personalizados: {', '.join(custom_fields)}")
         
-        # Descargar productos de uno en uno
         products = []
-        logger.info("")
-        logger.info("📦 Descargando datos de productos (sin imágenes)...")
+        pending_ids = product_ids
         
-        for i, product_id in enumerate(product_ids, 1):
+        # Instantánea local: solo se descargan los productos cuya write_date cambió
+        snapshot = source_snapshot('product.product', fields)
+        if snapshot is not None:
+            try:
+                logger.info("")
+                logger.info("🗂️  Actualizando instantánea local de productos...")
+                downloaded = snapshot.refresh(self.source, max_age=0)
+                cached = snapshot.rows(product_ids, fields)
+                products = [cached[product_id] for product_id in product_ids if product_id in cached]
+                pending_ids = [product_id for product_id in product_ids if product_id not in cached]
+                logger.info(f"✓ Instantánea: {downloaded} productos descargados, "
+                            f"{len(products)} leídos localmente")
+            except Exception as e:
+                logger.warning(f"⚠ No se pudo usar la instantánea local ({e}), descargando directo")
+                products = []
+                pending_ids = product_ids
+        
+        # Descargar de uno en uno los que no salieron de la instantánea
+        if pending_ids:
+            logger.info("")
+            logger.info("📦 Descargando datos de productos (sin imágenes)...")
+        
+        for i, product_id in enumerate(pending_ids, 1):
             try:
                 # Mostrar progreso cada 50 productos
                 if i % 50 == 0 or i == 1:
-                    logger.info(f"⏳ Descargando producto {i}/{len(product_ids)}...")
+                    logger.info(f"⏳ Descargando producto {i}/{len(pending_ids)}...")
                 
                 # Leer este producto específico
                 product_data = self.source.search_read(
@@ -462,8 +510,10 @@ class ProductSync:
                             logger.info(f"✓ Producto {product_id} descargado sin campos personalizados")
                     except Exception as e2:
                         logger.error(f"❌ No se pudo descargar producto {product_id}: {e2}")
+                        self.record_failure(product_id, e2)
                 else:
                     logger.error(f"❌ Error descargando producto {product_id}: {e}")
+                    self.record_failure(product_id, e)
         
         logger.info(f"✓ Descargados {len(products)} productos exitosamente")
         
@@ -729,6 +779,9 @@ class ProductSync:
     def find_existing_product(self, external_id: str) -> int:
         """Busca si el producto ya existe en Odoo 18"""
         try:
+            if self.mapping_cache is not None:
+                return self.mapping_cache.lookup(self.target, 'product.product', external_id)
+            
             existing = self.target.search(
                 'ir.model.data',
                 [
@@ -754,12 +807,16 @@ class ProductSync:
     def create_external_id(self, external_id: str, record_id: int):
         """Crea un external_id en Odoo 18"""
         try:
-            self.target.create('ir.model.data', {
+            xmlid_id = self.target.create('ir.model.data', {
                 'name': external_id,
                 'model': 'product.product',
                 'module': 'sync_script',
                 'res_id': record_id
             })
+            if self.mapping_cache is not None:
+                self.mapping_cache.record(
+                    'product.product', [{'id': xmlid_id, 'name': external_id, 'res_id': record_id}]
+                )
         except Exception as e:
             logger.error(f"Error creando external_id: {e}")
     
@@ -782,25 +839,111 @@ class ProductSync:
             
             # Buscar si existe
             existing_id = self.find_existing_product(external_id)
+            digest = vals_hash(vals)
             
-            if existing_id:
-                # Actualizar producto existente
-                self.target.write('product.product', [existing_id], vals)
-                logger.info(f"✓ Actualizado: [{product_ref}] {product_name} (ID: {existing_id})")
-                self.stats['updated'] += 1
-            else:
-                # Crear nuevo producto
-                new_id = self.target.create('product.product', vals)
-                
-                # Crear external_id para futuras sincronizaciones
-                self.create_external_id(external_id, new_id)
-                
-                logger.info(f"✓ Creado: [{product_ref}] {product_name} (ID: {new_id})")
-                self.stats['created'] += 1
+            if existing_id and self.hash_store and \
+                    self.hash_store.get('product.product', source_id) == (digest, existing_id):
+                # Mismos vals que la última vez sobre el mismo registro: nada que escribir
+                self.stats['unchanged'] += 1
+                return
+            
+            if self.loader is not None:
+                # Carga masiva: se escribe con el lote (flush_pending)
+                self.pending.append((product, vals, existing_id, digest))
+                if len(self.pending) >= self.loader.batch_size:
+                    self.flush_pending()
+                return
+            
+            with self.write_timer.measure():
+                if existing_id:
+                    # Actualizar producto existente
+                    self.target.write('product.product', [existing_id], vals)
+                    logger.info(f"✓ Actualizado: [{product_ref}] {product_name} (ID: {existing_id})")
+                    self.stats['updated'] += 1
+                else:
+                    # Crear nuevo producto
+                    existing_id = self.target.create('product.product', vals)
+                    
+                    # Crear external_id para futuras sincronizaciones
+                    self.create_external_id(external_id, existing_id)
+                    
+                    logger.info(f"✓ Creado: [{product_ref}] {product_name} (ID: {existing_id})")
+                    self.stats['created'] += 1
+            
+            if self.hash_store:
+                self.hash_store.save('product.product', [(source_id, existing_id, digest)])
                 
         except Exception as e:
             logger.error(f"❌ Error con [{product_ref}] {product_name}: {e}")
-            self.stats['errors'] += 1
+            self.record_failure(source_id, e)
+    
+    def flush_pending(self):
+        """Escribe con load() los productos acumulados (un lote, con sus external_id)"""
+        if not self.pending:
+            return
+        pending, self.pending = self.pending, []
+        
+        try:
+            loaded, failed = self.loader.load([
+                (product['id'], self.get_external_id(product['id']), vals, existing_id)
+                for product, vals, existing_id, _ in pending
+            ])
+        except Exception as e:
+            # Falló algo fuera de load() (ej: fields_get): todo el lote a la cola
+            loaded, failed = {}, {product['id']: e for product, _, _, _ in pending}
+        
+        pushed = []
+        for product, vals, existing_id, digest in pending:
+            source_id = product['id']
+            if source_id in failed:
+                logger.error(f"❌ Error con [{product.get('default_code', 'Sin ref')}] "
+                             f"{product['name']}: {failed[source_id]}")
+                self.record_failure(source_id, failed[source_id])
+            elif source_id in loaded:
+                # Un external_id que apuntaba a un producto borrado se recrea
+                self.stats['updated' if loaded[source_id] == existing_id else 'created'] += 1
+                pushed.append((source_id, loaded[source_id], digest))
+        
+        if self.hash_store:
+            self.hash_store.save('product.product', pushed)
+        logger.info(f"⚡ Lote cargado con load(): {len(pushed)} productos, {len(failed)} con error")
+    
+    def record_failure(self, source_id: int, error: Exception):
+        """Cuenta el error y guarda el producto en la cola de fallidos"""
+        self.stats['errors'] += 1
+        self.failed_ids.add(source_id)
+        try:
+            self.dead_letters.add('product.product', source_id, error)
+            self.stats['queued'] += 1
+        except Exception as e:
+            logger.error(f"❌ No se pudo encolar el producto {source_id}: {e}")
+    
+    def retry_dead_letters(self, exclude: Set[int] = frozenset()):
+        """
+        Reintenta los productos de la cola de fallidos cuyo back-off venció
+        
+        Los que ya no existen (o se archivaron) en Odoo 16 también salen de
+        la cola: no queda nada que sincronizar.
+        """
+        source_ids = [sid for sid in self.dead_letters.due('product.product') if sid not in exclude]
+        if not source_ids:
+            return
+        
+        logger.info("")
+        logger.info(f"♻ Reintentando {len(source_ids)} productos de la cola de fallidos")
+        
+        products = self.get_products_from_source(only_ids=source_ids)
+        for product in products:
+            if self.lock:
+                self.lock.check_stop()
+            self.sync_product(product)
+        self.flush_pending()
+        
+        recovered = self.dead_letters.resolve(
+            'product.product', [sid for sid in source_ids if sid not in self.failed_ids]
+        )
+        self.stats['recovered'] += recovered
+        logger.info(f"♻ Recuperados: {recovered} - Siguen fallando: {len(self.failed_ids & set(source_ids))}")
     
     def run(self):
         """Ejecuta la sincronización completa"""
@@ -820,6 +963,7 @@ class ProductSync:
             
             if not products:
                 logger.warning("⚠ No se encontraron productos para sincronizar")
+                self.retry_dead_letters()
                 return
             
             logger.info("")
@@ -829,6 +973,9 @@ class ProductSync:
             
             # Sincronizar cada producto
             for i, product in enumerate(products, 1):
+                if self.lock:
+                    self.lock.check_stop()
+                
                 product_ref = product.get('default_code', 'Sin ref')
                 
                 # Mostrar progreso cada 10 productos
@@ -836,6 +983,14 @@ class ProductSync:
                     logger.info(f"[{i}/{len(products)}] Procesando: [{product_ref}] {product['name']}")
                 
                 self.sync_product(product)
+            self.flush_pending()
+            
+            # Los que salieron bien dejan la cola; después, pasada de reintentos
+            processed = {product['id'] for product in products}
+            self.stats['recovered'] += self.dead_letters.resolve(
+                'product.product', processed - self.failed_ids
+            )
+            self.retry_dead_letters(exclude=processed)
             
             # Resumen
             elapsed = datetime.now() - start_time
@@ -847,28 +1002,51 @@ class ProductSync:
             logger.info(f"Total procesados: {self.stats['total']}")
             logger.info(f"✓ Creados:       {self.stats['created']}")
             logger.info(f"✓ Actualizados:  {self.stats['updated']}")
+            logger.info(f"= Sin cambios:   {self.stats['unchanged']}")
             logger.info(f"🖼️  Imágenes:      {self.stats['images_synced']}")
             logger.info(f"❌ Errores:       {self.stats['errors']}")
+            logger.info(f"📥 En cola:       {self.stats['queued']}")
+            logger.info(f"♻ Recuperados:   {self.stats['recovered']}")
+            logger.info(f"⚡ Escritura:      {self.write_timer.summary()}")
             logger.info(f"⏱ Tiempo:         {elapsed}")
             logger.info("=" * 60)
             
             if self.stats['errors'] == 0:
                 logger.info("✓ ¡Sincronización completada exitosamente!")
-                # Guardar fecha de sincronización solo si fue exitosa
-                if SYNC_OPTIONS.get('incremental_sync', False):
-                    self.save_sync_date()
             else:
                 logger.warning(f"⚠ Completado con {self.stats['errors']} errores")
             
+            # Guardar fecha de sincronización si todos los errores quedaron en
+            # la cola de fallidos (se reintentan aparte, no hace falta releerlos)
+            if SYNC_OPTIONS.get('incremental_sync', False):
+                if self.stats['errors'] == self.stats['queued']:
+                    self.save_sync_date()
+                else:
+                    logger.warning("⚠ Marca de agua sin avanzar: hubo errores fuera de la cola de fallidos")
+            
         except Exception as e:
             logger.error(f"❌ Error crítico en sincronización: {e}")
             raise
 
 
 if __name__ == "__main__":
+    if '--bulk-load' in sys.argv:
+        SYNC_OPTIONS['bulk_load'] = True
     try:
-        sync = ProductSync()
-        sync.run()
+        lock = StageLock('products', policy=policy_from_argv(sys.argv))
+        if not lock.acquire():
+            sys.exit(0)
+        try:
+            sync = ProductSync(lock=lock)
+            if '--retry-failed' in sys.argv:
+                sync.retry_dead_letters()
+            else:
+                sync.run()
+        finally:
+            lock.release()
+    except StopRequested as e:
+        logger.warning(f"🛑 {e}")
+        sys.exit(EXIT_STOPPED)
     except KeyboardInterrupt:
         logger.info("\n⚠ Sincronización interrumpida por el usuario")
         sys.exit(0)
@@ -0,0 +1,128 @@
+"""
+Sesiones y mapeos compartidos para ejecutar varias etapas en un solo proceso
+
+Lo usa sync_all.py en modo en proceso: cada servidor se autentica una sola
+vez (la primera vez que una etapa lo necesita, sin consultar la versión) y
+los mapeos de ir.model.data (sync_script) se leen una vez y se comparten
+entre etapas.
+
+Los scripts siguen funcionando solos: si no reciben sesión se conectan
+por su cuenta, y sin caché usan el almacén local de sync_mapping_store.py
+(o leen sus mapeos de Odoo 18 si 'mapping_store' está desactivado).
+"""
+
+import threading
+import xmlrpc.client
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+def split_name(name: str) -> Tuple[str, Optional[int]]:
+    """
+    Separa un external_id sync_script en prefijo e ID de Odoo 16
+
+    sync_product_pricelist_item_15 -> ('sync_product_pricelist_item_', 15)
+    Los nombres sin ID numérico al final devuelven (name, None).
+    """
+    head, _, tail = name.rpartition('_')
+    if head and tail.isdigit():
+        return head + '_', int(tail)
+    return name, None
+
+
+def source_map_from_rows(rows: List[Dict], prefix: str) -> Dict[int, int]:
+    """ID de Odoo 16 -> ID de Odoo 18 de las filas {name, res_id} con exactamente ese prefijo"""
+    mapping = {}
+    for row in rows:
+        row_prefix, source_id = split_name(row['name'])
+        if row_prefix == prefix and source_id is not None:
+            mapping[source_id] = row['res_id']
+    return mapping
+
+
+class SharedSession:
+    """Autenticación perezosa y compartida de una instancia de Odoo"""
+
+    def __init__(self, config: Dict, name: str):
+        self.config = config
+        self.name = name
+        self._uid = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @property
+    def uid(self) -> int:
+        """UID autenticado (autentica en el primer uso)"""
+        with self._lock:
+            if not self._uid:
+                common = xmlrpc.client.ServerProxy(f"{self.config['url']}/xmlrpc/2/common")
+                self._uid = common.authenticate(
+                    self.config['db'],
+                    self.config['username'],
+                    self.config['password'],
+                    {}
+                )
+                if not self._uid:
+                    raise Exception(f"Autenticación fallida en {self.name}")
+            return self._uid
+
+    @property
+    def models(self) -> xmlrpc.client.ServerProxy:
+        """Proxy de /xmlrpc/2/object propio de cada hilo (ServerProxy no es thread-safe)"""
+        proxy = getattr(self._local, 'models', None)
+        if proxy is None:
+            proxy = xmlrpc.client.ServerProxy(f"{self.config['url']}/xmlrpc/2/object")
+            self._local.models = proxy
+        return proxy
+
+
+class MappingCache:
+    """Filas de ir.model.data (módulo sync_script) por modelo, leídas una sola vez"""
+
+    def __init__(self):
+        self._rows: Dict[str, List[Dict]] = {}
+        # Índice nombre -> res_id por modelo (se arma en el primer lookup)
+        self._names: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def rows(self, connection, model: str) -> List[Dict]:
+        """Filas {id, name, res_id} del modelo; las lee con connection si no están en caché"""
+        with self._lock:
+            if model not in self._rows:
+                self._rows[model] = connection.search_read(
+                    'ir.model.data',
+                    [('module', '=', 'sync_script'), ('model', '=', model)],
+                    ['name', 'res_id']
+                )
+            return self._rows[model]
+
+    def source_map(self, connection, model: str, prefix: str) -> Dict[int, int]:
+        """ID de Odoo 16 -> ID de Odoo 18 de los external_id <prefix><id> del modelo"""
+        return source_map_from_rows(self.rows(connection, model), prefix)
+
+    def lookup(self, connection, model: str, name: str) -> Optional[int]:
+        """res_id de un external_id del modelo (None si no existe)"""
+        rows = self.rows(connection, model)
+        with self._lock:
+            if model not in self._names:
+                self._names[model] = {row['name']: row['res_id'] for row in rows}
+            return self._names[model].get(name)
+
+    def invalidate(self, models: Iterable[str] = None):
+        """Descarta los modelos indicados (todos si models es None)"""
+        with self._lock:
+            if models is None:
+                self._rows.clear()
+                self._names.clear()
+            for model in models or []:
+                self._rows.pop(model, None)
+                self._names.pop(model, None)
+
+    def record(self, model: str, rows: List[Dict]):
+        """Agrega external_id recién creados o reapuntados ({id, name, res_id}) si el modelo ya está en caché"""
+        with self._lock:
+            cached = self._rows.get(model)
+            if cached is None:
+                return
+            by_id = {row['id']: row for row in rows}
+            cached[:] = [by_id.pop(row['id'], row) for row in cached] + list(by_id.values())
+            self._names.pop(model, None)
@@ -0,0 +1,361 @@
+"""
+Instantánea columnar local de modelos de Odoo 16
+
+sync_products.py, sync_stock.py, sync_pricelists.py y
+sync_archived_products_only.py leen datos de product.product que se
+superponen. En lugar de descargarlos cada uno (y de nuevo en cada
+reintento), la primera etapa deja una copia local por modelo y las demás
+la reutilizan:
+
+    - Un archivo por modelo ('source_snapshot_dir'/<modelo>.snap) con los
+      IDs ordenados y una columna por campo. Los campos enteros, decimales y
+      booleanos se guardan como arreglos binarios; el resto (textos,
+      many2one, many2many) como JSON por fila con un índice de offsets.
+    - El archivo se abre con mmap: cargar una instantánea de 100k productos
+      no lee nada hasta que se consulta una fila o una columna. Con NumPy
+      las columnas numéricas son np.ndarray sin copia; sin NumPy, memoryview.
+    - Al refrescar solo se descargan las filas cuya write_date es mayor o
+      igual a la última guardada; los IDs que ya no existen se descartan.
+      Si nada cambió el archivo no se reescribe.
+    - Dentro de 'source_snapshot_max_age' segundos desde el último refresco
+      no se consulta Odoo 16 (salvo que la etapa lo pida, como productos).
+
+Cada etapa declara los campos que necesita; si la instantánea no los tiene,
+se reconstruye con la unión de campos.
+
+Los campos calculados no almacenados (qty_available) no mueven write_date:
+no se guardan acá y cada etapa los sigue leyendo de Odoo 16.
+"""
+
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Optional
+
+from config import SYNC_OPTIONS
+
+# NumPy es opcional: solo cambia el tipo de las columnas numéricas
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+MAGIC = b'SNAPSHT1'
+
+# Tipo de campo de Odoo -> código de array para columnas binarias
+NUMERIC = {'integer': 'q', 'float': 'd', 'monetary': 'd', 'boolean': 'b'}
+
+NUMPY_DTYPES = {'q': '<i8', 'd': '<f8', 'b': 'i1'}
+
+
+def source_snapshot(model: str, fields: Iterable[str]):
+    """Instantánea del modelo para una etapa (None si 'source_snapshot' está desactivado)"""
+    if SYNC_OPTIONS.get('source_snapshot', True):
+        return SourceSnapshot(model, fields)
+    return None
+
+
+class SourceSnapshot:
+    """Copia columnar, mapeada en memoria, de los registros de un modelo de Odoo 16"""
+
+    def __init__(self, model: str, fields: Iterable[str], path: str = None):
+        self.model = model
+        self.fields = sorted((set(fields) - {'id'}) | {'write_date'})
+        directory = SYNC_OPTIONS.get('source_snapshot_dir', 'snapshots')
+        self.path = path or os.path.join(directory, f"{model}.snap")
+        self.max_age = SYNC_OPTIONS.get('source_snapshot_max_age', 600)
+        self.page_size = SYNC_OPTIONS.get('source_snapshot_page_size', 2000)
+
+        self._lock = threading.Lock()
+        self.header: Optional[Dict] = None
+        self.load()
+
+    # ========================================
+    # LECTURA DEL ARCHIVO
+    # ========================================
+
+    def load(self):
+        """Mapea el archivo en memoria (sin leer las columnas)"""
+        self.header = None
+        self.ids = []
+        self._columns: Dict[str, tuple] = {}
+        try:
+            with open(self.path, 'rb') as f:
+                self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (FileNotFoundError, ValueError):
+            return
+
+        if self._mm[:8] != MAGIC:
+            return
+        (length,) = struct.unpack('<Q', self._mm[8:16])
+        self.header = json.loads(self._mm[16:16 + length])
+        # Los bloques empiezan alineados a 8 bytes después de la cabecera
+        self._base = 16 + length + (-(16 + length) % 8)
+
+        self.ids = self.block(self.header['ids'], 'q')
+        for field, spec in self.header['fields'].items():
+            if spec['type'] in NUMPY_DTYPES:
+                self._columns[field] = (spec['type'], self.block(spec['values'], spec['type']))
+            else:
+                self._columns[field] = ('json', self.block(spec['offsets'], 'q'),
+                                        self._base + spec['blob']['offset'])
+
+    def block(self, spec: Dict, code: str):
+        """Vista sin copia de un bloque binario (np.ndarray o memoryview)"""
+        start = self._base + spec['offset']
+        view = memoryview(self._mm)[start:start + spec['nbytes']]
+        if np is not None:
+            return np.frombuffer(view, dtype=NUMPY_DTYPES[code])
+        return view.cast(code)
+
+    def __len__(self) -> int:
+        return self.header['count'] if self.header else 0
+
+    def covers(self, fields: Iterable[str]) -> bool:
+        """True si la instantánea tiene todos los campos indicados"""
+        return self.header is not None and set(fields) - {'id'} <= set(self.header['fields'])
+
+    def row_of(self, source_id: int) -> int:
+        """Fila de un ID (-1 si no está)"""
+        return self.rows_of([source_id])[0]
+
+    def rows_of(self, source_ids: Iterable[int]) -> List[int]:
+        """Filas de varios IDs (-1 los que no están), con búsqueda binaria"""
+        source_ids = list(source_ids)
+        if not self.header or not len(self):
+            return [-1] * len(source_ids)
+        if np is not None:
+            wanted = np.asarray(source_ids, dtype=np.int64)
+            found = np.minimum(np.searchsorted(self.ids, wanted), len(self) - 1)
+            return np.where(self.ids[found] == wanted, found, -1).tolist()
+        rows = []
+        for source_id in source_ids:
+            row = bisect_left(self.ids, source_id)
+            rows.append(row if row < len(self) and self.ids[row] == source_id else -1)
+        return rows
+
+    def values(self, field: str, rows: List[int]) -> List:
+        """Valores de un campo en varias filas, con el mismo formato que search_read"""
+        column = self._columns[field]
+        if column[0] == 'json':
+            _, offsets, start = column
+            offsets = offsets.tolist()
+            blob = self._mm[start:start + offsets[-1]]
+            # Un solo json.loads para todas las filas pedidas
+            return json.loads(b'[' + b','.join(
+                blob[offsets[row]:offsets[row + 1]] for row in rows
+            ) + b']')
+        data = column[1].tolist()
+        if column[0] == 'b':
+            return [bool(data[row]) for row in rows]
+        return [data[row] for row in rows]
+
+    def column(self, field: str):
+        """
+        Columna completa de un campo
+
+        Numéricos: vista sin copia (np.ndarray con NumPy). Resto: lista con
+        los valores decodificados (lee la columna entera).
+        """
+        if self._columns[field][0] != 'json':
+            return self._columns[field][1]
+        return self.values(field, range(len(self)))
+
+    def value(self, field: str, row: int):
+        """Valor de un campo en una fila"""
+        return self.values(field, [row])[0]
+
+    def rows(self, source_ids: Iterable[int], fields: Iterable[str] = None) -> Dict[int, Dict]:
+        """{id: fila como la devolvería search_read} de los IDs presentes"""
+        fields = [field for field in (fields or self.fields) if field != 'id']
+        source_ids = list(source_ids)
+        present = [(source_id, row) for source_id, row in zip(source_ids, self.rows_of(source_ids)) if row >= 0]
+        rows = [row for _, row in present]
+        columns = {field: self.values(field, rows) for field in fields}
+        return {
+            source_id: dict({'id': source_id}, **{field: columns[field][i] for field in fields})
+            for i, (source_id, _) in enumerate(present)
+        }
+
+    # ========================================
+    # REFRESCO DESDE ODOO 16
+    # ========================================
+
+    def age(self) -> float:
+        """Segundos desde el último refresco (infinito si no hay instantánea)"""
+        try:
+            return time.time() - os.path.getmtime(self.path)
+        except FileNotFoundError:
+            return float('inf')
+
+    def fetch(self, connection, domain: List, fields: List[str]) -> List[Dict]:
+        """search_read paginado (incluye archivados)"""
+        rows = []
+        offset = 0
+        while True:
+            page = connection.execute(
+                self.model, 'search_read', domain,
+                fields=fields, order='id', offset=offset, limit=self.page_size,
+                context={'active_test': False}
+            )
+            rows.extend(page)
+            if len(page) < self.page_size:
+                return rows
+            offset += self.page_size
+
+    def refresh(self, connection, max_age: float = None) -> int:
+        """
+        Actualiza la instantánea con los cambios de Odoo 16
+
+        Args:
+            connection: conexión a Odoo 16 (con execute)
+            max_age: no consultar si el último refresco es más reciente
+                     (None = 'source_snapshot_max_age'; 0 = siempre)
+
+        Returns:
+            int: filas descargadas
+        """
+        max_age = self.max_age if max_age is None else max_age
+        with self._lock:
+            # Otra etapa pudo haberla reescrito desde que se abrió
+            self.load()
+            full = not self.covers(self.fields)
+            if not full and self.age() < max_age:
+                return 0
+
+            fields = sorted(set(self.fields) | set(self.header['fields'] if self.header else []))
+            types = self.field_types(connection, fields)
+
+            all_ids = sorted(connection.execute(
+                self.model, 'search', [], context={'active_test': False}
+            ))
+            domain = [] if full or not self.header['watermark'] else \
+                [('write_date', '>=', self.header['watermark'])]
+            moved = {row['id']: row for row in self.fetch(connection, domain, fields)}
+
+            if not full:
+                # En el límite de la marca de agua vuelven filas sin cambios
+                candidates = list(moved)
+                rows = self.rows_of(candidates)
+                stored = self.values('write_date', [max(row, 0) for row in rows])
+                moved = {
+                    source_id: moved[source_id]
+                    for source_id, row, write_date in zip(candidates, rows, stored)
+                    if row < 0 or write_date != moved[source_id]['write_date']
+                }
+                # IDs nuevos con write_date anterior a la marca (restaurados, importados)
+                unknown = [source_id for source_id, row in zip(all_ids, self.rows_of(all_ids))
+                           if row < 0 and source_id not in moved]
+                if unknown:
+                    moved.update((row['id'], row) for row in
+                                 self.fetch(connection, [('id', 'in', unknown)], fields))
+                if not moved and len(all_ids) == len(self) and all_ids == list(self.ids):
+                    os.utime(self.path)
+                    return 0
+
+            # Descarta IDs eliminados entre la búsqueda y la lectura
+            all_ids = [source_id for source_id, row in zip(all_ids, self.rows_of(all_ids))
+                       if source_id in moved or (not full and row >= 0)]
+            self.write(all_ids, fields, types, moved, reuse=not full)
+            self.load()
+            return len(moved)
+
+    def field_types(self, connection, fields: List[str]) -> Dict[str, str]:
+        """Código de almacenamiento de cada campo según fields_get de Odoo 16"""
+        known = {
+            field: spec['type'] for field, spec in (self.header['fields'] if self.header else {}).items()
+        }
+        missing = [field for field in fields if field not in known]
+        if missing:
+            described = connection.execute(self.model, 'fields_get', missing, attributes=['type'])
+            for field in missing:
+                known[field] = NUMERIC.get(described.get(field, {}).get('type'), 'json')
+        return {field: known[field] for field in fields}
+
+    # ========================================
+    # ESCRITURA DEL ARCHIVO
+    # ========================================
+
+    def write(self, all_ids: List[int], fields: List[str], types: Dict[str, str],
+              moved: Dict[int, Dict], reuse: bool):
+        """Escribe la instantánea completa en un archivo nuevo y lo reemplaza de forma atómica"""
+        blocks: List[bytes] = []
+        header = {'model': self.model, 'count': len(all_ids), 'fields': {}}
+        position = 0
+
+        def add(data: bytes) -> Dict:
+            nonlocal position
+            spec = {'offset': position, 'nbytes': len(data)}
+            padding = -len(data) % 8
+            blocks.append(data + b'\0' * padding)
+            position += len(data) + padding
+            return spec
+
+        # Fila anterior de cada ID que se conserva sin cambios
+        old_rows = [
+            -1 if source_id in moved or not reuse else row
+            for source_id, row in zip(all_ids, self.rows_of(all_ids))
+        ]
+
+        header['ids'] = add(array('q', all_ids).tobytes())
+        watermark = ''
+
+        for field in fields:
+            code = types[field]
+            old = self._columns.get(field) if reuse else None
+
+            if code in NUMPY_DTYPES:
+                cast = float if code == 'd' else int
+                previous = old[1].tolist() if old else None
+                values = array(code)
+                for source_id, row in zip(all_ids, old_rows):
+                    if row >= 0:
+                        values.append(previous[row])
+                    else:
+                        values.append(cast(moved[source_id].get(field) or 0))
+                header['fields'][field] = {'type': code, 'values': add(values.tobytes())}
+                continue
+
+            if old:
+                _, old_offsets, old_start = old
+                old_offsets = old_offsets.tolist()
+                old_blob = self._mm[old_start:old_start + old_offsets[-1]]
+            offsets = array('q', [0])
+            chunks = []
+            size = 0
+            for source_id, row in zip(all_ids, old_rows):
+                if row >= 0:
+                    encoded = old_blob[old_offsets[row]:old_offsets[row + 1]]
+                else:
+                    encoded = json.dumps(moved[source_id].get(field, False),
+                                         separators=(',', ':')).encode()
+                chunks.append(encoded)
+                size += len(encoded)
+                offsets.append(size)
+                if field == 'write_date':
+                    watermark = max(watermark, json.loads(encoded) or '')
+
+            header['fields'][field] = {
+                'type': 'json',
+                'offsets': add(offsets.tobytes()),
+                'blob': add(b''.join(chunks)),
+            }
+
+        header['watermark'] = watermark or None
+        encoded_header = json.dumps(header).encode()
+        padding = -(16 + len(encoded_header)) % 8
+
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        temp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(MAGIC)
+            f.write(struct.pack('<Q', len(encoded_header)))
+            f.write(encoded_header + b'\0' * padding)
+            for data in blocks:
+                f.write(data)
+        os.replace(temp_path, self.path)
@@ -6,16 +6,26 @@ Odoo 16 (VPS) -> Odoo 18 (Local)
 Lee las cantidades en mano (qty_available) de Odoo 16 y ajusta
 el stock en Odoo 18 usando movimientos de inventario.
 
+Con 'incremental_stock_sync' solo se releen los productos que tienen
+stock.move/stock.quant modificados en Odoo 16 desde la última ejecución.
+
+Los productos con seguimiento por lote/número de serie se ajustan
+por (producto, ubicación, lote), creando los lotes faltantes en bloque.
+
 Uso:
     python3 sync_stock.py
+    python3 sync_stock.py --daemon   # Modo demonio (casi tiempo real, para POS)
+    python3 sync_stock.py --report   # Reporte CSV de diferencias, sin aplicar cambios
 """
 
 import xmlrpc.client
 import logging
-from datetime import datetime
-from typing import Dict, List
+from datetime import datetime, timezone
+from typing import Dict, List, Set, Tuple
 import sys
 import os
+import time
+import csv
 
 # Agregar directorio actual al path
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
@@ -31,6 +41,12 @@ except ImportError as e:
     print("\nVerifica que config.py existe en el mismo directorio que este script")
     sys.exit(1)
 
+# NumPy es opcional: solo lo usa el reporte de diferencias (--report)
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 # Configuración de logging
 logging.basicConfig(
     level=logging.INFO,
@@ -42,16 +58,27 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+from sync_lock import StageLock, StopRequested, EXIT_STOPPED, policy_from_argv
+from sync_session import split_name
+from sync_mapping_store import default_mapping_cache
+from sync_snapshot import source_snapshot
+
 
 class OdooConnection:
     """Maneja la conexión a una instancia de Odoo"""
     
-    def __init__(self, config: Dict, name: str):
+    def __init__(self, config: Dict, name: str, session=None):
         self.config = config
         self.name = name
         self.uid = None
         self.models = None
-        self.connect()
+        
+        if session:
+            # Sesión compartida (sync_all.py en proceso): sin autenticar de nuevo
+            self.uid = session.uid
+            self.models = session.models
+        else:
+            self.connect()
     
     def connect(self):
         """Establece la conexión con Odoo"""
@@ -96,8 +123,15 @@ class OdooConnection:
             kwargs
         )
     
-    def search_read(self, model: str, domain: List, fields: List) -> List[Dict]:
+    def search_read(self, model: str, domain: List, fields: List,
+                    limit: int = 0, order: str = None) -> List[Dict]:
         """Busca y lee registros"""
+        kwargs = {'fields': fields}
+        if limit > 0:
+            kwargs['limit'] = limit
+        if order:
+            kwargs['order'] = order
+        
         try:
             return self.models.execute_kw(
                 self.config['db'],
@@ -106,7 +140,7 @@ class OdooConnection:
                 model,
                 'search_read',
                 [domain],
-                {'fields': fields}
+                kwargs
             )
         except Exception as e:
             logger.error(f"Error en search_read - Model: {model}, Fields: {fields}")
@@ -120,10 +154,24 @@ class OdooConnection:
             kwargs['limit'] = limit
         return self.execute(model, 'search', domain, kwargs)
     
+    def read(self, model: str, record_ids: List[int], fields: List) -> List[Dict]:
+        """Lee registros por ID"""
+        return self.execute(model, 'read', record_ids, fields)
+    
+    def read_group(self, model: str, domain: List, fields: List, groupby: List) -> List[Dict]:
+        """Agrupa registros en el servidor (una fila por grupo)"""
+        return self.execute(model, 'read_group', domain, fields, groupby, lazy=False)
+    
     def create(self, model: str, values: Dict) -> int:
         """Crea un registro"""
         return self.execute(model, 'create', values)
     
+    def create_multi(self, model: str, values_list: List[Dict]) -> List[int]:
+        """Crea varios registros en una sola llamada"""
+        if not values_list:
+            return []
+        return self.execute(model, 'create', values_list)
+    
     def write(self, model: str, record_ids: List[int], values: Dict) -> bool:
         """Actualiza registros"""
         return self.execute(model, 'write', record_ids, values)
@@ -132,19 +180,42 @@ class OdooConnection:
 class StockSync:
     """Sincroniza stock/inventario entre dos instancias de Odoo"""
     
-    def __init__(self):
-        self.source = OdooConnection(ODOO_16, "Odoo 16 (VPS)")
-        self.target = OdooConnection(ODOO_18, "Odoo 18 (Local)")
+    def __init__(self, source_session=None, target_session=None, mapping_cache=None, lock=None):
+        self.source = OdooConnection(ODOO_16, "Odoo 16 (VPS)", session=source_session)
+        self.target = OdooConnection(ODOO_18, "Odoo 18 (Local)", session=target_session)
+        
+        # Mapeos de ir.model.data compartidos entre etapas (sync_all.py en
+        # proceso) o, si el script corre solo, el almacén local (sync_mapping_store.py)
+        self.mapping_cache = mapping_cache if mapping_cache is not None else default_mapping_cache()
+        
+        # Bloqueo de la etapa (sync_lock.py): entre lotes se revisa si otra
+        # invocación pidió detenerla
+        self.lock = lock
         
         # Ubicaciones importantes en Odoo 18
         self.target_location_stock = None  # Ubicación física principal
         self.target_location_inventory = None  # Ubicación virtual de inventario
         
+        # Cantidad de productos por lectura/escritura masiva
+        self.batch_size = SYNC_OPTIONS.get('stock_batch_size', 200)
+        
+        # Lotes/números de serie de Odoo 18: (product_id, nombre) -> lot_id
+        self.lot_map: Dict[Tuple[int, str], int] = {}
+        
+        # Sincronización incremental: marca de agua (reloj de Odoo 16) y
+        # último ID de ir.model.data de productos ya considerado
+        self.last_sync = None
+        self.new_sync = None
+        self.last_mapping_id = 0
+        self.max_mapping_id = 0
+        self.new_mapping_ids: Set[int] = set()
+        
         self.stats = {
             'total': 0,
             'adjusted': 0,
             'skipped': 0,
             'errors': 0,
+            'lots_created': 0,
             'total_qty_adjusted': 0.0
         }
         
@@ -198,23 +269,38 @@ class StockSync:
         logger.info("Cargando mapeo de productos...")
         
         product_map = {}
+        self.new_mapping_ids = set()
         
         try:
-            # Buscar todos los productos sincronizados
-            external_ids = self.target.search_read(
-                'ir.model.data',
-                [
-                    ('model', '=', 'product.product'),
-                    ('module', '=', 'sync_script'),
-                    ('name', 'like', 'sync_product_product_%')
-                ],
-                ['name', 'res_id']
-            )
+            # Buscar todos los productos sincronizados (de la caché compartida si la hay)
+            if self.mapping_cache is not None:
+                external_ids = [
+                    row for row in self.mapping_cache.rows(self.target, 'product.product')
+                    if row['name'].startswith('sync_product_product_')
+                ]
+            else:
+                external_ids = self.target.search_read(
+                    'ir.model.data',
+                    [
+                        ('model', '=', 'product.product'),
+                        ('module', '=', 'sync_script'),
+                        ('name', 'like', 'sync_product_product_%')
+                    ],
+                    ['name', 'res_id']
+                )
             
             for ext_id in external_ids:
                 # Extraer el ID de origen del nombre
-                source_id = int(ext_id['name'].replace('sync_product_product_', ''))
+                prefix, source_id = split_name(ext_id['name'])
+                if prefix != 'sync_product_product_' or source_id is None:
+                    continue
                 product_map[source_id] = ext_id['res_id']
+                
+                # Los IDs de ir.model.data son crecientes: los mayores a la
+                # última ejecución son productos recién mapeados
+                if ext_id['id'] > self.last_mapping_id:
+                    self.new_mapping_ids.add(source_id)
+                self.max_mapping_id = max(self.max_mapping_id, ext_id['id'])
             
             logger.info(f"✓ Cargados {len(product_map)} productos mapeados")
             
@@ -228,15 +314,114 @@ class StockSync:
             logger.error(f"❌ Error cargando mapeo de productos: {e}")
             raise
     
-    def get_stock_from_source(self, product_ids: List[int]) -> Dict[int, float]:
+    def get_last_sync_date(self):
+        """
+        Obtiene la marca de agua de la última sincronización de stock
+        
+        El archivo guarda la write_date (reloj de Odoo 16) y, en una
+        segunda línea, el último ID de ir.model.data de productos procesado.
+        """
+        try:
+            sync_file = 'last_stock_sync.txt'
+            
+            if os.path.exists(sync_file):
+                with open(sync_file, 'r') as f:
+                    lines = f.read().split('\n')
+                
+                last_sync = lines[0].strip() or None
+                if len(lines) > 1 and lines[1].strip():
+                    self.last_mapping_id = int(lines[1].strip())
+                
+                if last_sync:
+                    logger.info(f"✓ Última sincronización de stock: {last_sync}")
+                return last_sync
+        except Exception as e:
+            logger.warning(f"No se pudo leer última sincronización: {e}")
+        
+        return None
+    
+    def save_sync_date(self, sync_date: str):
+        """Guarda la marca de agua de la sincronización actual"""
+        try:
+            with open('last_stock_sync.txt', 'w') as f:
+                f.write(f"{sync_date}\n{self.max_mapping_id}")
+            
+            logger.info(f"✓ Marca de agua de stock guardada: {sync_date}")
+        except Exception as e:
+            logger.warning(f"No se pudo guardar fecha de sincronización: {e}")
+    
+    def get_source_watermark(self) -> str:
+        """Obtiene la última write_date de movimientos/quants en Odoo 16"""
+        watermark = ''
+        
+        for model in ('stock.move', 'stock.quant'):
+            latest = self.source.search_read(
+                model, [], ['write_date'], limit=1, order='write_date desc'
+            )
+            if latest and latest[0].get('write_date', '') > watermark:
+                watermark = latest[0]['write_date']
+        
+        return watermark or None
+    
+    def get_changed_product_ids(self, since: str) -> Tuple[Dict[int, str], str]:
+        """
+        Obtiene los productos con movimientos o quants modificados en Odoo 16
+        
+        Usa read_group para que el servidor devuelva una fila por producto
+        (con su última write_date) en lugar de cada movimiento.
+        
+        Returns:
+            tuple: ({product_id de Odoo 16: última write_date}, nueva marca de agua)
+        """
+        changed_ids = {}
+        watermark = since
+        
+        for model in ('stock.move', 'stock.quant'):
+            groups = self.source.read_group(
+                model,
+                [('write_date', '>=', since)],
+                ['write_date:max'],
+                ['product_id']
+            )
+            
+            for group in groups:
+                write_date = group.get('write_date') or since
+                if group.get('product_id'):
+                    product_id = group['product_id'][0]
+                    changed_ids[product_id] = max(changed_ids.get(product_id, ''), write_date)
+                if write_date > watermark:
+                    watermark = write_date
+        
+        return changed_ids, watermark
+    
+    def get_stock_from_source(self, product_ids: List[int]) -> Dict[int, Dict]:
         """Obtiene las cantidades en stock desde Odoo 16"""
         logger.info("Obteniendo cantidades de stock desde Odoo 16...")
         
         stock_data = {}
+        metadata_fields = ['name', 'default_code', 'type', 'tracking']
+        
+        # Nombre, código, tipo y seguimiento salen de la instantánea local;
+        # qty_available no mueve write_date y se lee siempre de Odoo 16
+        metadata = {}
+        snapshot = source_snapshot('product.product', metadata_fields)
+        if snapshot is not None:
+            try:
+                snapshot.refresh(self.source)
+                metadata = snapshot.rows(product_ids, metadata_fields)
+            except Exception as e:
+                logger.warning(f"⚠ No se pudo usar la instantánea local ({e}), leyendo todo de Odoo 16")
+                metadata = {}
+        
+        # Los que la instantánea marca como no almacenables no necesitan lectura
+        product_ids = [
+            product_id for product_id in product_ids
+            if product_id not in metadata or metadata[product_id].get('type') == 'product'
+        ]
         
         try:
-            # Leer cantidades de a lotes de 100
-            batch_size = 100
+            # Leer cantidades por lotes
+            batch_size = self.batch_size
             total_batches = (len(product_ids) + batch_size - 1) // batch_size
             
             for i in range(0, len(product_ids), batch_size):
@@ -245,11 +430,21 @@ class StockSync:
                 
                 logger.info(f"⏳ Leyendo lote {batch_num}/{total_batches} ({len(batch)} productos)...")
                 
-                products = self.source.search_read(
-                    'product.product',
-                    [('id', 'in', batch)],
-                    ['id', 'name', 'default_code', 'qty_available', 'type']
-                )
+                if all(product_id in metadata for product_id in batch):
+                    products = [
+                        dict(metadata[product['id']], **product)
+                        for product in self.source.search_read(
+                            'product.product',
+                            [('id', 'in', batch)],
+                            ['id', 'qty_available']
+                        )
+                    ]
+                else:
+                    products = self.source.search_read(
+                        'product.product',
+                        [('id', 'in', batch)],
+                        ['id'] + metadata_fields + ['qty_available']
+                    )
                 
                 for product in products:
                     # Solo sincronizar productos almacenables (type='product' en v16)
@@ -257,7 +452,8 @@ class StockSync:
                         stock_data[product['id']] = {
                             'qty': product.get('qty_available', 0.0),
                             'name': product.get('name'),
-                            'code': product.get('default_code', 'Sin ref')
+                            'code': product.get('default_code', 'Sin ref'),
+                            'tracking': product.get('tracking') or 'none'
                         }
             
             logger.info(f"✓ Obtenidas cantidades de {len(stock_data)} productos almacenables")
@@ -267,103 +463,280 @@ class StockSync:
             logger.error(f"❌ Error obteniendo stock: {e}")
             raise
     
-    def get_current_stock_target(self, product_id: int) -> float:
-        """Obtiene la cantidad actual en Odoo 18"""
-        try:
-            # Buscar el quant del producto en la ubicación principal
-            quants = self.target.search_read(
-                'stock.quant',
-                [
-                    ('product_id', '=', product_id),
-                    ('location_id', '=', self.target_location_stock)
-                ],
-                ['quantity', 'reserved_quantity']
-            )
-            
-            if quants:
-                # Cantidad disponible = cantidad total - cantidad reservada
-                total_qty = sum(q.get('quantity', 0) for q in quants)
-                return total_qty
-            
-            return 0.0
+    def get_lot_quants_from_source(self, product_ids: List[int]) -> Dict[int, Dict]:
+        """
+        Obtiene las cantidades por lote/número de serie desde Odoo 16
+        
+        Suma los quants de todas las ubicaciones internas, igual que
+        qty_available, pero separados por lote.
+        
+        Returns:
+            dict: {product_id: {nombre_lote (o False si no tiene): cantidad}}
+        """
+        lot_quantities = {}
+        
+        if not product_ids:
+            return lot_quantities
+        
+        quants = self.source.search_read(
+            'stock.quant',
+            [
+                ('product_id', 'in', product_ids),
+                ('location_id.usage', '=', 'internal')
+            ],
+            ['product_id', 'lot_id', 'quantity']
+        )
+        
+        for quant in quants:
+            product_id = quant['product_id'][0]
+            lot_name = quant['lot_id'][1] if quant.get('lot_id') else False
             
-        except Exception as e:
-            logger.warning(f"⚠ Error obteniendo stock actual: {e}")
-            return 0.0
+            per_lot = lot_quantities.setdefault(product_id, {})
+            per_lot[lot_name] = per_lot.get(lot_name, 0.0) + quant.get('quantity', 0.0)
+        
+        return lot_quantities
     
-    def create_inventory_adjustment(self, product_id: int, product_name: str, 
-                                   current_qty: float, target_qty: float) -> bool:
+    def get_target_tracking(self, product_ids: List[int]) -> Dict[int, str]:
+        """Obtiene el tipo de seguimiento (none/lot/serial) de productos en Odoo 18"""
+        if not product_ids:
+            return {}
+        
+        products = self.target.read('product.product', product_ids, ['tracking'])
+        return {p['id']: p.get('tracking') or 'none' for p in products}
+    
+    def get_target_quants(self, product_ids: List[int]) -> Dict[Tuple[int, int], Dict]:
         """
-        Crea un ajuste de inventario para un producto
+        Lee en una sola llamada los quants de Odoo 18 de un lote de productos
         
-        Actualiza directamente el campo 'quantity' en stock.quant
-        que es el campo real del inventario
+        Returns:
+            dict: {(product_id, lot_id o False): {'quants': [(quant_id, cantidad)], 'qty': total}}
         """
-        try:
-            difference = target_qty - current_qty
+        snapshot = {}
+        
+        quants = self.target.search_read(
+            'stock.quant',
+            [
+                ('product_id', 'in', product_ids),
+                ('location_id', '=', self.target_location_stock)
+            ],
+            ['product_id', 'lot_id', 'quantity']
+        )
+        
+        for quant in quants:
+            lot_id = quant['lot_id'][0] if quant.get('lot_id') else False
+            entry = snapshot.setdefault(
+                (quant['product_id'][0], lot_id),
+                {'quants': [], 'qty': 0.0}
+            )
+            entry['quants'].append((quant['id'], quant.get('quantity', 0.0)))
+            entry['qty'] += quant.get('quantity', 0.0)
+        
+        return snapshot
+    
+    def sync_lots(self, lot_names: Dict[int, Set[str]]):
+        """
+        Sincroniza en bloque los lotes/números de serie (stock.lot)
+        
+        Los lotes se mapean por (producto, nombre): se leen en una sola
+        llamada los lotes existentes en Odoo 18 y se crean los faltantes
+        con un único create múltiple.
+        
+        Args:
+            lot_names: {product_id (Odoo 18): {nombres de lote}}
+        """
+        pending = {}
+        for product_id, names in lot_names.items():
+            missing = {name for name in names if (product_id, name) not in self.lot_map}
+            if missing:
+                pending[product_id] = missing
+        
+        if not pending:
+            return
+        
+        existing_lots = self.target.search_read(
+            'stock.lot',
+            [('product_id', 'in', list(pending.keys()))],
+            ['name', 'product_id']
+        )
+        
+        for lot in existing_lots:
+            self.lot_map[(lot['product_id'][0], lot['name'])] = lot['id']
+        
+        to_create = [
+            {'name': name, 'product_id': product_id}
+            for product_id, names in pending.items()
+            for name in sorted(names)
+            if (product_id, name) not in self.lot_map
+        ]
+        
+        if not to_create:
+            return
+        
+        new_ids = self.target.create_multi('stock.lot', to_create)
+        
+        for vals, lot_id in zip(to_create, new_ids):
+            self.lot_map[(vals['product_id'], vals['name'])] = lot_id
+        
+        self.stats['lots_created'] += len(new_ids)
+        logger.info(f"✓ Creados {len(new_ids)} lotes/números de serie en Odoo 18")
+    
+    def compute_quant_changes(self, target_id: int, desired: Dict, snapshot: Dict) -> Dict:
+        """
+        Compara las cantidades deseadas con el snapshot de Odoo 18
+        
+        Args:
+            target_id: ID del producto en Odoo 18
+            desired: {lot_id o False: cantidad deseada}
+            snapshot: resultado de get_target_quants()
+        
+        Returns:
+            dict: {'writes': [(quant_id, cantidad)], 'creates': [vals],
+                   'current': total actual, 'target': total deseado}
+        """
+        changes = {'writes': [], 'creates': [], 'current': 0.0, 'target': 0.0}
+        
+        # Lotes presentes en destino pero no en origen quedan en 0
+        lot_ids = set(desired.keys())
+        lot_ids.update(lot_id for (product_id, lot_id) in snapshot if product_id == target_id)
+        
+        for lot_id in lot_ids:
+            wanted = desired.get(lot_id, 0.0)
+            current = snapshot.get((target_id, lot_id), {'quants': [], 'qty': 0.0})
             
-            if abs(difference) < 0.01:  # Ignorar diferencias menores a 0.01
-                logger.debug(f"Sin cambios para {product_name}: {current_qty}")
-                return False
+            changes['current'] += current['qty']
+            changes['target'] += wanted
             
-            # Buscar el quant existente
-            existing_quants = self.target.search(
-                'stock.quant',
-                [
-                    ('product_id', '=', product_id),
-                    ('location_id', '=', self.target_location_stock)
-                ]
-            )
+            if abs(wanted - current['qty']) < 0.01:  # Ignorar diferencias menores a 0.01
+                continue
             
-            if existing_quants:
-                # Actualizar directamente el campo 'quantity' (no inventory_quantity)
-                # Esto actualiza el stock real sin necesidad de aplicar ajustes
-                try:
-                    # Primero intentar con inventory_quantity + apply
-                    self.target.write(
-                        'stock.quant',
-                        existing_quants,
-                        {
-                            'inventory_quantity': target_qty,
-                            'inventory_quantity_set': True,
-                            'inventory_diff_quantity': difference
-                        }
-                    )
-                    
-                    # Forzar el ajuste usando SQL directamente vía ORM
-                    # Actualizar quantity directamente
-                    self.target.write(
-                        'stock.quant',
-                        existing_quants,
-                        {'quantity': target_qty}
-                    )
-                    
-                except Exception as e:
-                    logger.warning(f"Método estándar falló, usando actualización directa: {e}")
-                    # Si todo falla, actualizar quantity directamente
-                    self.target.write(
-                        'stock.quant',
-                        existing_quants,
-                        {'quantity': target_qty}
-                    )
-            else:
+            if current['quants']:
+                # El primer quant lleva la cantidad, el resto queda en 0
+                first_quant_id = current['quants'][0][0]
+                changes['writes'].append((first_quant_id, wanted))
+                for quant_id, qty in current['quants'][1:]:
+                    if qty:
+                        changes['writes'].append((quant_id, 0.0))
+            elif wanted:
                 # Si no existe el quant, crearlo directamente con quantity
                 quant_vals = {
-                    'product_id': product_id,
+                    'product_id': target_id,
                     'location_id': self.target_location_stock,
-                    'quantity': target_qty,
+                    'quantity': wanted,
                 }
-                
-                self.target.create('stock.quant', quant_vals)
+                if lot_id:
+                    quant_vals['lot_id'] = lot_id
+                changes['creates'].append(quant_vals)
+        
+        return changes
+    
+    def apply_quant_changes(self, writes: List[Tuple[int, float]], creates: List[Dict]):
+        """
+        Aplica cambios de stock.quant con llamadas agrupadas
+        
+        Actualiza directamente el campo 'quantity' (no inventory_quantity):
+        un write por cada cantidad distinta y un único create múltiple.
+        """
+        quants_by_qty: Dict[float, List[int]] = {}
+        for quant_id, qty in writes:
+            quants_by_qty.setdefault(qty, []).append(quant_id)
+        
+        for qty, quant_ids in quants_by_qty.items():
+            self.target.write('stock.quant', quant_ids, {'quantity': qty})
+        
+        if creates:
+            self.target.create_multi('stock.quant', creates)
+    
+    def sync_stock_batch(self, batch: List[Tuple[int, Dict]], product_map: Dict[int, int]):
+        """
+        Sincroniza un lote de productos con lecturas y escrituras agrupadas
+        
+        1. Snapshot de quants de Odoo 18 (una llamada)
+        2. Lotes/series de los productos con seguimiento (lectura + create múltiple)
+        3. Diff por (producto, ubicación, lote)
+        4. Aplicación agrupada; si falla, se reintenta producto por producto
+        """
+        target_ids = [product_map[source_id] for source_id, _ in batch]
+        snapshot = self.get_target_quants(target_ids)
+        
+        # Productos con seguimiento por lote/serie
+        tracked_ids = [
+            source_id for source_id, stock_info in batch
+            if stock_info['tracking'] in ('lot', 'serial')
+        ]
+        lot_quantities = {}
+        
+        if tracked_ids:
+            target_tracking = self.get_target_tracking([product_map[sid] for sid in tracked_ids])
             
-            action = "+" if difference > 0 else ""
-            logger.info(f"✓ Ajustado: {product_name} ({current_qty:.2f} → {target_qty:.2f}) [{action}{difference:.2f}]")
+            for source_id, stock_info in batch:
+                if source_id in tracked_ids and target_tracking.get(product_map[source_id], 'none') == 'none':
+                    logger.warning(
+                        f"⚠ [{stock_info['code']}] {stock_info['name']}: usa lotes en Odoo 16 "
+                        f"pero no en Odoo 18, se ajusta sin lote"
+                    )
+            tracked_ids = [
+                sid for sid in tracked_ids
+                if target_tracking.get(product_map[sid], 'none') != 'none'
+            ]
+            
+            lot_quantities = self.get_lot_quants_from_source(tracked_ids)
+            self.sync_lots({
+                product_map[sid]: {name for name in lot_quantities.get(sid, {}) if name}
+                for sid in tracked_ids
+            })
+        
+        tracked_set = set(tracked_ids)
+        pending = []  # (source_id, product_name, changes)
+        
+        for source_id, stock_info in batch:
+            target_id = product_map[source_id]
+            product_name = f"[{stock_info['code']}] {stock_info['name']}"
+            
+            if source_id in tracked_set:
+                desired = {}
+                for lot_name, qty in lot_quantities.get(source_id, {}).items():
+                    lot_id = self.lot_map[(target_id, lot_name)] if lot_name else False
+                    desired[lot_id] = desired.get(lot_id, 0.0) + qty
+            else:
+                desired = {False: stock_info['qty']}
             
-            return True
+            changes = self.compute_quant_changes(target_id, desired, snapshot)
             
+            if changes['writes'] or changes['creates']:
+                pending.append((source_id, product_name, changes))
+            else:
+                logger.debug(f"Sin cambios para {product_name}: {changes['current']}")
+                self.stats['skipped'] += 1
+        
+        if not pending:
+            return
+        
+        try:
+            self.apply_quant_changes(
+                [w for _, _, changes in pending for w in changes['writes']],
+                [c for _, _, changes in pending for c in changes['creates']]
+            )
+            applied = pending
         except Exception as e:
-            logger.error(f"❌ Error ajustando {product_name}: {e}")
-            return False
+            logger.warning(f"⚠ Falló la actualización agrupada, reintentando por producto: {e}")
+            applied = []
+            for source_id, product_name, changes in pending:
+                try:
+                    self.apply_quant_changes(changes['writes'], changes['creates'])
+                    applied.append((source_id, product_name, changes))
+                except Exception as e:
+                    logger.error(f"❌ Error ajustando {product_name}: {e}")
+                    self.stats['errors'] += 1
+        
+        for source_id, product_name, changes in applied:
+            difference = changes['target'] - changes['current']
+            action = "+" if difference > 0 else ""
+            logger.info(
+                f"✓ Ajustado: {product_name} ({changes['current']:.2f} → {changes['target']:.2f}) "
+                f"[{action}{difference:.2f}]"
+            )
+            self.stats['adjusted'] += 1
+            self.stats['total_qty_adjusted'] += abs(difference)
     
     def sync_stock(self):
         """Sincroniza el stock de todos los productos"""
@@ -372,6 +745,9 @@ class StockSync:
         logger.info("SINCRONIZANDO STOCK")
         logger.info("=" * 60)
         
+        if SYNC_OPTIONS.get('incremental_stock_sync', False):
+            self.last_sync = self.get_last_sync_date()
+        
         # Obtener mapeo de productos
         product_map = self.get_product_mapping()
         
@@ -379,8 +755,24 @@ class StockSync:
             logger.error("❌ No hay productos para sincronizar")
             return
         
-        # Obtener stock del origen
         source_product_ids = list(product_map.keys())
+        
+        # Sincronización incremental: solo productos con movimientos/quants
+        # modificados en Odoo 16 desde la última marca de agua
+        if SYNC_OPTIONS.get('incremental_stock_sync', False):
+            if self.last_sync:
+                changed, self.new_sync = self.get_changed_product_ids(self.last_sync)
+                changed_ids = set(changed) | self.new_mapping_ids
+                source_product_ids = [sid for sid in source_product_ids if sid in changed_ids]
+                logger.info(
+                    f"📅 Sincronización incremental: {len(source_product_ids)} productos "
+                    f"con cambios desde {self.last_sync}"
+                )
+            else:
+                # Primera ejecución: la marca se toma antes de leer cantidades
+                self.new_sync = self.get_source_watermark()
+        
+        # Obtener stock del origen
         stock_source = self.get_stock_from_source(source_product_ids)
         
         self.stats['total'] = len(stock_source)
@@ -394,36 +786,387 @@ class StockSync:
         logger.info("AJUSTANDO INVENTARIO")
         logger.info("=" * 60)
         
-        # Sincronizar cada producto
-        for i, (source_id, stock_info) in enumerate(stock_source.items(), 1):
-            target_id = product_map.get(source_id)
+        items = list(stock_source.items())
+        
+        # Sincronizar por lotes de productos
+        for i in range(0, len(items), self.batch_size):
+            if self.lock:
+                self.lock.check_stop()
+            batch = items[i:i + self.batch_size]
+            logger.info(f"[{i + len(batch)}/{len(items)}] Procesando lote de {len(batch)} productos")
             
-            if not target_id:
-                logger.warning(f"⚠ Producto no mapeado: {stock_info['name']}")
-                self.stats['skipped'] += 1
-                continue
+            try:
+                self.sync_stock_batch(batch, product_map)
+            except Exception as e:
+                logger.error(f"❌ Error con lote de productos {i + 1}-{i + len(batch)}: {e}")
+                self.stats['errors'] += len(batch)
+    
+    def write_daemon_metrics(self, metrics: Dict):
+        """Escribe las métricas del demonio en formato texto de Prometheus"""
+        metrics_file = SYNC_OPTIONS.get('stock_daemon_metrics_file', 'stock_daemon.prom')
+        
+        try:
+            tmp_file = f"{metrics_file}.tmp"
+            with open(tmp_file, 'w') as f:
+                for name, value in metrics.items():
+                    f.write(f"odoo_sync_stock_{name} {value}\n")
+            os.replace(tmp_file, metrics_file)
+        except Exception as e:
+            logger.warning(f"No se pudieron escribir métricas: {e}")
+    
+    def run_daemon(self):
+        """
+        Modo demonio: sincronización de stock casi en tiempo real
+        
+        Mantiene las conexiones, el mapeo de productos y los lotes en memoria
+        y cada 'stock_daemon_interval' segundos aplica solo los productos con
+        movimientos/quants nuevos en Odoo 16. El retraso (cambio en origen →
+        aplicado en destino) se publica como métrica.
+        
+        Sin marca de agua guardada, el primer ciclo concilia todos los
+        productos mapeados. La consulta usa write_date >= marca, así que los
+        productos ya aplicados justo en la marca se descartan hasta que
+        tengan un cambio posterior.
+        """
+        interval = SYNC_OPTIONS.get('stock_daemon_interval', 30)
+        mapping_refresh = SYNC_OPTIONS.get('stock_daemon_mapping_refresh', 300)
+        
+        logger.info("")
+        logger.info("=" * 60)
+        logger.info(f"MODO DEMONIO DE STOCK (cada {interval}s)")
+        logger.info("=" * 60)
+        
+        watermark = self.get_last_sync_date()
+        # Primera ejecución: conciliación completa, con la marca tomada antes de leer
+        full_pending = watermark is None
+        if full_pending:
+            watermark = self.get_source_watermark()
+            logger.info("📦 Sin marca de agua: el primer ciclo concilia todos los productos")
+        product_map = self.get_product_mapping()
+        mapping_loaded_at = time.time()
+        pending_new = set(self.new_mapping_ids)
+        # Productos ya aplicados con write_date igual a la marca de agua
+        boundary_ids: Set[int] = set()
+        
+        while True:
+            if self.lock:
+                self.lock.check_stop()
+            tick_start = time.time()
+            errors_before = self.stats['errors']
             
             try:
-                product_name = f"[{stock_info['code']}] {stock_info['name']}"
-                source_qty = stock_info['qty']
-                
-                # Mostrar progreso cada 50 productos
-                if i % 50 == 0 or i == 1:
-                    logger.info(f"[{i}/{len(stock_source)}] Procesando: {product_name}")
+                # Refrescar el mapeo para incluir productos recién sincronizados
+                if time.time() - mapping_loaded_at > mapping_refresh:
+                    self.last_mapping_id = self.max_mapping_id
+                    product_map = self.get_product_mapping()
+                    pending_new |= self.new_mapping_ids
+                    mapping_loaded_at = time.time()
                 
-                # Obtener cantidad actual en destino
-                current_qty = self.get_current_stock_target(target_id)
+                if watermark:
+                    changed, new_watermark = self.get_changed_product_ids(watermark)
+                else:
+                    # Odoo 16 sin movimientos ni quants todavía
+                    changed, new_watermark = {}, self.get_source_watermark()
+                changed = {
+                    sid: write_date for sid, write_date in changed.items()
+                    if not (write_date == watermark and sid in boundary_ids)
+                }
                 
-                # Crear ajuste si es necesario
-                if self.create_inventory_adjustment(target_id, product_name, current_qty, source_qty):
-                    self.stats['adjusted'] += 1
-                    self.stats['total_qty_adjusted'] += abs(source_qty - current_qty)
+                if full_pending:
+                    source_ids = list(product_map)
                 else:
-                    self.stats['skipped'] += 1
+                    source_ids = [
+                        sid for sid in set(changed) | pending_new
+                        if sid in product_map
+                    ]
+                adjusted_before = self.stats['adjusted']
+                
+                if source_ids:
+                    stock_source = self.get_stock_from_source(source_ids)
+                    items = list(stock_source.items())
                     
+                    for i in range(0, len(items), self.batch_size):
+                        if self.lock:
+                            self.lock.check_stop()
+                        batch = items[i:i + self.batch_size]
+                        try:
+                            self.sync_stock_batch(batch, product_map)
+                        except Exception as e:
+                            # Un lote con error no frena el resto del ciclo
+                            logger.error(f"❌ Error con lote de productos {i + 1}-{i + len(batch)}: {e}")
+                            self.stats['errors'] += len(batch)
+                
+                applied_at = time.time()
+                tick_errors = self.stats['errors'] - errors_before
+                
+                # Retraso: cambios nuevos de este ciclo (los de la marca anterior ya se aplicaron)
+                new_changes = [
+                    write_date for sid, write_date in changed.items()
+                    if write_date > watermark and sid in product_map
+                ]
+                lag = 0.0
+                if new_changes:
+                    oldest = datetime.strptime(min(new_changes), '%Y-%m-%d %H:%M:%S')
+                    lag = applied_at - oldest.replace(tzinfo=timezone.utc).timestamp()
+                
+                if tick_errors == 0:
+                    if new_watermark != watermark:
+                        boundary_ids = set()
+                    boundary_ids |= {
+                        sid for sid, write_date in changed.items() if write_date == new_watermark
+                    }
+                    watermark = new_watermark
+                    full_pending = False
+                    pending_new.clear()
+                    if watermark:
+                        self.save_sync_date(watermark)
+                
+                if source_ids:
+                    logger.info(
+                        f"⟳ {len(source_ids)} productos revisados, "
+                        f"{self.stats['adjusted'] - adjusted_before} ajustados, "
+                        f"retraso {lag:.1f}s"
+                    )
+                
+                self.write_daemon_metrics({
+                    'lag_seconds': round(lag, 3),
+                    'last_tick_timestamp': round(applied_at, 3),
+                    'tick_duration_seconds': round(applied_at - tick_start, 3),
+                    'products_checked': len(source_ids),
+                    'adjusted_total': self.stats['adjusted'],
+                    'errors_total': self.stats['errors'],
+                })
+                
             except Exception as e:
-                logger.error(f"❌ Error con producto {stock_info['name']}: {e}")
-                self.stats['errors'] += 1
+                logger.error(f"❌ Error en ciclo del demonio: {e}")
+                try:
+                    self.source.connect()
+                    self.target.connect()
+                except Exception as e:
+                    logger.error(f"❌ No se pudo reconectar: {e}")
+            
+            time.sleep(max(0.0, interval - (time.time() - tick_start)))
+    
+    # ========================================
+    # REPORTE DE DIFERENCIAS (--report)
+    # ========================================
+    
+    def read_product_columns(self, connection: OdooConnection, product_ids,
+                             fields: List[str], storable_types: Tuple[str, ...]) -> Dict:
+        """
+        Lee campos numéricos de product.product en bloques y los devuelve
+        como columnas NumPy alineadas con product_ids
+        
+        Args:
+            storable_types: valores de 'type' almacenables en esa instancia
+                            (Odoo 16: solo 'product'; 'consu' es consumible)
+        
+        Returns:
+            dict: {campo: np.ndarray}, más '_found' (bool) y '_storable' (bool)
+        """
+        batch_size = SYNC_OPTIONS.get('stock_report_batch_size', 2000)
+        ids = [int(pid) for pid in product_ids]
+        
+        rows = []
+        for i in range(0, len(ids), batch_size):
+            rows.extend(connection.search_read(
+                'product.product',
+                [('id', 'in', ids[i:i + batch_size])],
+                fields + ['type']
+            ))
+        
+        columns = {field: np.zeros(len(ids)) for field in fields}
+        columns['_found'] = np.zeros(len(ids), dtype=bool)
+        columns['_storable'] = np.zeros(len(ids), dtype=bool)
+        
+        if not rows:
+            return columns
+        
+        # Alinear filas leídas con product_ids sin diccionarios intermedios
+        ids_array = np.asarray(ids, dtype=np.int64)
+        order = np.argsort(ids_array)
+        row_ids = np.fromiter((r['id'] for r in rows), dtype=np.int64, count=len(rows))
+        index = order[np.searchsorted(ids_array[order], row_ids)]
+        
+        for field in fields:
+            columns[field][index] = np.fromiter(
+                (r.get(field) or 0.0 for r in rows), dtype=float, count=len(rows)
+            )
+        columns['_found'][index] = True
+        columns['_storable'][index] = np.fromiter(
+            (r.get('type') in storable_types for r in rows), dtype=bool, count=len(rows)
+        )
+        
+        return columns
+    
+    def read_location_matrix(self, connection: OdooConnection, product_ids,
+                             location_names: List[str]):
+        """
+        Lee cantidades de stock.quant agrupadas por (producto, ubicación)
+        
+        Las ubicaciones se identifican por complete_name (ej: 'WH/Stock')
+        en ambas instancias.
+        
+        Returns:
+            np.ndarray: matriz (productos × ubicaciones) alineada con product_ids
+        """
+        batch_size = SYNC_OPTIONS.get('stock_report_batch_size', 2000)
+        ids = [int(pid) for pid in product_ids]
+        matrix = np.zeros((len(ids), len(location_names)))
+        
+        locations = connection.search_read(
+            'stock.location',
+            [('complete_name', 'in', location_names)],
+            ['complete_name']
+        )
+        location_column = {
+            loc['id']: location_names.index(loc['complete_name']) for loc in locations
+        }
+        
+        if not location_column:
+            logger.warning(f"⚠ Ubicaciones no encontradas en {connection.name}: {location_names}")
+            return matrix
+        
+        ids_array = np.asarray(ids, dtype=np.int64)
+        order = np.argsort(ids_array)
+        sorted_ids = ids_array[order]
+        
+        for i in range(0, len(ids), batch_size):
+            groups = connection.read_group(
+                'stock.quant',
+                [
+                    ('product_id', 'in', ids[i:i + batch_size]),
+                    ('location_id', 'in', list(location_column.keys()))
+                ],
+                ['quantity:sum'],
+                ['product_id', 'location_id']
+            )
+            
+            if not groups:
+                continue
+            
+            group_products = np.fromiter(
+                (g['product_id'][0] for g in groups), dtype=np.int64, count=len(groups)
+            )
+            group_columns = np.fromiter(
+                (location_column[g['location_id'][0]] for g in groups), dtype=np.int64, count=len(groups)
+            )
+            group_qty = np.fromiter(
+                (g.get('quantity') or 0.0 for g in groups), dtype=float, count=len(groups)
+            )
+            rows_index = order[np.searchsorted(sorted_ids, group_products)]
+            np.add.at(matrix, (rows_index, group_columns), group_qty)
+        
+        return matrix
+    
+    def run_report(self):
+        """
+        Reporte de diferencias de stock Odoo 16 vs Odoo 18 (sin aplicar nada)
+        
+        Carga las cantidades de ambos lados en arreglos NumPy alineados por
+        producto mapeado (y por ubicación si 'stock_report_locations' está
+        configurado), calcula diferencia, desvío absoluto/relativo e impacto
+        de valuación (diferencia × standard_price de Odoo 18) en forma
+        vectorizada y escribe un CSV con las mayores diferencias.
+        """
+        if np is None:
+            raise Exception("El reporte de diferencias requiere NumPy (pip install numpy)")
+        
+        start_time = datetime.now()
+        
+        logger.info("")
+        logger.info("=" * 60)
+        logger.info("REPORTE DE DIFERENCIAS DE STOCK (sin cambios)")
+        logger.info("=" * 60)
+        
+        product_map = self.get_product_mapping()
+        if not product_map:
+            logger.error("❌ No hay productos para comparar")
+            return
+        
+        source_ids = np.fromiter(product_map.keys(), dtype=np.int64, count=len(product_map))
+        target_ids = np.fromiter(product_map.values(), dtype=np.int64, count=len(product_map))
+        
+        logger.info(f"⏳ Leyendo {len(source_ids)} productos de Odoo 16...")
+        source_cols = self.read_product_columns(self.source, source_ids, ['qty_available'], ('product',))
+        logger.info(f"⏳ Leyendo {len(target_ids)} productos de Odoo 18...")
+        # En Odoo 18 los almacenables son 'consu' (con is_storable): todos se comparan
+        target_cols = self.read_product_columns(
+            self.target, target_ids, ['qty_available', 'standard_price'], ('product', 'consu')
+        )
+        
+        # Solo productos almacenables en origen que existen en ambos lados
+        mask = source_cols['_found'] & source_cols['_storable'] & target_cols['_found']
+        source_ids, target_ids = source_ids[mask], target_ids[mask]
+        price = target_cols['standard_price'][mask]
+        
+        location_names = SYNC_OPTIONS.get('stock_report_locations', [])
+        if location_names:
+            source_qty = self.read_location_matrix(self.source, source_ids, location_names)
+            target_qty = self.read_location_matrix(self.target, target_ids, location_names)
+        else:
+            location_names = ['']
+            source_qty = source_cols['qty_available'][mask][:, None]
+            target_qty = target_cols['qty_available'][mask][:, None]
+        
+        # Cálculos vectorizados (productos × ubicaciones)
+        difference = target_qty - source_qty
+        abs_difference = np.abs(difference)
+        abs_source = np.abs(source_qty)
+        relative = np.divide(
+            abs_difference, abs_source,
+            out=np.where(abs_difference > 0, np.inf, 0.0),
+            where=abs_source > 0
+        )
+        valuation = difference * price[:, None]
+        
+        drift = abs_difference >= 0.01
+        
+        logger.info("")
+        logger.info(f"Productos comparados:      {len(source_ids)}")
+        logger.info(f"Con diferencias:           {int(drift.any(axis=1).sum())}")
+        logger.info(f"Unidades de diferencia:    {abs_difference[drift].sum():.2f}")
+        logger.info(f"Impacto neto de valuación: {valuation[drift].sum():.2f}")
+        logger.info(f"Impacto absoluto:          {np.abs(valuation[drift]).sum():.2f}")
+        
+        # Mayores diferencias por impacto de valuación absoluto
+        top_n = SYNC_OPTIONS.get('stock_report_top', 500)
+        candidates = np.flatnonzero(drift)
+        ranking = np.lexsort((
+            -abs_difference.ravel()[candidates],
+            -np.abs(valuation.ravel()[candidates])
+        ))
+        top = candidates[ranking[:top_n]]
+        rows, cols = np.unravel_index(top, difference.shape)
+        
+        names = {}
+        if len(top):
+            for product in self.source.search_read(
+                'product.product',
+                [('id', 'in', [int(x) for x in np.unique(source_ids[rows])])],
+                ['name', 'default_code']
+            ):
+                names[product['id']] = (product.get('default_code') or '', product['name'])
+        
+        report_file = SYNC_OPTIONS.get('stock_report_file', 'stock_drift_report.csv')
+        with open(report_file, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow([
+                'source_id', 'target_id', 'default_code', 'name', 'location',
+                'qty_odoo16', 'qty_odoo18', 'difference', 'relative_drift',
+                'standard_price', 'valuation_impact'
+            ])
+            for row, col in zip(rows, cols):
+                code, name = names.get(int(source_ids[row]), ('', ''))
+                writer.writerow([
+                    int(source_ids[row]), int(target_ids[row]), code, name, location_names[col],
+                    f"{source_qty[row, col]:.4f}", f"{target_qty[row, col]:.4f}",
+                    f"{difference[row, col]:.4f}", f"{relative[row, col]:.4f}",
+                    f"{price[row]:.4f}", f"{valuation[row, col]:.2f}"
+                ])
+        
+        logger.info(f"✓ Reporte escrito en {report_file} ({len(top)} filas)")
+        logger.info(f"⏱ Tiempo: {datetime.now() - start_time}")
     
     def run(self):
         """Ejecuta la sincronización completa"""
@@ -450,6 +1193,7 @@ class StockSync:
             logger.info(f"Total productos:     {self.stats['total']}")
             logger.info(f"✓ Ajustados:         {self.stats['adjusted']}")
             logger.info(f"⊙ Sin cambios:       {self.stats['skipped']}")
+            logger.info(f"🏷 Lotes creados:     {self.stats['lots_created']}")
             logger.info(f"❌ Errores:           {self.stats['errors']}")
             logger.info(f"📦 Unidades ajustadas: {self.stats['total_qty_adjusted']:.2f}")
             logger.info(f"⏱ Tiempo:             {elapsed}")
@@ -457,6 +1201,9 @@ class StockSync:
             
             if self.stats['errors'] == 0:
                 logger.info("✓ ¡Sincronización completada exitosamente!")
+                # Avanzar la marca de agua solo si no hubo errores
+                if SYNC_OPTIONS.get('incremental_stock_sync', False) and self.new_sync:
+                    self.save_sync_date(self.new_sync)
             else:
                 logger.warning(f"⚠ Completado con {self.stats['errors']} errores")
             
@@ -467,8 +1214,25 @@ class StockSync:
 
 if __name__ == "__main__":
     try:
-        sync = StockSync()
-        sync.run()
+        if '--report' in sys.argv:
+            # El reporte solo lee: no toma el bloqueo de la etapa
+            StockSync().run_report()
+            sys.exit(0)
+        
+        lock = StageLock('stock', policy=policy_from_argv(sys.argv))
+        if not lock.acquire():
+            sys.exit(0)
+        try:
+            sync = StockSync(lock=lock)
+            if '--daemon' in sys.argv:
+                sync.run_daemon()
+            else:
+                sync.run()
+        finally:
+            lock.release()
+    except StopRequested as e:
+        logger.warning(f"🛑 {e}")
+        sys.exit(EXIT_STOPPED)
     except KeyboardInterrupt:
         logger.info("\n⚠ Sincronización interrumpida por el usuario")
         sys.exit(0)